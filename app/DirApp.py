@@ -39,14 +39,12 @@ class ExtremaList:
         '''Constructor.
         @param size: maximal length of the internal list
         @param criterion: t(ime), s(ize)
-        @param descending: True:
+        @param descending: True: the files with the smallest values are collected
         '''
-        self._list = []
+        self._list = base.FileHelper.TopList(size, descending)
         self._size = size
         self._criterion = criterion
         self._descending = descending
-        self._limit = None
-        self._factor = -1 if self._descending else 1
         self._minLength = 0
 
     def merge(self, name, statInfo):
@@ -54,22 +52,9 @@ class ExtremaList:
         @param name: the filename
         @param statInfo: the meta data of the file
         '''
-        sortIt = False
-        if len(self._list) < self._size:
-            value = self._factor * \
-                (statInfo.st_mtime if self._criterion == 't' else statInfo.st_size)
-            self._list.append(MetaData(name, statInfo, value))
-            sortIt = True
-        else:
-            value = self._factor * \
-                (statInfo.st_mtime if self._criterion == 't' else statInfo.st_size)
-            if value > self._limit:
-                sortIt = True
-                # replace the "smallest" element:
-                self._list[0] = MetaData(name, statInfo, value)
-        if sortIt:
-            self._list.sort(key=lambda info: info._value)
-            self._limit = self._list[0]._value
+        value = statInfo.st_mtime if self._criterion == 't' else statInfo.st_size
+        if self._list.accepts(value):
+            self._list.add(value, MetaData(name, statInfo, value))
 
     def show(self, title, lines):
         '''Shows the list of files
@@ -77,8 +62,7 @@ class ExtremaList:
         @param lines: IN/OUT: the info is stored there
         '''
         lines.append('== ' + title)
-        self._list.reverse()
-        for item in self._list:
+        for value, item in self._list.items():
             info = base.FileHelper.listFile(
                 item._stat, item._name, self._criterion == 't', True)
             lines.append(info)
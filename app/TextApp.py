@@ -7,11 +7,18 @@ Created: 2020.06.24
 import sys
 import os
 import re
+import collections
+import concurrent.futures
+import mmap
+import multiprocessing
 import snakeboxx
 
+import base.Const
 import base.CsvProcessor
 import base.TextProcessor
+import base.SearchRuleList
 import base.DirTraverser
+import base.FileHelper
 import app.BaseApp
 
 
@@ -44,6 +51,98 @@ class OptionsGrep:
         self.aboveContext = None
         self.belowChars = None
         self.aboveChars = None
+        # files with at least this size are searched with a memory mapped bytes search (if possible)
+        self.mappedMinSize = 1024 * 1024
+        # None or a string which is part of each hit: a cheap prefilter
+        self.requiredLiteral = None
+        # None or the result of TextApp.grepCompileFormat() of formatFile and formatLine:
+        self.formatFileCompiled = None
+        self.formatLineCompiled = None
+
+
+# the segment types of a compiled format, see TextApp.grepCompileFormat():
+FORMAT_TEXT = 0
+FORMAT_FILENAME = 1
+FORMAT_LINE = 2
+FORMAT_LINE_NO = 3
+FORMAT_GROUP = 4
+
+
+class MappedLines:
+    '''Line oriented access to a memory mapped file.
+    Only the requested lines are decoded, the line positions are computed on demand.
+    The lines are the same as the result of content.split('\\n').
+    '''
+
+    def __init__(self, mapped):
+        '''Constructor.
+        @param mapped: the memory mapped file (a mmap.mmap instance)
+        '''
+        self._mapped = mapped
+        self._size = len(mapped)
+        # the cursor: the index and the start position of the current line
+        self._index = 0
+        self._start = 0
+        self._count = None
+
+    def __getitem__(self, index):
+        '''Returns a line given by its index.
+        Note: the cheapest access is near the last accessed line.
+        @param index: the index of the line
+        @return: the line (without newline)
+        '''
+        while self._index < index:
+            position = self._mapped.find(b'\n', self._start)
+            if position < 0:
+                raise IndexError('line index out of range')
+            self._start = position + 1
+            self._index += 1
+        while self._index > index:
+            self._start = self._mapped.rfind(b'\n', 0, self._start - 1) + 1
+            self._index -= 1
+        return base.FileHelper.fromBytes(self._mapped[self._start:self._lineEnd(self._start)])
+
+    def __len__(self):
+        '''Returns the number of lines.
+        @return: the number of lines
+        '''
+        if self._count is None:
+            self._count = self._index + self._countNewlines(self._start, self._size) + 1
+        return self._count
+
+    def _countNewlines(self, start, end):
+        '''Counts the newlines in a given range of the file.
+        @param start: the first position to inspect
+        @param end: the position behind the range
+        @return: the number of newlines
+        '''
+        rc = 0
+        while start < end:
+            end2 = min(end, start + 0x1000000)
+            rc += self._mapped[start:end2].count(b'\n')
+            start = end2
+        return rc
+
+    def _lineEnd(self, start):
+        '''Returns the end of the line starting at a given position.
+        @param start: the start of the line
+        @return: the position of the newline ending the line or the file size
+        '''
+        rc = self._mapped.find(b'\n', start)
+        return self._size if rc < 0 else rc
+
+    def lineOf(self, position):
+        '''Returns the line containing a given position.
+        @param position: the position in the file
+        @return: a tuple (index, start, end) of the line: end is the position of the newline
+        '''
+        if position < self._start:
+            self._index = self._start = 0
+        self._index += self._countNewlines(self._start, position)
+        start = self._mapped.rfind(b'\n', self._start, position)
+        if start >= 0:
+            self._start = start + 1
+        return self._index, self._start, self._lineEnd(self._start)
 
 
 class OptionsInsertOrReplace:
@@ -72,6 +171,8 @@ class OptionsReplace:
         self.wordOnly = None
         self.rawString = False
         self.escActive = False
+        self.streaming = False
+        self.wholeBuffer = False
 
 
 class TextApp(app.BaseApp.BaseApp):
@@ -86,6 +187,8 @@ class TextApp(app.BaseApp.BaseApp):
         self._processor = None
         self._traverser = None
         self._hostname = None
+        self._outputBuffer = []
+        self._outputBufferSize = 0
 
     def buildConfig(self):
         '''Creates an useful configuration example.
@@ -195,6 +298,16 @@ example: opt: -b% reg-expr: "version: ([\d+.]+)" replacement: "V%1" string: "ver
             add(mode, base.UsageInfo.Option('raw-string', 'R',
                                             '<pattern> is a string, not a regular expression', 'bool'))
 
+        def addWholeBuffer(mode):
+            add(mode, base.UsageInfo.Option('whole-buffer', None,
+                                            '''the regular expression is applied to the whole text, not line by line.
+Faster for large files. The pattern may span lines, '^' and '$' match at each line''', 'bool'))
+
+        def addTextOnly(mode):
+            add(mode, base.UsageInfo.Option('text-only', None,
+                                            'only text files are processed: binary files and archives are ignored',
+                                            'bool'))
+
         def addReplace(mode, changeFile):
             addIgnoreAndWord(mode)
             addEsc(mode)
@@ -214,6 +327,19 @@ example: opt: -b% reg-expr: "version: ([\d+.]+)" replacement: "V%1" string: "ver
                                             'the process is stopped after <max-loop>*<source_lines> statements', 'int', 1))
         elif mode == 'csv-execute':
             base.DirTraverser.addOptions(mode, self._usageInfo)
+            add(mode, base.UsageInfo.Option('streaming', None,
+                                            '''the rows are processed one by one (the file is never held in memory as a whole).
+Possible only if no command needs the whole table: add-column, info:summary, set-filter, set-order, sort, write''', 'bool'))
+            add(mode, base.UsageInfo.Option('sort-memory', None,
+                                            '''the memory budget of the command sort in streaming mode, e.g. 2G.
+If there are more rows they are sorted in parts stored in temporary files''', 'size', '100M'))
+            add(mode, base.UsageInfo.Option('dialect', None,
+                                            '''the CSV dialect: excel, excel-tab, unix or the delimiter: comma, semicolon, tab.
+If not given the dialect is detected''', 'string'))
+            add(mode, base.UsageInfo.Option('has-header', None,
+                                            'the first line contains the column names (no detection)', 'bool'))
+            add(mode, base.UsageInfo.Option('no-header', None,
+                                            'the first line contains data (no detection)', 'bool'))
         elif mode == 'grep':
             base.DirTraverser.addOptions(mode, self._usageInfo)
             addIgnoreAndWord(mode)
@@ -242,6 +368,7 @@ Placeholders: %f: full filename %p: path %n: node %%: '%' %L: newline %T: tabula
                                             'only the matching part of the line will be displayed (not the whole line)', 'bool'))
             add(mode, base.UsageInfo.Option('invert-match', 'v',
                                             'all lines not containing the search expression is displayed', 'bool'))
+            addTextOnly(mode)
         elif mode == 'insert-or-replace':
             base.DirTraverser.addOptions(mode, self._usageInfo)
             addIgnore(mode)
@@ -253,11 +380,17 @@ Placeholders: %f: full filename %p: path %n: node %%: '%' %L: newline %T: tabula
         elif mode == 'replace':
             base.DirTraverser.addOptions(mode, self._usageInfo)
             addReplace(mode, True)
+            addWholeBuffer(mode)
+            add(mode, base.UsageInfo.Option('streaming', None,
+                                            '''the files are processed line by line (never held in memory as a whole).
+The file is changed only if there are hits''', 'bool'))
+            addTextOnly(mode)
         elif mode == 'replace-many':
             base.DirTraverser.addOptions(mode, self._usageInfo)
             addReplace(mode, True)
         elif mode == 'replace-string':
             addReplace(mode, False)
+            addWholeBuffer(mode)
 
     def csvExecute(self):
         '''Executes a sequence of commands on CSV files.
@@ -270,14 +403,33 @@ Placeholders: %f: full filename %p: path %n: node %%: '%' %L: newline %T: tabula
         elif pattern is None:
             self.abort('too few arguments')
         elif self.handleOptions():
-            self._processor = base.CsvProcessor.CsvProcessor(self._logger)
-            self._traverser = base.DirTraverser.buildFromOptions(
-                pattern, self._usageInfo, 'csv-execute')
-            self._traverser._findFiles = self._traverser._findLinks = True
-            self._traverser._findDirs = False
-            for filename in self._traverser.next(self._traverser._directory, 0):
-                self._processor.readFile(filename)
-                self._processor.execute(commands)
+            dialectName = self._optionProcessor.valueOf('dialect')
+            dialect = None if dialectName is None else base.CsvProcessor.CsvProcessor.dialectByName(dialectName)
+            if dialectName is not None and dialect is None:
+                self.argumentError('unknown dialect: ' + dialectName)
+            else:
+                hasHeader = True if self._optionProcessor.valueOf('has-header') else (
+                    False if self._optionProcessor.valueOf('no-header') else None)
+                sortMemory = self._optionProcessor.valueOf('sort-memory')
+                self._processor = base.CsvProcessor.CsvProcessor(self._logger, sortMemory)
+                self._processor.setLayout(dialect, hasHeader)
+                self._traverser = base.DirTraverser.buildFromOptions(
+                    pattern, self._usageInfo, 'csv-execute')
+                self._traverser._findFiles = self._traverser._findLinks = True
+                self._traverser._findDirs = False
+                streaming = self._optionProcessor.valueOf('streaming')
+                if streaming and not self._processor.canStream(commands):
+                    self._logger.log('streaming is not possible: a command needs the whole table',
+                                     base.Const.LEVEL_SUMMARY)
+                    streaming = False
+                for filename in self._traverser.next(self._traverser._directory, 0):
+                    if streaming:
+                        self._processor = base.CsvProcessor.CsvProcessor(self._logger, sortMemory)
+                        self._processor.setLayout(dialect, hasHeader)
+                        self._processor.executeStreaming(filename, commands)
+                    else:
+                        self._processor.readFile(filename)
+                        self._processor.execute(commands)
 
     def describeRules(self):
         '''Displays the description of the rules.
@@ -304,14 +456,21 @@ Placeholders: %f: full filename %p: path %n: node %%: '%' %L: newline %T: tabula
                 pattern, self._usageInfo, 'exec-rules')
             self._traverser._findFiles = self._traverser._findLinks = True
             self._traverser._findDirs = False
-            for filename in self._traverser.next(self._traverser._directory, 0):
-                base.StringUtils.avoidWarning(filename)
-                self.execRulesOneFile(rules, options)
+            # the rules are parsed only once for all files:
+            ruleList, success = base.SearchRuleList.compiledRuleList(rules, self._logger)
+            if not success:
+                return
+            try:
+                for filename in self._traverser.next(self._traverser._directory, 0):
+                    base.StringUtils.avoidWarning(filename)
+                    self.execRulesOneFile(ruleList, options)
+            finally:
+                self._processor.stopTrace()
 
     def execRulesOneFile(self, rules, options):
         '''Executes rules for one file.
         @param filename: file to process
-        @param rules: the rules to execute
+        @param rules: the rules to execute: a string or a compiled SearchRuleList instance
         @param options: the program options (instance of OptionsExecuteRules)
         '''
         self._processor.readFile(self._traverser._fileFullName)
@@ -333,120 +492,275 @@ Placeholders: %f: full filename %p: path %n: node %%: '%' %L: newline %T: tabula
                 what = r'\b' + what + r'\b'
             regExpr = re.compile(
                 what, base.Const.IGNORE_CASE if options.ignoreCase else 0)
+            options.requiredLiteral = base.StringUtils.requiredLiteral(regExpr.pattern, regExpr.flags)
             self._traverser = base.DirTraverser.buildFromOptions(
                 pattern, self._usageInfo, 'grep')
             self._traverser._findFiles = self._traverser._findLinks = True
             self._traverser._findDirs = False
-            for filename in self._traverser.next(self._traverser._directory, 0):
-                if not self.grepOneFile(filename, regExpr, options):
-                    break
+            jobs = self._optionProcessor.valueOf('jobs')
+            filenames = self.textFiles(self._traverser.next(self._traverser._directory, 0))
+            try:
+                if jobs is not None and jobs > 1:
+                    self.grepParallel(filenames, regExpr, options, jobs)
+                else:
+                    for filename in filenames:
+                        if not self.grepOneFile(filename, regExpr, options):
+                            break
+            finally:
+                self.grepFlush()
 
     @staticmethod
-    def grepFormat(theFormat, filename, text, lineNo, matcher):
-        '''Returns a format with expanded placeholders.
-        @param format: the format string with placeholders, e.g. '%f-%#: %t'
-        @param filename: [full, path, node], e.g. ['/etc/password', '/etc/', 'password']
-        @param text: None or the line text with the hit
-        @param lineNo: None or the line number
-        @param matcher: None or the match object of the hit
-        @return: the format with expanded placeholders, e.g. '/etc/password-12:sync:x:4:65534:sync:/bin:/bin/sync'
+    def grepCompileFormat(theFormat):
+        '''Translates a format string into a list of segments for fast expanding with grepFormat().
+        @param theFormat: the format string with placeholders, e.g. '%f-%#: %t'
+        @return: a list of tuples (kind, value): kind is FORMAT_TEXT (value: the text), FORMAT_FILENAME
+            (value: the index in the filename list), FORMAT_LINE (the line text), FORMAT_LINE_NO or FORMAT_GROUP
+            (value: the group number)
         '''
+        rc = []
         last = 0
-        rc = ''
         lengthFormat = len(theFormat)
+        text = ''
         while True:
             position = theFormat.find('%', last)
-            if position > 0:
-                rc += theFormat[last:position]
             if position < 0:
-                rc += theFormat[last:]
+                text += theFormat[last:]
                 break
+            text += theFormat[last:position]
             if position == lengthFormat - 1:
-                rc += '%'
+                text += '%'
                 break
             variable = theFormat[position + 1]
-            if variable == 'f':
-                rc += filename[0]
-            elif variable == 'p':
-                rc += filename[1]
-            elif variable == 'n':
-                rc += filename[2]
-            elif variable == 'T':
-                rc += '\t'
-            elif variable == 'L':
-                rc += '\n'
-            elif variable == '%':
-                rc += '%'
+            last = position + 2
+            if variable in 'TL%':
+                text += '\t' if variable == 'T' else ('\n' if variable == 'L' else '%')
+                continue
+            segment = None
+            if variable in 'fpn':
+                segment = (FORMAT_FILENAME, 'fpn'.index(variable))
             elif variable == 't':
-                if text is not None:
-                    rc += text
+                segment = (FORMAT_LINE, None)
             elif variable == '#':
-                rc += str(lineNo)
+                segment = (FORMAT_LINE_NO, None)
             elif '0' <= variable <= '9':
-                group = ord(variable) - ord('0')
-                if matcher is not None:
-                    if matcher.lastindex is None:
-                        rc += matcher.group(0)
-                    elif matcher.lastindex <= group:
-                        rc += matcher.group(group)
-            last = position + 2
+                segment = (FORMAT_GROUP, ord(variable) - ord('0'))
+            if segment is not None:
+                if text != '':
+                    rc.append((FORMAT_TEXT, text))
+                    text = ''
+                rc.append(segment)
+        if text != '':
+            rc.append((FORMAT_TEXT, text))
         return rc
 
-    def grepOneFile(self, filename, regExpr, options):
-        '''Searches the regular expression in one file.
+    @staticmethod
+    def grepFileFormat(segments, filename):
+        '''Returns the segments of a compiled format with the filename placeholders replaced by the filename parts.
+        @param segments: the compiled format, see grepCompileFormat()
+        @param filename: [full, path, node], e.g. ['/etc/password', '/etc/', 'password']
+        @return: the segments without kind FORMAT_FILENAME
+        '''
+        rc = []
+        for kind, value in segments:
+            if kind == FORMAT_FILENAME:
+                kind, value = FORMAT_TEXT, filename[value]
+            if kind == FORMAT_TEXT and rc and rc[-1][0] == FORMAT_TEXT:
+                rc[-1] = (FORMAT_TEXT, rc[-1][1] + value)
+            else:
+                rc.append((kind, value))
+        return rc
+
+    @staticmethod
+    def grepFormat(theFormat, filename, text, lineNo, matcher):
+        '''Returns a format with expanded placeholders.
+        @param format: the format string with placeholders, e.g. '%f-%#: %t'
+            or the result of grepCompileFormat()
+        @param filename: [full, path, node], e.g. ['/etc/password', '/etc/', 'password']
+        @param text: None or the line text with the hit
+        @param lineNo: None or the line number
+        @param matcher: None or the match object of the hit
+        @return: the format with expanded placeholders, e.g. '/etc/password-12:sync:x:4:65534:sync:/bin:/bin/sync'
+        '''
+        segments = TextApp.grepCompileFormat(theFormat) if isinstance(theFormat, str) else theFormat
+        rc = []
+        for kind, value in segments:
+            if kind == FORMAT_TEXT:
+                rc.append(value)
+            elif kind == FORMAT_LINE:
+                if text is not None:
+                    rc.append(text)
+            elif kind == FORMAT_LINE_NO:
+                rc.append(str(lineNo))
+            elif kind == FORMAT_FILENAME:
+                rc.append(filename[value])
+            elif matcher is not None:
+                if matcher.lastindex is None:
+                    rc.append(matcher.group(0))
+                elif matcher.lastindex <= value:
+                    rc.append(matcher.group(value))
+        return ''.join(rc)
+
+    @staticmethod
+    def grepBytesExpression(regExpr):
+        '''Returns a bytes regular expression which finds (at least) all lines found by a given str regular expression.
+        This is only possible if the pattern matches only ASCII characters: no '.', no negated character class,
+        no escape sequences like \\w or \\s, no inline flags and no ignore case.
+        \\b and \\B are removed: in a bytes pattern they know only ASCII word characters. Without them
+        the expression finds more lines, the hits are confirmed by the str regular expression, see grepScan().
+        @param regExpr: the regular expression (type str)
+        @return: None: not possible otherwise: the compiled bytes regular expression (multiline mode)
+        '''
+        pattern = regExpr.pattern
+        if regExpr.flags & base.Const.IGNORE_CASE or not pattern.isascii():
+            return None
+        rc = []
+        inClass = False
+        ix = 0
+        length = len(pattern)
+        while ix < length:
+            cc = pattern[ix]
+            if cc < ' ' or cc == '.' and not inClass:
+                return None
+            if cc == '\\':
+                ix += 1
+                if ix < length and pattern[ix].isalnum():
+                    if pattern[ix] not in 'bB' or inClass:
+                        return None
+                    # the word boundary is dropped:
+                    ix += 1
+                    continue
+                cc += pattern[ix:ix + 1]
+            elif inClass:
+                inClass = cc != ']'
+            elif cc == '[':
+                if pattern.startswith('^', ix + 1):
+                    return None
+                inClass = True
+                # a ']' as first character is part of the class:
+                if pattern.startswith(']', ix + 1):
+                    cc += ']'
+                    ix += 1
+            elif cc == '(' and pattern.startswith('?', ix + 1) and not pattern.startswith('?:', ix + 1):
+                return None
+            rc.append(cc)
+            ix += 1
+        return re.compile(''.join(rc).encode('ascii'), base.Const.RE_MULTILINE)
+
+    @staticmethod
+    def grepLines(filename, regExpr, options):
+        '''Searches the regular expression in one file and returns the output lines.
+        Note: this method is static to be usable in a worker process.
+        Large files are searched in a memory mapped bytes buffer if the regular expression allows that:
+        then only the lines with hits (and the context lines) are decoded.
+        @param filename: the name of the file to inspect
+        @param regExpr: the regular expression to search
+        @param options: the program options a OptionsGrep instance
+        @return: a list of the lines to display (may be empty)
+        '''
+        # a file without the required literal cannot contain a hit:
+        literal = options.requiredLiteral if not options.invertMatch else None
+        bytesRegExpr = None
+        if (not options.invertMatch and options.mappedMinSize is not None and os.path.isfile(filename)
+                and os.path.getsize(filename) >= max(1, options.mappedMinSize)):
+            bytesRegExpr = TextApp.grepBytesExpression(regExpr)
+        if bytesRegExpr is not None:
+            with open(filename, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                # the text mode converts '\r\n' and '\r' into '\n':
+                if mapped.find(b'\r') < 0:
+                    if literal is not None and mapped.find(literal.encode('ascii')) < 0:
+                        return []
+                    lines = MappedLines(mapped)
+                    return TextApp.grepScan(filename, lines, TextApp.grepMappedCandidates(mapped, lines, bytesRegExpr),
+                                            regExpr, options)
+        content = base.StringUtils.fromFile(filename)
+        if literal is not None and content.find(literal) < 0:
+            return []
+        lines = content.split('\n')
+        return TextApp.grepScan(filename, lines, enumerate(lines), regExpr, options)
+
+    @staticmethod
+    def grepMappedCandidates(mapped, lines, bytesRegExpr):
+        '''Implements a generator returning the lines of a memory mapped file found by a bytes regular expression.
+        @param mapped: the memory mapped file
+        @param lines: the MappedLines instance of the file
+        @param bytesRegExpr: the bytes regular expression to search
+        @return: a tuple (index, line)
+        '''
+        position = 0
+        size = len(mapped)
+        while position <= size:
+            matcher = bytesRegExpr.search(mapped, position)
+            if matcher is None:
+                break
+            ix, start, end = lines.lineOf(matcher.start())
+            yield ix, base.FileHelper.fromBytes(mapped[start:end])
+            position = end + 1
+
+    @staticmethod
+    def grepScan(filename, lines, candidates, regExpr, options):
+        '''Searches the regular expression in the lines of one file and returns the output lines.
         @param filename: the name of the file to inspect
+        @param lines: the lines of the file: a list or a MappedLines instance
+        @param candidates: an iterable of tuples (index, line): the lines to inspect.
+            All lines or (if not inverted) a superset of the lines containing a hit
         @param regExpr: the regular expression to search
         @param options: the program options a OptionsGrep instance
+        @return: a list of the lines to display (may be empty)
         '''
-        def output(line):
-            if self._logger._verboseLevel > 0:
-                self._resultLines.append(line)
-            print(line)
+        rc = []
 
         def outputContext(theFormat, fileNames, start, end, lines):
             while start < end:
                 line2 = TextApp.grepFormat(
                     theFormat, fileNames, lines[start], start + 1, None)
-                output(line2)
+                rc.append(line2)
                 start += 1
             return end - 1
-        lines = base.StringUtils.fromFile(filename, '\n')
         nameList = [filename, os.path.dirname(
             filename), os.path.basename(filename)]
+        formatLine = TextApp.grepFileFormat(options.formatLineCompiled or TextApp.grepCompileFormat(
+            options.formatLine), nameList)
+        formatFile = None
+        if options.formatFile is not None:
+            formatFile = TextApp.grepFileFormat(options.formatFileCompiled or TextApp.grepCompileFormat(
+                options.formatFile), nameList)
         first = True
         lastIx = -1
         missingInterval = [None, None]
-        for ix, line in enumerate(lines):
-            matcher = regExpr.search(line)
-            if matcher and first and options.formatFile is not None:
-                output(TextApp.grepFormat(
-                    options.formatFile, nameList, None, None, None))
+        literal = options.requiredLiteral
+        for ix, line in candidates:
+            matcher = regExpr.search(line) if literal is None or literal in line else None
+            if matcher and first and formatFile is not None:
+                rc.append(TextApp.grepFormat(
+                    formatFile, nameList, None, None, None))
                 first = False
             if matcher and not options.invertMatch or matcher is None and options.invertMatch:
                 if missingInterval[0] is not None:
                     ix2 = min(ix, missingInterval[1])
                     lastIx = outputContext(
-                        options.formatLine, nameList, missingInterval[0], ix2, lines)
+                        formatLine, nameList, missingInterval[0], ix2, lines)
                     missingInterval[0] = None
                 if options.aboveContext is not None:
                     start = max(0, lastIx + 1, ix - options.aboveContext)
                     if start < ix:
                         lastIx = outputContext(
-                            options.formatLine, nameList, start, ix, lines)
+                            formatLine, nameList, start, ix, lines)
                 if options.group is None:
-                    output(TextApp.grepFormat(options.formatLine,
-                                              nameList, line, ix + 1, matcher))
+                    rc.append(TextApp.grepFormat(formatLine,
+                                                 nameList, line, ix + 1, matcher))
                 else:
-                    self.grepOneLine(options, nameList, line, ix + 1, regExpr)
+                    TextApp.grepLineHits(options, nameList, line, ix + 1, regExpr, rc, formatLine)
                 lastIx = ix
                 if options.belowContext is not None:
                     missingInterval = [ix + 1, ix + 1 + options.belowContext]
         if missingInterval[0] is not None:
             lastIx = min(len(lines), missingInterval[1])
-            outputContext(options.formatLine, nameList,
+            outputContext(formatLine, nameList,
                           missingInterval[0], lastIx, lines)
+        return rc
 
-    def grepOneLine(self, options, nameList, line, lineNo, regExpr):
+    @staticmethod
+    def grepLineHits(options, nameList, line, lineNo, regExpr, outputLines, theFormat=None):
         '''Handles the multiple hits in one line.
         @precondition: only the matching pattern should be displayed (not the whole line).
         @param options: the program options
@@ -454,7 +768,11 @@ Placeholders: %f: full filename %p: path %n: node %%: '%' %L: newline %T: tabula
         @param line: the line to inspect
         @param lineNo: the line number of line
         @param regExpr: the regular expression to search
+        @param outputLines: OUT: the lines to display are appended to that list
+        @param theFormat: None: options.formatLine is used otherwise: the (compiled) format of the lines
         '''
+        if theFormat is None:
+            theFormat = options.formatLineCompiled or options.formatLine
         lineLength = len(line)
         for matcher in regExpr.finditer(line):
             start, end = matcher.span(options.group)
@@ -463,11 +781,76 @@ Placeholders: %f: full filename %p: path %n: node %%: '%' %L: newline %T: tabula
             if options.belowChars is not None:
                 end = min(lineLength, end + options.belowChars)
             info = line[start:end]
-            info2 = TextApp.grepFormat(
-                options.formatLine, nameList, info, lineNo, matcher)
-            if self._logger._verboseLevel > 0:
-                self._resultLines.append(info2)
-            print(info2)
+            outputLines.append(TextApp.grepFormat(
+                theFormat, nameList, info, lineNo, matcher))
+
+    def grepOneFile(self, filename, regExpr, options):
+        '''Searches the regular expression in one file.
+        @param filename: the name of the file to inspect
+        @param regExpr: the regular expression to search
+        @param options: the program options a OptionsGrep instance
+        @return: True: the search should be continued
+        '''
+        self.grepOutput(TextApp.grepLines(filename, regExpr, options))
+        return True
+
+    def grepOneLine(self, options, nameList, line, lineNo, regExpr):
+        '''Handles the multiple hits in one line.
+        @precondition: only the matching pattern should be displayed (not the whole line).
+        @param options: the program options
+        @param namelist: variants of the filename: [<full>, <path>, <node>]
+        @param line: the line to inspect
+        @param lineNo: the line number of line
+        @param regExpr: the regular expression to search
+        '''
+        lines = []
+        TextApp.grepLineHits(options, nameList, line, lineNo, regExpr, lines)
+        self.grepOutput(lines)
+
+    def grepFlush(self):
+        '''Writes the buffered output lines to stdout.
+        '''
+        if self._outputBuffer:
+            self._outputBuffer.append('')
+            sys.stdout.write('\n'.join(self._outputBuffer))
+            sys.stdout.flush()
+            self._outputBuffer = []
+            self._outputBufferSize = 0
+
+    def grepOutput(self, lines):
+        '''Displays the result lines of a file.
+        Note: the output is buffered, see grepFlush().
+        @param lines: the lines to display
+        '''
+        if self._logger._verboseLevel > 0:
+            self._resultLines += lines
+        self._outputBuffer += lines
+        for line in lines:
+            self._outputBufferSize += len(line) + 1
+        if self._outputBufferSize >= 0x10000:
+            self.grepFlush()
+
+    def grepParallel(self, filenames, regExpr, options, jobs):
+        '''Searches the regular expression in the files with a pool of worker processes.
+        The output is grouped per file and displayed in the traversal order.
+        @param filenames: an iterable of the files to inspect
+        @param regExpr: the regular expression to search
+        @param options: the program options a OptionsGrep instance
+        @param jobs: the number of worker processes
+        '''
+        # the number of files processed in advance: limits the memory usage
+        maxPending = 4 * jobs
+        pending = collections.deque()
+        # no fork(): the traverser (and the file classification) may already run threads holding locks
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs,
+                                                    mp_context=multiprocessing.get_context(method)) as pool:
+            for filename in filenames:
+                pending.append(pool.submit(TextApp.grepLines, filename, regExpr, options))
+                while len(pending) >= maxPending or pending and pending[0].done():
+                    self.grepOutput(pending.popleft().result())
+            while pending:
+                self.grepOutput(pending.popleft().result())
 
     def grepOptions(self):
         '''Evaluates the grep options.
@@ -501,6 +884,9 @@ Placeholders: %f: full filename %p: path %n: node %%: '%' %L: newline %T: tabula
         if options.formatLine is None:
             info = '%t' if options.group is None else f'%{options.group}'
             options.formatLine = f'%f-%#:{info}' if options.lineNumber else f'%f:{info}'
+        options.formatLineCompiled = TextApp.grepCompileFormat(options.formatLine)
+        if options.formatFile is not None:
+            options.formatFileCompiled = TextApp.grepCompileFormat(options.formatFile)
         return options
 
     def insertOrReplace(self):
@@ -550,11 +936,23 @@ Placeholders: %f: full filename %p: path %n: node %%: '%' %L: newline %T: tabula
                     pattern, self._usageInfo, 'replace')
                 self._traverser._findFiles = self._traverser._findLinks = True
                 self._traverser._findDirs = False
-                for filename in self._traverser.next(self._traverser._directory, 0):
-                    self._processor.readFile(filename)
+                options.streaming = self._optionProcessor.valueOf('streaming')
+                if options.streaming and options.wholeBuffer:
+                    self.argumentError('--streaming and --whole-buffer cannot be combined')
+                    return
+                literal = what if options.rawString else base.StringUtils.requiredLiteral(
+                    what, base.Const.IGNORE_CASE if options.ignoreCase else 0)
+                for filename in self.textFiles(self._traverser.next(self._traverser._directory, 0)):
+                    if options.streaming:
+                        self._processor.replaceFile(filename, what, replacement, options.prefixBackref,
+                                                    options.rawString, True, options.wordOnly, options.ignoreCase,
+                                                    options.escActive, options.backupExtensions)
+                        continue
+                    if not self._processor.readFile(filename, True, literal):
+                        continue
                     hits = self._processor.replace(what, replacement, options.prefixBackref,
                                                    options.rawString, True, options.wordOnly, options.ignoreCase,
-                                                   options.escActive)
+                                                   options.escActive, options.wholeBuffer)
                     if hits > 0:
                         self._processor.writeFile(
                             filename, options.backupExtensions)
@@ -605,6 +1003,8 @@ Placeholders: %f: full filename %p: path %n: node %%: '%' %L: newline %T: tabula
         options.escActive = self._optionProcessor.valueOf('esc-active')
         if fileOptions:
             options.backupExtensions = self._optionProcessor.valueOf('backup')
+        if self._mainMode != 'replace-many':
+            options.wholeBuffer = self._optionProcessor.valueOf('whole-buffer')
         if options.prefixBackref is not None and len(options.prefixBackref) != 1:
             self.argumentError(
                 'prefix-backref must have length 1, not ' + options.prefixBackref)
@@ -626,7 +1026,8 @@ Placeholders: %f: full filename %p: path %n: node %%: '%' %L: newline %T: tabula
             if options is not None:
                 self._processor.setContent(inputString)
                 self._processor.replace(what, replacement, options.prefixBackref,
-                                        options.rawString, True, options.wordOnly, options.ignoreCase, options.escActive)
+                                        options.rawString, True, options.wordOnly, options.ignoreCase, options.escActive,
+                                        options.wholeBuffer)
                 info = '\n'.join(self._processor._lines)
                 self._resultText = info
                 print(info)
@@ -656,6 +1057,17 @@ Placeholders: %f: full filename %p: path %n: node %%: '%' %L: newline %T: tabula
         else:
             self.abort('unknown mode: ' + self._mainMode)
 
+    def textFiles(self, filenames):
+        '''Filters the text files if the option --text-only is set.
+        The files are classified in advance by worker threads, see base.FileHelper.fileClasses().
+        @param filenames: an iterable of filenames
+        @return: an iterable of the filenames to process
+        '''
+        if not self._optionProcessor.valueOf('text-only'):
+            return filenames
+        return (filename for filename, (aClass, subClass) in base.FileHelper.fileClasses(filenames)
+                if aClass == 'text')
+
 
 def main(args):
     '''Main function.
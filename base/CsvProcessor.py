@@ -6,17 +6,217 @@ Created: 2020.06.24
 import re
 import os.path
 import csv
+import sys
+import math
+import array
 import datetime
 import fnmatch
+import tempfile
+import itertools
+import collections
+import heapq
+import io
+import operator
+import pickle
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 import base.Const
 import base.StringUtils
 
+REG_EXPR_FLOAT = re.compile(r'[-+]?(\d+\.\d*|\.\d+|\d+(?=[eE]))([eE][-+]?\d+)?$')
+REG_EXPR_DECIMAL = re.compile(r'[-+]?\d+$')
+# the rows are read in chunks of this size and then distributed to the columns:
+READ_CHUNK_ROWS = 0x10000
+# the default memory budget of the sort command in streaming mode:
+SORT_MEMORY = 100 * 1024 * 1024
+# the sorted runs are written to the temporary files in batches of this size:
+SORT_BATCH_ROWS = 1000
+# the rows are written in batches of this size:
+WRITE_BATCH_ROWS = 0x2000
+# the detected dialects: (directory, first line) -> dialect
+_dialects = collections.OrderedDict()
+MAX_CACHED_DIALECTS = 64
+
+class _KnownDialectSniffer(csv.Sniffer):
+    '''A sniffer which detects only the header: the dialect is already known.
+    '''
+
+    def __init__(self, dialect):
+        '''Constructor.
+        @param dialect: the known dialect
+        '''
+        csv.Sniffer.__init__(self)
+        self._dialect = dialect
+
+    def sniff(self, sample, delimiters=None):
+        '''Returns the known dialect instead of the (expensive) detection.
+        @param sample: the start of the CSV file (ignored)
+        @param delimiters: None or the allowed delimiters (ignored)
+        @return: the known dialect
+        '''
+        return self._dialect
+
+
+class ColumnStatistic:
+    '''Computes the statistics of a column: minimum, maximum, longest value, number of distinct values and duplicates.
+    If frequencies are needed the column is counted in one pass: all other values are derived
+    from the (usually much smaller) set of distinct values. Nothing is sorted except for sorted output.
+    '''
+
+    def __init__(self, values, strings=None, counting=False):
+        '''Constructor.
+        @param values: the values of the column for comparisons, see CsvProcessor.column()
+        @param strings: None or the column as strings if values contains converted strings (may contain None)
+        @param counting: True: the frequencies of the values are computed (for distinct, unique and multiple)
+        '''
+        self._values = values
+        self._strings = strings
+        self._numpy = None
+        if numpy is not None and isinstance(values, array.array):
+            self._numpy = numpy.frombuffer(values, dtype=numpy.int64 if values.typecode == 'q' else numpy.float64)
+        # the distinct values and their frequencies:
+        self._keys = None
+        self._counts = None
+        if counting:
+            if self._numpy is not None:
+                keys, counts = numpy.unique(self._numpy, return_counts=True)
+                self._keys = keys.tolist()
+                self._counts = counts.tolist()
+            else:
+                counter = collections.Counter(values)
+                self._keys = list(counter.keys())
+                self._counts = list(counter.values())
+
+    def distinct(self):
+        '''Returns the number of distinct values.
+        @return: the number of distinct values
+        '''
+        return len(self._keys) if self._keys is not None else len(set(self._values))
+
+    def duplicates(self):
+        '''Returns the values occurring more than once.
+        @return: a list of tuples (value, count) sorted by value
+        '''
+        if self._keys is None:
+            counter = collections.Counter(self._values)
+            self._keys = list(counter.keys())
+            self._counts = list(counter.values())
+        return sorted(item for item in zip(self._keys, self._counts) if item[1] > 1)
+
+    def longest(self):
+        '''Returns the first of the longest values.
+        @return: '' (empty column) or the longest value as string
+        '''
+        if self._strings is not None:
+            strings = (value for value in self._strings if value is not None)
+        else:
+            strings = self._keys if self._keys is not None else self._values
+            if isinstance(self._values, array.array) or strings and not isinstance(strings[0], str):
+                strings = map(str, strings)
+        return max(strings, key=len, default='')
+
+    def maximum(self):
+        '''Returns the maximum.
+        @return: the greatest value
+        '''
+        if self._numpy is not None and self._keys is None:
+            rc = self._numpy.max().item()
+        else:
+            rc = max(self._keys if self._keys is not None else self._values)
+        return rc
+
+    def minimum(self):
+        '''Returns the minimum.
+        @return: the smallest value
+        '''
+        if self._numpy is not None and self._keys is None:
+            rc = self._numpy.min().item()
+        else:
+            rc = min(self._keys if self._keys is not None else self._values)
+        return rc
+
+    def sortedValues(self, unique):
+        '''Returns the values in ascending order.
+        @param unique: True: each value is returned only once
+        @return: the sorted values as list
+        '''
+        if unique:
+            rc = sorted(self._keys if self._keys is not None else set(self._values))
+        elif self._numpy is not None:
+            rc = numpy.sort(self._numpy).tolist()
+        else:
+            rc = sorted(self._values)
+        return rc
+
+
+class BatchWriter:
+    '''Writes CSV rows in batches: a batch is formatted by a csv.writer into a buffer
+    which is written with one call.
+    The quoting rules of CsvProcessor.quoteString() are kept: the csv.writer formats only values
+    which need no quoting. A batch with other values is formatted by CsvProcessor._formatRow().
+    '''
+
+    def __init__(self, processor, fp, delimiter):
+        '''Constructor.
+        @param processor: the CsvProcessor instance
+        @param fp: the file to write (text mode)
+        @param delimiter: the separator of the columns
+        '''
+        self._processor = processor
+        self._fp = fp
+        self._delimiter = delimiter
+        self._terminator = processor._dialect.lineterminator
+        self._buffer = io.StringIO()
+        self._writer = None
+        # quoteString() quotes values containing the delimiter of the dialect, not the written one:
+        self._dialectDelimiter = processor._dialect.delimiter
+        if processor._dialect.quoting == csv.QUOTE_MINIMAL and self._dialectDelimiter not in self._terminator:
+            # QUOTE_NONE: values containing the delimiter or a line end raise csv.Error
+            self._writer = csv.writer(self._buffer, delimiter=self._dialectDelimiter, quoting=csv.QUOTE_NONE,
+                                      quotechar=None, escapechar=None, lineterminator=self._terminator)
+        self._fastBatches = 0
+        self._slowBatches = 0
+
+    def write(self, rows):
+        '''Writes a batch of rows.
+        @param rows: a list of rows: each row contains the values to write (strings, numbers or None)
+        '''
+        done = False
+        if self._writer is not None:
+            try:
+                self._writer.writerows(rows)
+                # no value contains the dialect delimiter: each of them separates two columns
+                text = self._buffer.getvalue()
+                if self._delimiter != self._dialectDelimiter:
+                    text = text.replace(self._dialectDelimiter, self._delimiter)
+                self._fp.write(text)
+                self._fastBatches += 1
+                done = True
+            except csv.Error:
+                pass
+            self._buffer.seek(0)
+            self._buffer.truncate()
+        if not done:
+            positions = range(len(rows[0])) if rows else ()
+            terminator = self._terminator
+            self._fp.write(''.join([self._processor._formatRow(row, positions, self._delimiter) + terminator
+                                    for row in rows]))
+            self._slowBatches += 1
+
+
 class CsvProcessor:
     '''A processor for finding/modifying text.
     '''
 
-    def __init__(self, logger):
+    def __init__(self, logger, sortMemory=SORT_MEMORY):
+        '''Constructor.
+        @param logger: the logger
+        @param sortMemory: the memory budget (in bytes) of the sort command in streaming mode:
+            if more rows are found they are sorted in runs stored in temporary files
+        '''
         self._filename = None
         self._lines = None
         self._logger = logger
@@ -25,7 +225,12 @@ class CsvProcessor:
         self._dataTypes = []
         # bool flags of one row: True: any row has null (empty value)
         self._hasEmpty = []
-        self._rows = []
+        # the table is stored column by column: an array('q') for integers, an array('d') for floats
+        # or a list of (interned) strings. Missing cells of short rows are stored as None
+        self._columns = []
+        self._rowCount = 0
+        # the values of the columns prepared for comparisons: index -> values
+        self._values = {}
         self._indexes = None
         self._minCols = 0x7fffffff
         self._rowMinCols = None
@@ -33,6 +238,10 @@ class CsvProcessor:
         self._rowMaxCols = None
         self._columnOrder = None
         self._dialect = None
+        self._sortMemory = sortMemory
+        # None: detected otherwise: given by setLayout()
+        self._fixedDialect = None
+        self._fixedHeader = None
 
     def addColumn(self, header, colIndex, value1, value2):
         '''Adds a CSV column to the internal structure.
@@ -42,45 +251,57 @@ class CsvProcessor:
         @param value2: None: all column values are set to value1
             Otherwise: the column value of the 2nd row. all other values will be interpolated
         '''
-        index = base.StringUtils.asInt(colIndex)
-        if index is None:
-            self._logger.error('<index> is not an integer: ' + colIndex)
-        else:
-            index = index if index < len(self._rows[0]) else len(self._rows[0])
-            value = value1
-            step = None
-            if value2 is not None:
-                v1 = base.StringUtils.asInt(value1)
-                v2 = base.StringUtils.asInt(value2)
-                if v1 is None or v2 is None:
-                    self._logger.error(
-                        'cannot interpolate {}..{}'.format(value1, value2))
-                    index = None
-                else:
-                    step = v2 - v1
-                    value = v1
-            if index is not None and header == '' and self._colNames is not None:
-                self._logger.error(
-                    'missing <header> in add-column command: may not be empty')
-                index = None
-            if index is not None:
-                if self._colNames is not None:
-                    self._colNames.insert(index, header)
-                self._rows[0].insert(index, value)
-                for ixRow in range(1, len(self._rows)):
-                    if step is not None:
-                        value += step
-                    self._rows[ixRow].insert(index, value)
+        plan = self._addColumnPlan(header, colIndex, value1, value2, len(self._columns))
+        if plan is not None:
+            index, value, step = plan
+            if step is None:
+                column = [value] * self._rowCount
+                dataType = CsvProcessor.dataType(value)
+            else:
+                values = itertools.islice(itertools.count(value, step), self._rowCount)
+                try:
+                    column = array.array('q', values)
+                except OverflowError:
+                    column = list(itertools.islice(itertools.count(value, step), self._rowCount))
+                dataType = int
+            self._columns.insert(index, column)
+            self._dataTypes.insert(index, dataType)
+            self._hasEmpty.insert(index, dataType is None and self._rowCount > 0)
+            self._values = {}
+
+    def column(self, index):
+        '''Returns the values of a column for comparisons.
+        @param index: the column index
+        @return: numbers (array or list) for numeric columns: empty values are ignored.
+            Otherwise the list of strings
+        '''
+        rc = self._values.get(index)
+        if rc is None:
+            rc = self._columns[index]
+            dataType = self._dataTypes[index]
+            if isinstance(rc, array.array):
+                pass
+            elif dataType == int:
+                rc = [base.StringUtils.asInt(value) for value in rc if value is not None and value != '']
+            elif dataType == float:
+                rc = [base.StringUtils.asFloat(value) for value in rc if value is not None and value != '']
+            elif None in rc:
+                rc = [value for value in rc if value is not None]
+            self._values[index] = rc
+        return rc
+
     @staticmethod
     def dataType(string):
         '''Returns the data type of the given string.
         @param string: string to inspect
-        @return the data type: None, str int
+        @return the data type: None, str, int or float
         '''
         if string is None or string == '':
             rc = None
         elif base.StringUtils.asInt(string) is not None:
             rc = int
+        elif REG_EXPR_FLOAT.match(string) is not None:
+            rc = float
         else:
             rc = str
         return rc
@@ -95,10 +316,14 @@ add-column:<header>,<col-index>,<firstValue>[,<secondValue>]
         if it exists: the second row is set to this value and the next values are interpolated
 info:<what1>[,<what2>...]
     Note: only filtered column will be respected
-    <what>: summary | min | max | sorted | unique | multiple
+    <what>: summary | min | max | max-length | distinct | sorted | unique | multiple
+    Numeric columns are compared as numbers, empty values are ignored there.
 set-filter:<index1>[,<index2...] or set-filter:<pattern1>[,<pattern2...]
 set-order:<pattern1>[,<pattern2...]
     Sets the columns that are then written.
+sort:<col1>[,<col2>...][,desc]
+    Sorts the rows by the given columns. <col>: an index or a column name pattern
+    Order: empty values, numbers (compared as numbers), other values. desc: descending order
 write:<filename>[,<delimiter>[,<backupExtension>]]
     If <filename> is empty, the current filename is taken.
     <delimiter>: the delimiter between two columns: comma | tab | semicolon
@@ -107,26 +332,57 @@ write:<filename>[,<delimiter>[,<backupExtension>]]
         with this extension. May contain placeholders %date%, %datetime% or %seconds%.
 Example:
 set-filter:name,prename info:summary,unique set-order:nam*,*pren* write:names.csv,tab,.%date%
+Streaming:
+    If the commands are only add-column, info:summary, set-filter, set-order, sort and write
+    the rows can be processed one by one (constant memory usage): csv-execute --streaming
+    sort holds at most --sort-memory bytes of rows: more rows are sorted in runs which are
+    stored in temporary files and merged.
+Layout:
+    The dialect (delimiter, quoting) and the header line are detected once per directory and first line.
+    They can be given with csv-execute --dialect=<name> and --has-header or --no-header
 '''
+    @staticmethod
+    def dialectByName(name):
+        '''Returns the CSV dialect given by name.
+        @param name: a registered dialect (excel, excel-tab, unix) or a delimiter: comma, semicolon, tab
+        @return: None: unknown name otherwise: the dialect
+        '''
+        delimiters = {'comma': ',', 'semicolon': ';', 'tab': '\t'}
+        if name in delimiters:
+            rc = type('Dialect' + name.capitalize(), (csv.excel,), {'delimiter': delimiters[name]})
+        elif name in csv.list_dialects():
+            rc = csv.get_dialect(name)
+        else:
+            rc = None
+        return rc
+
     @staticmethod
     def describe():
         '''Prints a description of the commands.
         '''
         print(CsvProcessor.__description)
 
+    def canStream(self, commands):
+        '''Tests whether a command sequence can be executed by executeStreaming().
+        @param commands: the command sequence as string
+        @return: True: no command needs the whole table
+        '''
+        rc = True
+        for name, args, arguments in self._commands(commands, False):
+            if name == 'info':
+                rc = all(item == 'summary' for item in arguments)
+            else:
+                rc = name in ('add-column', 'set-filter', 'set-order', 'sort', 'write')
+            if not rc:
+                break
+        return rc
+
     def execute(self, commands):
         '''Executes a sequence of commands.
         @see describe()
         @param commands: the command sequence as string
     '''
-        for command in commands.split():
-            name, delim, args = command.partition(':')
-            if name == '' or name.startswith('#'):
-                continue
-            if delim != ':':
-                self._logger.error('missing ":" in ' + command)
-                break
-            arguments = args.split(',')
+        for name, args, arguments in self._commands(commands):
             if name == 'add-column':
                 if len(arguments) < 3:
                     self._logger.error(
@@ -137,23 +393,62 @@ set-filter:name,prename info:summary,unique set-order:nam*,*pren* write:names.cs
             elif name == 'info':
                 self.info(args)
             elif name == 'set-filter':
-                if base.StringUtils.asInt(arguments[0]) is not None:
-                    self.setFilterIndexes(arguments)
-                else:
-                    self.setFilterCols(arguments)
+                self.setFilter(arguments)
             elif name == 'set-order':
                 self.setColumnOrder(arguments)
+            elif name == 'sort':
+                plan = self._sortPlan(arguments)
+                if plan is not None:
+                    self.sort(*plan)
             elif name == 'write':
-                ext = None if len(arguments) < 3 else arguments[2]
-                delim = None if len(arguments) < 2 else arguments[1]
-                if delim == 'comma':
-                    delim = ','
-                elif delim == 'semicolon':
-                    delim = ';'
-                elif delim == 'tab':
-                    delim = '\t'
-                fn = None if arguments[0] == '' else arguments[0]
-                self.writeFile(fn, ext, delim)
+                self.writeFile(*self._writeArguments(arguments))
+
+    def executeStreaming(self, filename, commands):
+        '''Executes a sequence of commands while reading a file: the rows are passed from the reader
+        through the commands to the writers one by one, therefore the memory usage does not depend on the file size.
+        Only commands not needing the whole table are allowed: @see canStream()
+        @param filename: the CSV file to process
+        @param commands: the command sequence as string
+        @return: True: success False: cannot read
+        '''
+        self._filename = filename
+        rc = os.path.exists(filename)
+        if not rc:
+            self._logger.error('{} does not exists'.format(filename))
+        else:
+            with open(filename, newline='') as csvfile:
+                rows = self._openReader(csvfile)
+                first = next(rows, None)
+                if first is not None:
+                    rows = itertools.chain([first], rows)
+                # the number of columns of the first row:
+                width = 0 if first is None else len(first)
+                for name, args, arguments in self._commands(commands):
+                    if name == 'add-column':
+                        if len(arguments) < 3:
+                            self._logger.error(
+                                'missing arguments for add-column: <header>,<col-index>,<first-value> expected')
+                            continue
+                        plan = self._addColumnPlan(arguments[0], arguments[1], arguments[2],
+                                                   None if len(arguments) < 4 else arguments[3], width)
+                        if plan is not None:
+                            rows = self._streamAddColumn(rows, *plan)
+                            width += 1
+                    elif name == 'info':
+                        rows = self._streamSummary(rows, None if self._colNames is None else list(self._colNames))
+                    elif name == 'set-filter':
+                        self.setFilter(arguments)
+                    elif name == 'set-order':
+                        self.setColumnOrder(arguments)
+                    elif name == 'sort':
+                        plan = self._sortPlan(arguments)
+                        if plan is not None:
+                            rows = self._streamSort(rows, *plan)
+                    elif name == 'write':
+                        rows = self._streamWrite(rows, width, *self._writeArguments(arguments))
+                # pulls all rows through the pipeline:
+                collections.deque(rows, maxlen=0)
+        return rc
 
     def info(self, what):
         '''Prints some infos about the CSV file.
@@ -163,65 +458,38 @@ set-filter:name,prename info:summary,unique set-order:nam*,*pren* write:names.cs
         def prefix(col):
             return '{}{}: '.format(col, (' "' + self._colNames[col] + '"') if col < len(self._colNames) else '')
 
-        if re.search(r'unique|sorted|multiple|min|max|max-length', what) is not None:
+        if re.search(r'unique|sorted|multiple|min|max|max-length|distinct', what) is not None:
             unique = what.find('unique') >= 0
             multiple = what.find('multiple') >= 0
-            for index in self._indexes:
-                cols = []
-                for row in self._rows:
-                    value = row[index]
-                    if self._dataTypes == int:
-                        cols.append(int(value))
-                    else:
-                        cols.append(value)
-                cols.sort()
+            counting = unique or multiple or what.find('distinct') >= 0
+            indexes = self._indexes if self._indexes is not None else range(len(self._columns))
+            for index in indexes:
+                values = self.column(index)
+                column = self._columns[index]
+                statistic = ColumnStatistic(values, column if values is not column and isinstance(column, list)
+                                            and self._dataTypes[index] in (int, float) else None, counting)
                 self._logger.log('== {}'.format(prefix(index)))
+                if not values:
+                    continue
                 if what.find('min') >= 0:
-                    self._logger.log('minimum: {}'.format(cols[0]))
+                    self._logger.log('minimum: {}'.format(statistic.minimum()))
                 if re.search(r'(max[^-])|(max$)', what) is not None:
-                    self._logger.log('maximum: {}'.format(cols[-1]))
+                    self._logger.log('maximum: {}'.format(statistic.maximum()))
                 if what.find('max-length') >= 0:
-                    maxLength = 0
-                    maxString = None
-                    for row in self._rows:
-                        current = len(row[index])
-                        if current > maxLength:
-                            maxLength = current
-                            maxString = row[index]
-                    if maxString is not None:
+                    maxString = statistic.longest()
+                    if maxString != '':
                         self._logger.log(
-                            'max-length: {} "{}"'.format(maxLength, maxString))
+                            'max-length: {} "{}"'.format(len(maxString), maxString))
+                if what.find('distinct') >= 0:
+                    self._logger.log('distinct: {}'.format(statistic.distinct()))
                 if unique or what.find('sorted') >= 0:
-                    lastValue = None
-                    for col in cols:
-                        if unique and col == lastValue:
-                            continue
-                        self._logger.log(col)
-                        lastValue = col
+                    for value in statistic.sortedValues(unique):
+                        self._logger.log(str(value))
                 elif multiple:
-                    lastValue = None
-                    lastCount = 0
-                    for col in cols:
-                        if col == lastValue:
-                            lastCount += 1
-                        else:
-                            if lastValue is not None and lastCount > 0:
-                                self._logger.log('{}: {}'.format(
-                                    lastValue, lastCount + 1))
-                        lastValue = col
-                    if lastCount > 0:
-                        self._logger.log('{}: {}'.format(
-                            lastValue, lastCount + 1))
+                    for value, count in statistic.duplicates():
+                        self._logger.log('{}: {}'.format(value, count))
         if what.find('summary') >= 0:
-            info = '== summary:\nRows: {}\nCols: {}\nHeaders: {} line(s)'.format(
-                len(self._rows), len(self._rows[0]), 1 if self._colNames else 0)
-            info += (f'\ndelimiter: {self._dialect.delimiter}\ndoublequote: {self._dialect.doublequote}'
-                     + f'\nescapechar: {self._dialect.escapechar}\nquotechar: {self._dialect.quotechar}')
-            self._logger.log(info)
-            for col in range(len(self._rows[0])):
-                info = '{} {} {}'.format(prefix(col),
-                                         str(self._dataTypes[col]), 'hasEmpty' if self._hasEmpty[col] else '')
-                self._logger.log(info)
+            self._logSummary(self._rowCount, len(self._columns), self._colNames, self._dataTypes, self._hasEmpty)
 
     def readFile(self, filename, mustExists=True):
         '''Reads a file into the internal buffer.
@@ -235,46 +503,39 @@ set-filter:name,prename info:summary,unique set-order:nam*,*pren* write:names.cs
             if mustExists:
                 self._logger.error('{} does not exists'.format(filename))
         else:
+            self._columns = []
+            self._rowCount = 0
+            self._values = {}
+            self._minCols = 0x7fffffff
+            self._maxCols = 0
             with open(filename, newline='') as csvfile:
-                sniffer = csv.Sniffer()
-                buffer = csvfile.read(16000)
-                self._dialect = sniffer.sniff(buffer)
-                hasHeaders = sniffer.has_header(buffer)
-                csvfile.seek(0)
-                reader = csv.reader(csvfile, self._dialect)
-                self._colNames = None
-                ix = -1
-                for row in reader:
-                    ix += 1
-                    if ix == 0 and hasHeaders:
-                        self._colNames = row
-                    else:
-                        self._rows.append(row)
-                        currentLength = len(row)
-                        if currentLength < self._minCols:
-                            self._minCols = currentLength
-                            self._rowMinCols = reader.line_num
-                        if currentLength > self._maxCols:
-                            self._maxCols = currentLength
-                            self._rowMaxCols = reader.line_num
-                        if not self._dataTypes:
-                            for col in row:
-                                currentType = CsvProcessor.dataType(col)
-                                self._dataTypes.append(currentType)
-                                self._hasEmpty.append(currentType is None)
-                        else:
-                            for ix, col in enumerate(row):
-                                currentType = self.dataType(col)
-                                if ix >= len(self._dataTypes):
-                                    self._dataTypes.append(currentType)
-                                    self._hasEmpty.append(currentType is None)
-                                else:
-                                    if currentType is None:
-                                        self._hasEmpty[ix] = True
-                                    if self._dataTypes[ix] == int and currentType is not None and currentType != int:
-                                        self._dataTypes[ix] = str
+                rows = self._openReader(csvfile)
+                while True:
+                    chunk = list(itertools.islice(rows, READ_CHUNK_ROWS))
+                    if not chunk:
+                        break
+                    self._appendRows(chunk)
+            self._typeColumns()
         return rc
 
+    def row(self, index):
+        '''Returns a row of the table.
+        @param index: the row index
+        @return: the row as list of strings
+        '''
+        rc = [column[index] for column in self._columns]
+        while rc and rc[-1] is None:
+            rc.pop()
+        return [value if isinstance(value, str) else base.StringUtils.toString(value) for value in rc]
+
+    def setLayout(self, dialect=None, hasHeader=None):
+        '''Sets the layout of the files to read: the given data is not detected.
+        @param dialect: None or the CSV dialect, see dialectByName()
+        @param hasHeader: None or True: the first line contains the column names
+        '''
+        self._fixedDialect = dialect
+        self._fixedHeader = hasHeader
+
     def setColumnOrder(self, patterns):
         '''Sets the filter indexes by column name patterns.
         @param patterns: a list of column name patterns, e.g. ['*name*', 'ag*']
@@ -294,6 +555,15 @@ set-filter:name,prename info:summary,unique set-order:nam*,*pren* write:names.cs
             if not found:
                 self._logger.error('pattern {} not found')
 
+    def setFilter(self, arguments):
+        '''Sets the filter indexes by indexes or by column name patterns.
+        @param arguments: a list of indexes or a list of column name patterns
+        '''
+        if base.StringUtils.asInt(arguments[0]) is not None:
+            self.setFilterIndexes(arguments)
+        else:
+            self.setFilterCols(arguments)
+
     def setFilterIndexes(self, indexes):
         '''Sets the filter indexes by indexes.
         @param indexes: a list of indexes. May be strings or integers like ['0', 2]
@@ -325,6 +595,29 @@ set-filter:name,prename info:summary,unique set-order:nam*,*pren* write:names.cs
                 break
         self._indexes.sort()
 
+    def sort(self, indexes, descending=False):
+        '''Sorts the rows.
+        Order: empty values, numbers (compared as numbers), other values.
+        @param indexes: the indexes of the columns defining the order
+        @param descending: True: the order is reversed
+        '''
+        wrong = [index for index in indexes if index >= len(self._columns)]
+        if wrong:
+            self._logger.error('sort: column index {} is too large: only {} column(s)'.format(
+                wrong[0], len(self._columns)))
+        else:
+            order = list(range(self._rowCount))
+            # stable sorting: the last column first
+            for index in reversed(indexes):
+                column = self._columns[index]
+                keys = column if isinstance(column, array.array) else list(map(CsvProcessor._sortKey, column))
+                order.sort(key=keys.__getitem__, reverse=descending)
+            for ix, column in enumerate(self._columns):
+                values = map(column.__getitem__, order)
+                self._columns[ix] = array.array(column.typecode, values) if isinstance(
+                    column, array.array) else list(values)
+            self._values = {}
+
     def quoteString(self, string):
         '''Quotes the given string if necessary.
         @param string: the string to quote
@@ -354,6 +647,83 @@ set-filter:name,prename info:summary,unique set-order:nam*,*pren* write:names.cs
         '''
         filename = self._filename if filename is None else filename
         delimiter = self._dialect.delimiter if delimiter is None else delimiter
+        self._backup(filename, backupExtension)
+        with open(filename, "w") as fp:
+            indexes = self._columnOrder if self._columnOrder is not None else [
+                ix for ix in range(len(self._columns))]
+            if self._colNames is not None:
+                line = delimiter.join([self.quoteString(self._colNames[item]) for item in indexes])
+                fp.write(line + self._dialect.lineterminator)
+            # the rows of the written columns:
+            rows = zip(*[self._columns[item] for item in indexes])
+            writer = BatchWriter(self, fp, delimiter)
+            while True:
+                batch = list(itertools.islice(rows, WRITE_BATCH_ROWS))
+                if not batch:
+                    break
+                writer.write(batch)
+
+    def _addColumnPlan(self, header, colIndex, value1, value2, rowLength):
+        '''Checks the parameters of add-column and inserts the header.
+        @param header: '' or the column header, e.g. 'name'
+        @param colIndex: the index of the column after inserting
+        @param value1: the column value in row[0]
+        @param value2: None or the column value of the 2nd row
+        @param rowLength: the number of columns of the first row
+        @return: None: wrong parameters otherwise: a tuple (index, value, step): step is None or the interpolation step
+        '''
+        rc = None
+        index = base.StringUtils.asInt(colIndex)
+        if index is None:
+            self._logger.error('<index> is not an integer: ' + colIndex)
+        else:
+            index = index if index < rowLength else rowLength
+            value = value1
+            step = None
+            if value2 is not None:
+                v1 = base.StringUtils.asInt(value1)
+                v2 = base.StringUtils.asInt(value2)
+                if v1 is None or v2 is None:
+                    self._logger.error(
+                        'cannot interpolate {}..{}'.format(value1, value2))
+                    index = None
+                else:
+                    step = v2 - v1
+                    value = v1
+            if index is not None and header == '' and self._colNames is not None:
+                self._logger.error(
+                    'missing <header> in add-column command: may not be empty')
+                index = None
+            if index is not None:
+                if self._colNames is not None:
+                    self._colNames.insert(index, header)
+                rc = (index, value, step)
+        return rc
+
+    def _appendRows(self, rows):
+        '''Distributes some rows to the columns.
+        @param rows: a list of rows (lists of strings)
+        '''
+        count = len(rows)
+        widths = set(map(len, rows))
+        width = max(widths)
+        for ix in range(len(self._columns), width):
+            self._columns.append([None] * self._rowCount)
+        ragged = len(widths) > 1
+        for ix, values in enumerate(itertools.zip_longest(*rows)):
+            if ragged:
+                self._columns[ix].extend([None if value is None else sys.intern(value) for value in values])
+            else:
+                self._columns[ix].extend(map(sys.intern, values))
+        for ix in range(width, len(self._columns)):
+            self._columns[ix].extend([None] * count)
+        self._rowCount += count
+
+    def _backup(self, filename, backupExtension):
+        '''Renames a file before it is overwritten.
+        @param filename: the file to save
+        @param backupExtension: None or the extension, may contain placeholders, see writeFile()
+        '''
         if os.path.exists(filename) and backupExtension is not None:
             if backupExtension.find('%') >= 0:
                 now = datetime.datetime.now()
@@ -369,24 +739,391 @@ set-filter:name,prename info:summary,unique set-order:nam*,*pren* write:names.cs
             parts['ext'] = backupExtension
             newNode = parts['fn'] + backupExtension
             base.FileHelper.deepRename(filename, newNode, deleteExisting=True)
-        with open(filename, "w") as fp:
-            indexes = self._columnOrder if self._columnOrder is not None else [
-                ix for ix in range(len(self._rows[0]))]
-            if self._colNames is not None:
-                line = ''
-                for ix, item in enumerate(indexes):
-                    if ix > 0:
-                        line += delimiter
-                    line += self.quoteString(self._colNames[item])
-                fp.write(line + self._dialect.lineterminator)
-            for row in self._rows:
-                line = ''
-                for ix, item in enumerate(indexes):
-                    if ix > 0:
-                        line += delimiter
-                    value = base.StringUtils.toString(row[item])
-                    line += self.quoteString(value)
-                fp.write(line + self._dialect.lineterminator)
+
+    def _commands(self, commands, logErrors=True):
+        '''Splits a command sequence into commands.
+        @param commands: the command sequence as string
+        @param logErrors: True: syntax errors will be logged
+        @return: an iterator over tuples (name, args, arguments): args: the arguments as string,
+            arguments: the arguments as list
+        '''
+        for command in commands.split():
+            name, delim, args = command.partition(':')
+            if name == '' or name.startswith('#'):
+                continue
+            if delim != ':':
+                if logErrors:
+                    self._logger.error('missing ":" in ' + command)
+                break
+            yield name, args, args.split(',')
+
+    def _formatRow(self, row, indexes, delimiter):
+        '''Returns a row as CSV line (without line terminator).
+        @param row: the row to format: None is written as empty value
+        @param indexes: the indexes of the columns to write
+        @param delimiter: the separator of the columns
+        @return: the CSV line
+        '''
+        return delimiter.join([self.quoteString('' if row[item] is None else base.StringUtils.toString(row[item]))
+                               for item in indexes])
+
+    def _logSummary(self, rowCount, colCount, colNames, dataTypes, hasEmpty):
+        '''Logs the summary info.
+        @param rowCount: the number of rows
+        @param colCount: the number of columns
+        @param colNames: None or the column names
+        @param dataTypes: the data types of the columns
+        @param hasEmpty: the "has empty value" flags of the columns
+        '''
+        def prefix(col):
+            return '{}{}: '.format(col, (' "' + colNames[col] + '"') if colNames is not None and col < len(colNames) else '')
+        info = '== summary:\nRows: {}\nCols: {}\nHeaders: {} line(s)'.format(
+            rowCount, colCount, 1 if colNames else 0)
+        info += (f'\ndelimiter: {self._dialect.delimiter}\ndoublequote: {self._dialect.doublequote}'
+                 + f'\nescapechar: {self._dialect.escapechar}\nquotechar: {self._dialect.quotechar}')
+        self._logger.log(info)
+        for col in range(colCount):
+            info = '{} {} {}'.format(prefix(col),
+                                     str(dataTypes[col]), 'hasEmpty' if hasEmpty[col] else '')
+            self._logger.log(info)
+
+    @staticmethod
+    def _mergeTypes(type1, type2):
+        '''Returns the data type of a column containing values of two data types.
+        @param type1: None, int, float or str
+        @param type2: None, int, float or str
+        @return: the common data type
+        '''
+        if type1 is None or type1 == type2:
+            rc = type2
+        elif type2 is None:
+            rc = type1
+        elif type1 in (int, float) and type2 in (int, float):
+            rc = float
+        else:
+            rc = str
+        return rc
+
+    @staticmethod
+    def _numericColumn(column):
+        '''Converts a column into an array if all values are numbers written in the standard format,
+        e.g. '12' or '1.5' but not '012' or '1.50': writing the numbers must give the original text.
+        @param column: the column as list of strings
+        @return: None: not convertible otherwise: an array('q') or an array('d')
+        '''
+        try:
+            rc = array.array('q', map(int, column))
+            if list(map(str, rc)) != column:
+                rc = None
+        except (ValueError, OverflowError):
+            rc = None
+        if rc is None:
+            try:
+                rc = array.array('d', map(float, column))
+                if list(map(repr, rc)) != column or not all(map(math.isfinite, rc)):
+                    rc = None
+            except ValueError:
+                rc = None
+        return rc
+
+    def _openReader(self, csvfile):
+        '''Detects the CSV dialect and the header and returns the data rows.
+        The dialect is sniffed only if it is not given by setLayout() and not known from a file
+        with the same first line in the same directory. Only a first line containing the delimiter
+        is used as key: it is assumed that it determines the quoting of the file too.
+        The header is detected for each file because it depends on the data rows.
+        Sets _dialect, _colNames and (while iterating) the column count statistics.
+        @param csvfile: the file opened with newline=''
+        @return: an iterator over the rows (lists of strings) below the header
+        '''
+        self._dialect, hasHeaders = self._fixedDialect, self._fixedHeader
+        if self._dialect is None or hasHeaders is None:
+            key = (os.path.dirname(os.path.abspath(self._filename)), csvfile.readline(4096))
+            csvfile.seek(0)
+            buffer = csvfile.read(16000)
+            dialect = self._dialect if self._dialect is not None else _dialects.get(key)
+            if dialect is not None:
+                if self._dialect is None:
+                    _dialects.move_to_end(key)
+                sniffer = _KnownDialectSniffer(dialect)
+            else:
+                sniffer = csv.Sniffer()
+                dialect = sniffer.sniff(buffer)
+                if dialect.delimiter in key[1]:
+                    _dialects[key] = dialect
+                    if len(_dialects) > MAX_CACHED_DIALECTS:
+                        _dialects.popitem(last=False)
+            self._dialect = dialect
+            if hasHeaders is None:
+                hasHeaders = sniffer.has_header(buffer)
+        csvfile.seek(0)
+        reader = csv.reader(csvfile, self._dialect)
+        self._colNames = next(reader, None) if hasHeaders else None
+        return self._rowsOf(reader)
+
+    @staticmethod
+    def _readRun(fp):
+        '''Reads a sorted run written by _spillRun().
+        @param fp: the temporary file
+        @return: an iterator over the tuples (key, row)
+        '''
+        while True:
+            try:
+                batch = pickle.load(fp)
+            except EOFError:
+                break
+            yield from batch
+
+    def _rowsOf(self, reader):
+        '''Returns the rows of a CSV reader and collects the column count statistics.
+        @param reader: the csv.reader instance
+        @return: an iterator over the rows
+        '''
+        for row in reader:
+            currentLength = len(row)
+            if currentLength < self._minCols:
+                self._minCols = currentLength
+                self._rowMinCols = reader.line_num
+            if currentLength > self._maxCols:
+                self._maxCols = currentLength
+                self._rowMaxCols = reader.line_num
+            yield row
+
+    @staticmethod
+    def _sortKey(value):
+        '''Returns the key of a value for sorting: empty values first, then the numbers, then other strings.
+        @param value: the value to inspect: a string, a number or None
+        @return: the key (a tuple)
+        '''
+        if value is None or value == '':
+            rc = (0, 0, '')
+        elif not isinstance(value, str):
+            rc = (1, value, '')
+        elif REG_EXPR_DECIMAL.match(value) is not None:
+            rc = (1, int(value), '')
+        elif REG_EXPR_FLOAT.match(value) is not None:
+            rc = (1, float(value), '')
+        else:
+            rc = (2, 0, value)
+        return rc
+
+    def _sortPlan(self, arguments):
+        '''Evaluates the arguments of the command sort.
+        @param arguments: the arguments as list: <col1>[,<col2>...][,desc]
+        @return: None: wrong arguments otherwise: a tuple (indexes, descending)
+        '''
+        descending = False
+        if arguments[-1] in ('asc', 'desc'):
+            descending = arguments[-1] == 'desc'
+            arguments = arguments[0:-1]
+        indexes = []
+        for argument in arguments:
+            index = base.StringUtils.asInt(argument)
+            if index is None and self._colNames is not None:
+                for ix, name in enumerate(self._colNames):
+                    if fnmatch.fnmatch(name, argument):
+                        index = ix
+                        break
+            if index is None:
+                self._logger.error('sort: unknown column {}'.format(argument))
+                indexes = None
+                break
+            indexes.append(index)
+        if indexes == []:
+            self._logger.error('sort: missing column')
+        return None if not indexes else (indexes, descending)
+
+    def _spillRun(self, run):
+        '''Writes a sorted run into a temporary file.
+        @param run: the sorted list of tuples (key, row)
+        @return: the temporary file (opened)
+        '''
+        fp = tempfile.TemporaryFile(prefix='csvsort.')
+        for ix in range(0, len(run), SORT_BATCH_ROWS):
+            pickle.dump(run[ix:ix + SORT_BATCH_ROWS], fp, pickle.HIGHEST_PROTOCOL)
+        fp.seek(0)
+        return fp
+
+    def _streamAddColumn(self, rows, index, value, step):
+        '''Inserts a column into the rows of a row stream.
+        @param rows: the row iterator
+        @param index: the index of the new column
+        @param value: the value of the first row
+        @param step: None or the difference between two rows
+        @return: an iterator over the changed rows
+        '''
+        for row in rows:
+            row.insert(index, value)
+            if step is not None:
+                value += step
+            yield row
+
+    def _streamSummary(self, rows, colNames):
+        '''Collects the summary info of a row stream and logs it at the end.
+        @param rows: the row iterator
+        @param colNames: None or the column names
+        @return: an iterator over the (unchanged) rows
+        '''
+        dataTypes = []
+        hasEmpty = []
+        rowCount = 0
+        colCount = None
+        for row in rows:
+            rowCount += 1
+            if colCount is None:
+                colCount = len(row)
+            CsvProcessor._updateTypes(row, dataTypes, hasEmpty)
+            yield row
+        self._logSummary(rowCount, colCount or 0, colNames, dataTypes, hasEmpty)
+
+    def _streamSort(self, rows, indexes, descending):
+        '''Sorts the rows of a row stream (external merge sort).
+        The rows are collected until the memory budget is reached. Then they are sorted and stored
+        in a temporary file (a "run"). At the end the runs are merged.
+        @param rows: the row iterator
+        @param indexes: the indexes of the columns defining the order
+        @param descending: True: the order is reversed
+        @return: an iterator over the sorted rows
+        '''
+        runs = []
+        run = []
+        size = 0
+        first = operator.itemgetter(0)
+        try:
+            for row in rows:
+                run.append((tuple([CsvProcessor._sortKey(row[ix] if ix < len(row) else None) for ix in indexes]), row))
+                # estimation of the memory: the row with its strings and the key
+                # (add-column may insert numbers into the rows):
+                size += 200 + 80 * len(row) + sum([len(cell) if isinstance(cell, str) else 8 for cell in row])
+                if size >= self._sortMemory:
+                    run.sort(key=first, reverse=descending)
+                    runs.append(self._spillRun(run))
+                    run = []
+                    size = 0
+            run.sort(key=first, reverse=descending)
+            if not runs:
+                for item in run:
+                    yield item[1]
+            else:
+                if run:
+                    runs.append(self._spillRun(run))
+                run = None
+                self._logger.log('sort: {} run(s) merged'.format(len(runs)), base.Const.LEVEL_DETAIL)
+                for item in heapq.merge(*[CsvProcessor._readRun(fp) for fp in runs], key=first, reverse=descending):
+                    yield item[1]
+        finally:
+            for fp in runs:
+                fp.close()
+
+    def _streamWrite(self, rows, width, filename, backupExtension, delimiter):
+        '''Writes the rows of a row stream into a file.
+        The column order, the header and the layout are taken now (when the command is planned),
+        not when the rows are pulled: later commands may change them.
+        @param rows: the row iterator
+        @param width: the number of columns of the first row
+        @param filename: None or the file to write: if None _filename is taken
+        @param backupExtension: None or the backup extension, see writeFile()
+        @param delimiter: None or the column separator
+        @return: an iterator over the (unchanged) rows
+        '''
+        filename = self._filename if filename is None else filename
+        delimiter = self._dialect.delimiter if delimiter is None else delimiter
+        indexes = list(self._columnOrder) if self._columnOrder is not None else list(range(width))
+        colNames = None if self._colNames is None else list(self._colNames)
+        header = None if colNames is None else delimiter.join(
+            [self.quoteString(colNames[item]) for item in indexes])
+        return self._streamWriteRows(rows, filename, backupExtension, delimiter, indexes, header,
+                                     self._dialect.lineterminator)
+
+    def _streamWriteRows(self, rows, filename, backupExtension, delimiter, indexes, header, terminator):
+        '''Implements a generator writing the rows of a row stream into a file.
+        The rows are written into a temporary file which replaces the target file at the end:
+        the target may be the file which is currently read.
+        @param rows: the row iterator
+        @param filename: the file to write
+        @param backupExtension: None or the backup extension, see writeFile()
+        @param delimiter: the column separator
+        @param indexes: the indexes of the columns to write
+        @param header: None or the header line (without terminator)
+        @param terminator: the line terminator
+        @return: an iterator over the (unchanged) rows
+        '''
+        handle, tempName = tempfile.mkstemp(prefix='.', suffix='.tmp', dir=os.path.dirname(os.path.abspath(filename)))
+        try:
+            with os.fdopen(handle, 'w') as fp:
+                if header is not None:
+                    fp.write(header + terminator)
+                writer = BatchWriter(self, fp, delimiter)
+                select = operator.itemgetter(*indexes) if len(indexes) > 1 else (lambda row: (row[indexes[0]],))
+                batch = []
+                for row in rows:
+                    batch.append(select(row))
+                    if len(batch) >= WRITE_BATCH_ROWS:
+                        writer.write(batch)
+                        batch = []
+                    yield row
+                if batch:
+                    writer.write(batch)
+            self._backup(filename, backupExtension)
+            os.replace(tempName, filename)
+        finally:
+            if os.path.exists(tempName):
+                os.unlink(tempName)
+
+    def _typeColumns(self):
+        '''Detects the data types of the columns and converts the numeric columns into arrays.
+        '''
+        self._dataTypes = []
+        self._hasEmpty = []
+        for ix, column in enumerate(self._columns):
+            distinct = set(column)
+            complete = None not in distinct and '' not in distinct
+            distinct.discard(None)
+            typed = CsvProcessor._numericColumn(column) if complete and column else None
+            if typed is not None:
+                self._columns[ix] = typed
+                dataType = int if typed.typecode == 'q' else float
+            else:
+                dataType = None
+                for value in distinct:
+                    dataType = CsvProcessor._mergeTypes(dataType, CsvProcessor.dataType(value))
+                    if dataType == str:
+                        break
+            self._dataTypes.append(dataType)
+            self._hasEmpty.append('' in distinct)
+
+    @staticmethod
+    def _updateTypes(row, dataTypes, hasEmpty):
+        '''Updates the data types of the columns by the values of a row.
+        @param row: the row to inspect
+        @param dataTypes: IN/OUT: the data types of the columns
+        @param hasEmpty: IN/OUT: the "has empty value" flags of the columns
+        '''
+        for ix, col in enumerate(row):
+            currentType = CsvProcessor.dataType(col)
+            if ix >= len(dataTypes):
+                dataTypes.append(currentType)
+                hasEmpty.append(currentType is None)
+            elif currentType is None:
+                hasEmpty[ix] = True
+            else:
+                dataTypes[ix] = CsvProcessor._mergeTypes(dataTypes[ix], currentType)
+
+    def _writeArguments(self, arguments):
+        '''Evaluates the arguments of the command write.
+        @param arguments: the arguments as list: [<filename>[,<delimiter>[,<backupExtension>]]]
+        @return: a tuple (filename, backupExtension, delimiter)
+        '''
+        ext = None if len(arguments) < 3 else arguments[2]
+        delim = None if len(arguments) < 2 else arguments[1]
+        if delim == 'comma':
+            delim = ','
+        elif delim == 'semicolon':
+            delim = ';'
+        elif delim == 'tab':
+            delim = '\t'
+        fn = None if arguments[0] == '' else arguments[0]
+        return fn, ext, delim
 
 
 if __name__ == '__main__':
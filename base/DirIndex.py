@@ -0,0 +1,177 @@
+'''
+Created: 2020.08.02
+@license: CC0 https://creativecommons.org/publicdomain/zero/1.0
+@author: hm
+'''
+import os.path
+import stat
+import sqlite3
+import threading
+
+
+class IndexEntry:
+    '''A directory entry stored in the index: implements the part of os.DirEntry used by DirTraverser.
+    '''
+
+    def __init__(self, directory, name, mode, uid, gid, size, mtime):
+        '''Constructor.
+        @param directory: the directory containing the entry
+        @param name: the node (filename without path)
+        @param mode: the st_mode of the entry (file type and permissions)
+        @param uid: the owner's id
+        @param gid: the group's id
+        @param size: the file size in bytes
+        @param mtime: the modification time (seconds since epoch as float)
+        '''
+        self.name = name
+        self.path = directory + os.sep + name
+        self._mode = mode
+        self._uid = uid
+        self._gid = gid
+        self._size = size
+        self._mtime = mtime
+        self._statInfo = None
+
+    def is_dir(self, follow_symlinks=True):
+        '''Tests whether the entry is a directory.
+        @param follow_symlinks: only for compatibility with os.DirEntry: a link is never a directory
+        @return: True: the entry is a directory
+        '''
+        return stat.S_ISDIR(self._mode)
+
+    def is_symlink(self):
+        '''Tests whether the entry is a symbolic link.
+        @return: True: the entry is a symbolic link
+        '''
+        return stat.S_ISLNK(self._mode)
+
+    def stat(self, follow_symlinks=True):
+        '''Returns the meta data of the entry (like os.lstat()).
+        Note: only st_mode, st_uid, st_gid, st_size and st_mtime are stored in the index.
+        @param follow_symlinks: only for compatibility with os.DirEntry: the data of the link itself is returned
+        @return: an os.stat_result instance
+        '''
+        if self._statInfo is None:
+            mtime = int(self._mtime)
+            # the 3 additional items: float times, the 3 next: times in nanoseconds:
+            self._statInfo = os.stat_result((self._mode, 0, 0, 1, self._uid, self._gid, self._size,
+                                             mtime, mtime, mtime, self._mtime, self._mtime, self._mtime,
+                                             int(self._mtime * 1E9), int(self._mtime * 1E9), int(self._mtime * 1E9)))
+        return self._statInfo
+
+
+class DirIndex:
+    '''Stores the meta data of directory trees in a SQLite database.
+    A directory is read again only if its modification time has been changed.
+    Note: the modification time of a directory changes if an entry is created, removed or renamed,
+    not if the content of a file is changed. Therefore a file modified in place is recognized
+    only in the refresh mode.
+    '''
+
+    def __init__(self, filename, refresh=False, commitInterval=200):
+        '''Constructor.
+        @param filename: the database file, will be created if it does not exist
+        @param refresh: True: all directories are read again and the index is updated
+        @param commitInterval: after this number of changed directories a commit is done
+        '''
+        self._filename = filename
+        self._refresh = refresh
+        self._commitInterval = commitInterval
+        self._changedDirs = 0
+        self._hits = 0
+        self._misses = 0
+        # the index may be used by the worker threads of the DirTraverser:
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime INTEGER)')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS entries (dir TEXT, name TEXT, mode INTEGER,
+uid INTEGER, gid INTEGER, size INTEGER, mtime REAL, PRIMARY KEY (dir, name)) WITHOUT ROWID''')
+        self._db.commit()
+
+    def close(self):
+        '''Writes the pending changes and closes the database.
+        '''
+        with self._lock:
+            if self._db is not None:
+                self._db.commit()
+                self._db.close()
+                self._db = None
+
+    def entries(self, directory):
+        '''Returns the entries of a directory: from the index if the directory is unchanged, from the filesystem otherwise.
+        @param directory: the directory to read
+        @return: a list of IndexEntry instances
+        '''
+        key = os.path.abspath(directory)
+        mtime = os.stat(directory).st_mtime_ns
+        with self._lock:
+            if not self._refresh:
+                row = self._db.execute('SELECT mtime FROM dirs WHERE path=?', (key,)).fetchone()
+                if row is not None and row[0] == mtime:
+                    self._hits += 1
+                    rows = self._db.execute(
+                        'SELECT name, mode, uid, gid, size, mtime FROM entries WHERE dir=?', (key,)).fetchall()
+                    return [IndexEntry(directory, *row) for row in rows]
+        rc = []
+        rows = []
+        with os.scandir(directory) as iterator:
+            for entry in iterator:
+                try:
+                    info = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                row = (entry.name, info.st_mode, info.st_uid, info.st_gid, info.st_size, info.st_mtime)
+                rows.append(row)
+                rc.append(IndexEntry(directory, *row))
+        self.store(key, mtime, rows)
+        return rc
+
+    def flush(self):
+        '''Writes the pending changes into the database.
+        '''
+        with self._lock:
+            if self._db is not None:
+                self._db.commit()
+                self._changedDirs = 0
+
+    def store(self, key, mtime, rows):
+        '''Stores the entries of a directory into the index.
+        The index data of removed subdirectories will be removed.
+        @param key: the absolute path of the directory
+        @param mtime: the modification time (in nanoseconds) of the directory
+        @param rows: a list of tuples (name, mode, uid, gid, size, mtime)
+        '''
+        with self._lock:
+            self._misses += 1
+            current = set(row[0] for row in rows if stat.S_ISDIR(row[1]))
+            for (name, mode) in self._db.execute('SELECT name, mode FROM entries WHERE dir=?', (key,)).fetchall():
+                if stat.S_ISDIR(mode) and name not in current:
+                    self._forget(key + os.sep + name)
+            self._db.execute('DELETE FROM entries WHERE dir=?', (key,))
+            self._db.executemany('INSERT INTO entries (dir, name, mode, uid, gid, size, mtime) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                 [(key,) + row for row in rows])
+            self._db.execute('INSERT OR REPLACE INTO dirs (path, mtime) VALUES (?, ?)', (key, mtime))
+            self._changedDirs += 1
+            if self._changedDirs >= self._commitInterval:
+                self._db.commit()
+                self._changedDirs = 0
+
+    def _forget(self, path):
+        '''Removes the index data of a directory tree.
+        Note: the caller must hold the lock.
+        @param path: the absolute path of the directory
+        '''
+        # all paths starting with path + '/': the character after '/' is '0'
+        for table, column in (('entries', 'dir'), ('dirs', 'path')):
+            self._db.execute('DELETE FROM {} WHERE {}=? OR ({} >= ? AND {} < ?)'.format(table, column, column, column),
+                             (path, path + '/', path + '0'))
+
+    def statistic(self):
+        '''Returns the info about the index usage.
+        @return: the infotext
+        '''
+        return 'index: dir(s) from index: {} dir(s) read: {}'.format(self._hits, self._misses)
+
+
+if __name__ == '__main__':
+    pass
@@ -8,10 +8,14 @@ import os.path
 import stat
 import re
 import datetime
+import collections
+import concurrent.futures
 
 #import base.FileHelper
 import base.Const
 import base.StringUtils
+import base.LinuxUtils
+import base.DirIndex
 
 
 class DirTraverser:
@@ -22,7 +26,7 @@ class DirTraverser:
                  reFileExcludes=None, reDirExcludes=None, fileType=None,
                  minDepth=0, maxDepth=None, fileMustReadable=False, fileMustWritable=False,
                  dirMustWritable=False, maxYields=None, youngerThan=None, olderThan=None,
-                 minSize=0, maxSize=None):
+                 minSize=0, maxSize=None, jobs=None, unordered=False, index=None):
         '''Constructor.
         @param directory: the start directory
         @param filePattern: the shell pattern of the files to find
@@ -40,6 +44,9 @@ class DirTraverser:
         @param olderThan: None or the modification file time must be lower or equal this
         @param minSize: None or only files larger than that will be found
         @param maxSize: None or only files smaller than that will be found
+        @param jobs: None or the number of threads reading the directories in parallel
+        @param unordered: True: (only if jobs > 1) the files are returned in the order of reading, not sorted by directory
+        @param index: None or a DirIndex instance: the directories are read from that index if unchanged
         '''
         self._directory = directory if directory != '' else '.'
         # +1: the preceeding slash
@@ -92,6 +99,12 @@ class DirTraverser:
         self._statInfo = None
         self._node = None
         self._isDir = False
+        self._jobs = jobs if jobs is not None else 1
+        self._unordered = unordered
+        self._parallelActive = False
+        self._readAhead = 0
+        self._index = index
+        self._indexActive = False
 
     def asList(self):
         '''Returns a list of all found files (filenames with relative path).
@@ -106,21 +119,59 @@ class DirTraverser:
         '''Implements a generator which returns the next specified file.
         Note: this method is recursive (for each directory in depth)
         The traversal mode: yields all files and directories and than enters the recursivly the directories
+        The directory is read with os.scandir(): the file type is taken from the directory entry,
+        the meta data (os.lstat()) is only fetched if a filter or the counters need it.
+        If jobs > 1 the directories are read by a thread pool, see _nextParallel().
+        If an index is given the unchanged directories are read from the index.
         @param directory: the directory to process
         @param depth: the current file tree depth
         @return: the next specified file (the filename with path relative to _directory)
         '''
-        self._countDirs += 1
+        if self._index is not None and not self._indexActive:
+            self._indexActive = True
+            try:
+                yield from self.next(directory, depth)
+            finally:
+                self._indexActive = False
+                self._index.flush()
+            return
+        if self._jobs > 1 and not self._parallelActive:
+            yield from self._nextParallel(directory, depth)
+            return
         dirs = []
+        if self._index is not None:
+            yield from self._nextOfEntries(directory, self._index.entries(directory), depth, dirs)
+        else:
+            with os.scandir(directory) as entries:
+                yield from self._nextOfEntries(directory, entries, depth, dirs)
+        if self._yields >= self._maxYields:
+            return
         directory2 = '' if directory == os.sep else directory
-        for node in os.listdir(directory):
+        for node in dirs:
             full = directory2 + os.sep + node
-            self._statInfo = statInfo = os.lstat(full)
-            self._isDir = stat.S_ISDIR(statInfo.st_mode)
+            yield from self.next(full, depth + 1)
+            if self._yields >= self._maxYields:
+                return
+
+    def _nextOfEntries(self, directory, entries, depth, dirs):
+        '''Implements a generator which returns the specified files of one directory.
+        @param directory: the directory containing the entries
+        @param entries: an iterable of os.DirEntry instances of that directory
+        @param depth: the current file tree depth
+        @param dirs: OUT: the subdirectories to process are appended to that list
+        @return: the next specified file (the filename with path relative to _directory)
+        '''
+        self._countDirs += 1
+        directory2 = '' if directory == os.sep else directory
+        for entry in entries:
+            node = entry.name
+            full = directory2 + os.sep + node
+            self._isDir = entry.is_dir(follow_symlinks=False)
             if self._isDir:
                 self._ignoredDirs += 1
                 if (self._reDirExcludes is not None and self._reDirExcludes.search(node)):
                     continue
+                statInfo = entry.stat(follow_symlinks=False)
                 if not base.LinuxUtils.isReadable(statInfo, self._euid, self._egid):
                     continue
                 elif self._dirMustWritable and not base.LinuxUtils.isReadable(statInfo, self._euid, self._egid):
@@ -136,7 +187,7 @@ class DirTraverser:
                 if not self._findDirs:
                     continue
                 if self._dirPattern == '*' or fnmatch.fnmatch(node, self._dirPattern):
-                    self._dirInfo = statInfo
+                    self._statInfo = self._dirInfo = statInfo
                     self._dirNode = node
                     self._dirFullName = full
                     self._dirRelativeName = full[self._lengthDirectory:]
@@ -147,31 +198,23 @@ class DirTraverser:
             else:
                 # tentative: because of "continue"
                 self._ignoredFiles += 1
-                if os.path.islink(full):
-                    if not self._findLinks:
-                        continue
-                elif not self._findFiles:
+                if not self._fileNameMatches(entry, depth):
                     continue
+                statInfo = entry.stat(follow_symlinks=False)
                 if statInfo.st_size < self._minSize or (self._maxSize is not None and statInfo.st_size > self._maxSize):
                     continue
                 if self._youngerThan is not None and statInfo.st_mtime < self._youngerThan:
                     continue
                 if self._olderThan is not None and statInfo.st_mtime > self._olderThan:
                     continue
-                if self._filePattern != '*' and not fnmatch.fnmatch(node, self._filePattern):
-                    continue
-                if self._reFileExcludes is not None and self._reFileExcludes.search(node):
-                    continue
                 if self._fileMustReadable and not base.LinuxUtils.isReadable(statInfo, self._euid, self._egid):
                     continue
                 if self._fileMustWritable and not base.LinuxUtils.isWritable(statInfo, self._euid, self._egid):
                     continue
-                if depth < self._minDepth:
-                    continue
                 self._ignoredFiles -= 1
                 self._statInfo = statInfo
                 self._countFiles += 1
-                self._bytesFiles += self._statInfo.st_size
+                self._bytesFiles += statInfo.st_size
                 self._fileFullName = full
                 self._node = node
                 self._fileRelativeName = full[self._lengthDirectory:]
@@ -179,9 +222,112 @@ class DirTraverser:
                 self._yields += 1
                 if self._yields >= self._maxYields:
                     return
+
+    def _fileNameMatches(self, entry, depth):
+        '''Tests the criteria of a non directory entry which does not need the meta data.
+        @param entry: the os.DirEntry instance to test
+        @param depth: the file tree depth of the entry
+        @return: True: the meta data must be inspected False: the entry is ignored
+        '''
+        if entry.is_symlink():
+            if not self._findLinks:
+                return False
+        elif not self._findFiles:
+            return False
+        if depth < self._minDepth:
+            return False
+        node = entry.name
+        if self._filePattern != '*' and not fnmatch.fnmatch(node, self._filePattern):
+            return False
+        if self._reFileExcludes is not None and self._reFileExcludes.search(node):
+            return False
+        return True
+
+    def _scanDirectory(self, directory, depth):
+        '''Reads a directory and fetches the meta data of the entries needing it.
+        Runs in a worker thread: the results are cached in the os.DirEntry instances.
+        @param directory: the directory to read
+        @param depth: the file tree depth of the entries
+        @return: the list of os.DirEntry instances
+        '''
+        if self._index is not None:
+            return self._index.entries(directory)
+        with os.scandir(directory) as iterator:
+            rc = list(iterator)
+        for entry in rc:
+            if entry.is_dir(follow_symlinks=False):
+                if self._reDirExcludes is None or not self._reDirExcludes.search(entry.name):
+                    entry.stat(follow_symlinks=False)
+            elif self._fileNameMatches(entry, depth):
+                entry.stat(follow_symlinks=False)
+        return rc
+
+    def _nextParallel(self, directory, depth):
+        '''Implements a generator which reads the directories with a thread pool.
+        The directories are read (and the needed meta data is fetched) in worker threads,
+        the filtering and the yield is done in the calling thread: the attributes like
+        _statInfo are valid for the yielded file.
+        Ordered mode: the same order as the serial traversal, the subdirectories are read ahead.
+        Unordered mode: the directories are processed in the order of their completion.
+        @param directory: the directory to process
+        @param depth: the current file tree depth
+        @return: the next specified file (the filename with path relative to _directory)
+        '''
+        self._parallelActive = True
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=self._jobs)
+        try:
+            first = pool.submit(self._scanDirectory, directory, depth)
+            if self._unordered:
+                pending = {first: (directory, depth)}
+                while pending:
+                    done = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)[0]
+                    for future in done:
+                        directory2, depth2 = pending.pop(future)
+                        dirs = []
+                        yield from self._nextOfEntries(directory2, future.result(), depth2, dirs)
+                        if self._yields >= self._maxYields:
+                            return
+                        prefix = '' if directory2 == os.sep else directory2
+                        for node in dirs:
+                            full = prefix + os.sep + node
+                            pending[pool.submit(self._scanDirectory, full, depth2 + 1)] = (full, depth2 + 1)
+            else:
+                self._readAhead = 1
+                yield from self._nextOrdered(pool, directory, first, depth)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+            self._parallelActive = False
+
+    def _nextOrdered(self, pool, directory, future, depth):
+        '''Implements the ordered mode of _nextParallel().
+        The subdirectories are read ahead in a bounded window: at most 4*jobs directories are read
+        (or read but not processed) at the same time, in the whole tree.
+        @param pool: the thread pool
+        @param directory: the directory to process
+        @param future: the future delivering the entries of directory
+        @param depth: the current file tree depth
+        @return: the next specified file (the filename with path relative to _directory)
+        '''
+        dirs = []
+        entries = future.result()
+        self._readAhead -= 1
+        yield from self._nextOfEntries(directory, entries, depth, dirs)
+        entries = None
+        if self._yields >= self._maxYields:
+            return
+        prefix = '' if directory == os.sep else directory
+        maxReadAhead = 4 * self._jobs
+        futures = collections.deque()
+        submitted = 0
         for node in dirs:
-            full = directory2 + os.sep + node
-            yield from self.next(full, depth + 1)
+            # the next subdirectory is always needed, the following only if the window is not full:
+            while submitted < len(dirs) and (not futures or self._readAhead < maxReadAhead):
+                futures.append(pool.submit(self._scanDirectory, prefix + os.sep + dirs[submitted], depth + 1))
+                submitted += 1
+                self._readAhead += 1
+            yield from self._nextOrdered(pool, prefix + os.sep + node, futures.popleft(), depth + 1)
+            if self._yields >= self._maxYields:
+                return
 
     def summary(self):
         '''Returns the info about the traverse process: count of files...
@@ -191,6 +337,8 @@ class DirTraverser:
             self._countDirs, self._countFiles,
             base.StringUtils.formatSize(self._bytesFiles),
             self._ignoredDirs, self._ignoredFiles)
+        if self._index is not None:
+            rc += '\n' + self._index.statistic()
         return rc
 
 
@@ -228,6 +376,18 @@ def addOptions(mode, usageInfo):
     option = base.UsageInfo.Option(
         'younger-than', 'y', 'only files younger than that will be found, e.g. --younger-than=2020.7.3-4:32', 'datetime')
     usageInfo.addModeOption(mode, option)
+    option = base.UsageInfo.Option(
+        'jobs', 'j', 'the number of threads reading the directories in parallel, e.g. --jobs=8', 'int', 1)
+    usageInfo.addModeOption(mode, option)
+    option = base.UsageInfo.Option(
+        'unordered', None, 'only with --jobs > 1: the files are returned in the order of reading (faster)', 'bool')
+    usageInfo.addModeOption(mode, option)
+    option = base.UsageInfo.Option(
+        'use-index', None, 'the meta data is taken from this index file (SQLite) if the directory is unchanged, e.g. --use-index=/var/cache/dirs.db')
+    usageInfo.addModeOption(mode, option)
+    option = base.UsageInfo.Option(
+        'refresh-index', None, 'only with --use-index: all directories are read and the index is updated', 'bool')
+    usageInfo.addModeOption(mode, option)
 
 
 def buildFromOptions(pattern, usageInfo, mode):
@@ -247,10 +407,14 @@ def buildFromOptions(pattern, usageInfo, mode):
         baseDir = os.path.dirname(pattern)
         pattern = os.path.basename(pattern)
     fileMustReadable = fileMustWritable = dirMustWritable = None
+    index = None
+    if v('use-index'):
+        index = base.DirIndex.DirIndex(v('use-index'), v('refresh-index'))
     rc = DirTraverser(baseDir, pattern, v('dir-pattern'), v('files-excluded'), v('dirs-excluded'),
                       v('file-type'), v('min-depth'), v('max-depth'),
                       fileMustReadable, fileMustWritable, dirMustWritable,
-                      v('max-yields'), v('younger-than'), v('older-than'), v('min-size'), v('max-size'))
+                      v('max-yields'), v('younger-than'), v('older-than'), v('min-size'), v('max-size'),
+                      v('jobs'), v('unordered'), index)
     return rc
 
 
@@ -6,6 +6,9 @@ Created: 2020.06.24
 
 import os
 import stat
+import errno
+import collections
+import concurrent.futures
 import datetime
 import time
 import shutil
@@ -14,16 +17,87 @@ import tarfile
 import zipfile
 import tempfile
 import fnmatch
+import heapq
 
 import base.Const
 import base.StringUtils
 import base.LinuxUtils
-import base.TextProcessor
 
 REG_EXPR_WILDCARDS = re.compile(r'[*?\[\]]')
 GLOBAL_LOGGER = None
 GLOBAL_UNIT_TEST_MODE = None
 CURRDIR_PREFIX = '.' + os.sep
+# copyDirectory(): the number of worker threads and the maximal number of bytes copied at the same time
+COPY_JOBS = 4
+COPY_IN_FLIGHT = 64 * 1024 * 1024
+# copyFileData(): the maximal number of bytes of one kernel call, the buffer size of the buffered copy
+COPY_CHUNK_SIZE = 0x40000000
+COPY_BUFFER_SIZE = 1024 * 1024
+# these errors of os.copy_file_range()/os.sendfile() mean "not supported"
+COPY_FALLBACK_ERRORS = (errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL, errno.EBADF, errno.ENOTSUP)
+# updateFileBlocks(): the unit of the comparison and of the rewriting
+DELTA_BLOCK_SIZE = 0x20000
+# headerClass(): the bytes of a text: TAB, LF, VT, FF, CR and all bytes from 0x20
+TEXT_BYTES = bytes(range(0x09, 0x0e)) + bytes(range(0x20, 0x100))
+DIGIT_BYTES = b'0123456789'
+
+
+class TopList:
+    '''Collects the entries with the greatest (or the smallest) keys, e.g. the largest files.
+    The entries are stored in a heap: the root is the worst entry, which is replaced by a better one.
+    '''
+
+    def __init__(self, size, smallest=False):
+        '''Constructor.
+        @param size: the maximal number of entries
+        @param smallest: True: the entries with the smallest keys are collected
+        '''
+        self._size = size
+        self._factor = -1 if smallest else 1
+        # entries: (key * factor, sequence number, item): the item is never compared
+        self._heap = []
+        self._count = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def accepts(self, key):
+        '''Tests whether an entry with a given key would be stored.
+        @param key: the key to test, e.g. a file size
+        @return: True: an entry with that key would be stored
+        '''
+        return self._size > 0 and (len(self._heap) < self._size or key * self._factor > self._heap[0][0])
+
+    def add(self, key, item):
+        '''Stores an entry if its key is one of the best.
+        @param key: the sort criterion, e.g. the file size
+        @param item: the data to store, e.g. the filename
+        @return: True: the entry has been stored
+        '''
+        value = key * self._factor
+        rc = True
+        self._count += 1
+        if len(self._heap) < self._size:
+            heapq.heappush(self._heap, (value, self._count, item))
+        elif self._size > 0 and value > self._heap[0][0]:
+            heapq.heapreplace(self._heap, (value, self._count, item))
+        else:
+            rc = False
+        return rc
+
+    def items(self):
+        '''Returns the stored entries, the best first.
+        @return: a list of tuples (key, item)
+        '''
+        return [(entry[0] * self._factor, entry[2]) for entry in sorted(self._heap, reverse=True)]
+
+    def resize(self, size):
+        '''Changes the maximal number of entries. If there are too many entries the worst are removed.
+        @param size: the new maximal number of entries
+        '''
+        self._size = size
+        while len(self._heap) > max(0, size):
+            heapq.heappop(self._heap)
 
 
 class DirInfo:
@@ -36,7 +110,7 @@ class DirInfo:
         @param maxYoungest: the maximal number of entries in self._youngest
         @param maxLargest: the maximal number of entries in self._largest
         @param maxOldest: the maximal number of entries in self._oldest
-        @param maxLargest: the maximal number of entries in self._smallest
+        @param maxSmallest: the maximal number of entries in self._smallest
         @param minSize: the minimum size of the entries in self._smallest
         @param dirsOnly: True: only directories will be processed
         @param filesOnly: True: only files (not dirs) will be processed
@@ -49,26 +123,292 @@ class DirInfo:
         self._filePattern = None
         self._ignoredDirs = 0
         self._ignoredFiles = 0
-        self._youngest = []
-        self._largest = []
-        self._smallest = []
-        self._oldest = []
-        self._maxYoungest = maxYoungest
-        self._maxLargest = maxLargest
-        self._maxLargest = maxOldest
-        self._maxSmallest = maxSmallest
+        # TopList instances with the filenames as items:
+        self._youngest = TopList(maxYoungest)
+        self._largest = TopList(maxLargest)
+        self._smallest = TopList(maxSmallest, True)
+        self._oldest = TopList(maxOldest, True)
         self._minSize = minSize
-        self._timeYoungest = 0
-        self._timeOldest = 0
-        self._sizeLargest = 0
         self._dirsOnly = dirsOnly
         self._filesOnly = filesOnly
         self._trace = trace
         self._nextTracePoint = trace
-        self._maxOldest = None
         self._maxDepth = None
 
 
+class FileCopier:
+    '''Copies files with a pool of worker threads.
+    The sum of the sizes of the files being copied at the same time is limited.
+    Errors are reported (with _error()) in the calling thread.
+    '''
+
+    def __init__(self, jobs=COPY_JOBS, maxInFlight=COPY_IN_FLIGHT):
+        '''Constructor.
+        @param jobs: the number of threads copying the files: 1: the files are copied in the calling thread
+        @param maxInFlight: the maximal sum of the file sizes (in bytes) of the files being copied at the same time
+        '''
+        self._jobs = jobs
+        self._maxInFlight = maxInFlight
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=jobs) if jobs > 1 else None
+        # future -> (target, size, onDone):
+        self._pending = {}
+        self._inFlight = 0
+
+    def copy(self, source, target, size, function=None, args=(), onDone=None):
+        '''Copies a file, normally in a worker thread.
+        @param source: the file to copy
+        @param target: the copy
+        @param size: the file size: used for the limit of the bytes in flight
+        @param function: None: copyFileData() otherwise: the copy function: function(source, target, *args)
+        @param args: additional arguments of function
+        @param onDone: None or a function called in the calling thread with the result of function
+        '''
+        function = copyFileData if function is None else function
+        if self._pool is None:
+            try:
+                rc = function(source, target, *args)
+                if onDone is not None:
+                    onDone(rc)
+            except OSError as exc:
+                _error('cannot copy {}: {}'.format(target, str(exc)))
+            return
+        # a file larger than the budget is copied alone:
+        while self._pending and (self._inFlight + size > self._maxInFlight or len(self._pending) >= 4 * self._jobs):
+            self._collect(concurrent.futures.FIRST_COMPLETED)
+        self._pending[self._pool.submit(function, source, target, *args)] = (target, size, onDone)
+        self._inFlight += size
+
+    def finish(self):
+        '''Waits for the pending copies and stops the worker threads.
+        '''
+        if self._pool is not None:
+            try:
+                if self._pending:
+                    self._collect(concurrent.futures.ALL_COMPLETED)
+            finally:
+                self._pool.shutdown()
+                self._pool = None
+
+    def _collect(self, returnWhen):
+        '''Waits for finished copies and reports their errors.
+        @param returnWhen: concurrent.futures.FIRST_COMPLETED or concurrent.futures.ALL_COMPLETED
+        '''
+        done = concurrent.futures.wait(self._pending, return_when=returnWhen)[0]
+        for future in done:
+            target, size, onDone = self._pending.pop(future)
+            self._inFlight -= size
+            exc = future.exception()
+            if exc is not None:
+                _error('cannot copy {}: {}'.format(target, str(exc)))
+            elif onDone is not None:
+                onDone(future.result())
+
+
+class CopyPlan:
+    '''The file operations (mkdir, copy, symlink, replace) of a set of copy rules, see copyByRules().
+    Each target is handled only once, each source directory is read only once.
+    The copies are done by a FileCopier.
+    '''
+
+    def __init__(self):
+        '''Constructor.
+        '''
+        # each item: [kind, target, source, data]
+        self._operations = []
+        # target -> operation
+        self._targets = {}
+        # directory -> list of (node, isDir, isLink)
+        self._listings = {}
+        # option value -> (what, with, value) or None (syntax error)
+        self._replacements = {}
+        # the existing target directories (not created by the plan)
+        self._existingDirs = set()
+
+    def add(self, kind, target, source=None, data=None):
+        '''Adds an operation. The missing parent directories of the target are added too.
+        @param kind: 'mkdir', 'copy', 'symlink' or 'replace'
+        @param target: the file/directory to create
+        @param source: None or the source file/directory (a directory: the attributes are copied)
+        @param data: 'mkdir': None or the access rights 'symlink': the link content
+            'replace': the tuple (what, with, value), see replacement()
+        '''
+        operation = self._targets.get(target)
+        if operation is None:
+            parent = os.path.dirname(target)
+            if parent != '' and parent not in self._targets and parent not in self._existingDirs:
+                if os.path.isdir(parent):
+                    self._existingDirs.add(parent)
+                else:
+                    # like ensureDirectory():
+                    self.add('mkdir', parent, None, 0o777)
+            operation = [kind, target, source, data]
+            self._targets[target] = operation
+            self._operations.append(operation)
+        elif operation[0] != kind and (operation[0] not in ('copy', 'replace') or kind not in ('copy', 'replace')):
+            _error('conflicting operations for {}: {} and {}'.format(target, operation[0], kind))
+        elif kind != 'mkdir' or source is not None:
+            # the last rule wins:
+            operation[0] = kind
+            operation[2] = source
+            operation[3] = data
+
+    def addRule(self, fnSource, fnTarget, options, depthRelPath):
+        '''Adds the operations of a rule from copyByRules().
+        @param fnSource: the source file/directory, may contain wildcards in the last node
+        @param fnTarget: the target
+        @param options: a dictionary with (option_name, option_value) pairs
+        @param depthRelPath: the depth of the tree from the base directory
+        '''
+        parentSource = os.path.dirname(fnSource)
+        pathSource = parentSource + os.sep if parentSource != '' else ''
+        parentTarget = os.path.dirname(fnTarget)
+        pathTarget = parentTarget + os.sep if parentTarget != '' else ''
+        nodeSource = os.path.basename(fnSource)
+        if hasWildcards(nodeSource):
+            reExcept = None if 'except' not in options else re.compile(
+                options['except'])
+            for node, isDir, isLink in self.listDirectory('.' if parentSource == '' else parentSource):
+                full = pathSource + node
+                if not fnmatch.fnmatch(node, nodeSource):
+                    _log('ignoring {}'.format(full), base.Const.LEVEL_DETAIL)
+                elif reExcept is not None and reExcept.match(node) is not None:
+                    _log('ignoring {}'.format(full), base.Const.LEVEL_DETAIL)
+                elif 'dirsonly' in options and not isDir:
+                    _log('ignoring non directory {}'.format(full), base.Const.LEVEL_DETAIL)
+                elif 'filesonly' in options and isDir:
+                    _log('ignoring directory {}'.format(full), base.Const.LEVEL_DETAIL)
+                else:
+                    self._addNode(full, pathTarget + node, options, depthRelPath, isDir, isLink)
+        else:
+            self._addNode(fnSource, fnTarget, options, depthRelPath, os.path.isdir(fnSource),
+                          os.path.islink(fnSource))
+
+    def addTree(self, source, target):
+        '''Adds the operations for copying a directory tree (like shutil.copytree() without symlinks).
+        @param source: the source directory
+        @param target: the target directory
+        '''
+        self.add('mkdir', target, source)
+        for node, isDir, isLink in self.listDirectory(source):
+            if isDir:
+                self.addTree(source + os.sep + node, target + os.sep + node)
+            else:
+                self.add('copy', target + os.sep + node, source + os.sep + node)
+
+    def execute(self, jobs=COPY_JOBS):
+        '''Executes the operations: directories and symlinks in the calling thread, the files in a FileCopier.
+        @param jobs: the number of threads copying the files
+        '''
+        for kind, target, source, data in self._operations:
+            if kind == 'mkdir':
+                _log('creating ' + target, base.Const.LEVEL_DETAIL)
+                try:
+                    os.makedirs(target, exist_ok=True)
+                    if data is not None:
+                        os.chmod(target, data)
+                except OSError as exc:
+                    _error('cannot create dir {}: {}'.format(target, str(exc)))
+        for kind, target, source, data in self._operations:
+            if kind == 'symlink':
+                try:
+                    os.symlink(data, target)
+                except OSError as exc:
+                    _error('cannot create a symlink: {} -> {}: {}'.format(data, target, str(exc)))
+        copier = FileCopier(jobs)
+        try:
+            for kind, target, source, data in self._operations:
+                if kind == 'copy':
+                    _log('copying {} => {}'.format(source, target), base.Const.LEVEL_DETAIL)
+                    copier.copy(source, target, self._size(source))
+                elif kind == 'replace':
+                    message = '{{}} replacement(s) [{}] in {} => {}'.format(data[2], source, target)
+                    copier.copy(source, target, self._size(source), replaceInFile, data[0:2],
+                                lambda hits, message=message: _log(message.format(hits), base.Const.LEVEL_DETAIL))
+        finally:
+            copier.finish()
+        # the files inside a directory change its modification time: inner directories first
+        for kind, target, source, data in reversed(self._operations):
+            if kind == 'mkdir' and source is not None:
+                try:
+                    shutil.copystat(source, target)
+                except OSError as exc:
+                    _error('cannot set the attributes of {}: {}'.format(target, str(exc)))
+
+    def listDirectory(self, directory):
+        '''Returns the entries of a directory. The directory is read only once.
+        @param directory: the directory to read
+        @return: a list of tuples (node, isDir, isLink), isDir follows symbolic links
+        '''
+        rc = self._listings.get(directory)
+        if rc is None:
+            with os.scandir(directory) as iterator:
+                rc = [(entry.name, entry.is_dir(), entry.is_symlink()) for entry in iterator]
+            self._listings[directory] = rc
+        return rc
+
+    def replacement(self, value):
+        '''Returns the compiled value of a replace option, e.g. "/php/php>/". Each value is compiled only once.
+        @param value: the option value: <sep>what<sep>with<sep>
+        @return: None: syntax error otherwise: a tuple (what, with, value)
+        '''
+        if value in self._replacements:
+            return self._replacements[value]
+        rc = None
+        if value == '' or value.count(value[0]) != 3:
+            _error('wrong syntax in replace option: ' + value)
+        else:
+            parts = value[1:].split(value[0], 2)
+            rc = (parts[0], parts[1], value)
+        self._replacements[value] = rc
+        return rc
+
+    def _addNode(self, fnSource, fnTarget, options, depthRelPath, isDir, isLink):
+        '''Adds the operations of a rule for one (existing) source file/directory.
+        @param fnSource: the source file/directory
+        @param fnTarget: the target
+        @param options: a dictionary with (option_name, option_value) pairs
+        @param depthRelPath: the depth of the tree from the base directory
+        @param isDir: True: fnSource is a directory (or a link to a directory)
+        @param isLink: True: fnSource is a symbolic link
+        '''
+        if 'symlink' in options:
+            depth = fnSource.count(os.sep) + 1
+            partsSource = fnSource.split(os.sep)
+            relPath = os.sep.join(partsSource[depth - depthRelPath - 1:])
+            linkSource = '../' * \
+                (1 + depthRelPath) + \
+                partsSource[depth - depthRelPath - 2] + os.sep + relPath
+            self.add('symlink', fnTarget, None, linkSource)
+        elif 'dirsonly' in options and not isDir:
+            _log('ignoring non directory {}'.format(fnSource), base.Const.LEVEL_DETAIL)
+        elif 'filesonly' in options and isDir:
+            _log('ignoring directory {}'.format(fnSource), base.Const.LEVEL_DETAIL)
+        elif isDir:
+            if 'recursive' in options:
+                self.addTree(fnSource, fnTarget)
+            else:
+                self.add('mkdir', fnTarget, fnSource)
+        elif 'replace' in options:
+            replacement = self.replacement(options['replace'])
+            if replacement is not None:
+                self.add('replace', fnTarget, fnSource, replacement)
+        elif isLink:
+            # like shutil.copy2(follow_symlinks=False):
+            self.add('symlink', fnTarget, None, os.readlink(fnSource))
+        else:
+            self.add('copy', fnTarget, fnSource)
+
+    def _size(self, filename):
+        '''Returns the size of a file.
+        @param filename: the file to inspect
+        @return: the size in bytes, 0 if the file is not readable
+        '''
+        try:
+            return os.stat(filename).st_size
+        except OSError:
+            return 0
+
+
 def _error(message):
     '''Prints an error message.
     @param message: error message
@@ -186,48 +526,173 @@ def createFileTree(files, baseDirectory):
                     setModified(full, None, date)
 
 
-def copyDirectory(source, target, option=None, verboseLevel=0):
+def copyDirectory(source, target, option=None, verboseLevel=0, jobs=COPY_JOBS, maxInFlight=COPY_IN_FLIGHT,
+                  checksum=False):
     '''Copies all files (and dirs) from source to target directory.
+    The directory tree is walked in the calling thread, the file data is copied by a pool of worker threads.
     @param source: the base source directory
     @param target: the base target directoy()
-    @param option: None, 'clear' or 'update'
+    @param option: None, 'clear', 'update' or 'delta'
         'clear': all files (and subdirs) of target will be deleted
         'update': only younger or not existing files will be copied False: all files will be copied
+        'delta': like 'update', but a file with another size or a younger modification time is not copied:
+            only the changed blocks are rewritten in the existing target file
+    @param verboseLevel: the logging is done only if this level is at least base.Const.LEVEL_DETAIL
+    @param jobs: the number of threads copying the files: 1: the files are copied in the calling thread
+    @param maxInFlight: the maximal sum of the file sizes (in bytes) of the files being copied at the same time
+    @param checksum: only with option 'delta': True: files with the same size and modification time are compared
+        block by block too
     '''
+    update = option in ('update', 'delta')
     if option == 'clear':
         if verboseLevel >= base.Const.LEVEL_DETAIL:
             _log('clearing ' + target, verboseLevel)
         clearDirectory(target)
-    for node in os.listdir(source):
-        src = source + os.sep + node
-        trg = target + os.sep + node
-        if os.path.islink(src):
-            if not option == 'update' or not os.path.exists(trg):
-                ref = os.readlink(src)
-                if verboseLevel >= base.Const.LEVEL_DETAIL:
-                    _log('symlink: {} [{}]'.format(trg, ref), verboseLevel)
-                try:
-                    os.symlink(ref, trg)
-                except OSError as exc:
-                    _error('cannot create a symlink: {} -> {}'.format(ref, trg))
-        elif os.path.isdir(src):
-            if option != 'update' or not os.path.exists(trg):
-                if verboseLevel >= base.Const.LEVEL_DETAIL:
-                    _log('directory: {} -> {}'.format(src, trg), verboseLevel)
-                shutil.copytree(src, trg, True)
+    copier = FileCopier(jobs, maxInFlight)
+    createdDirs = []
+
+    def copyTree(source, target, complete):
+        # complete: the target directory has been created by us: no need to inspect the target
+        with os.scandir(source) as iterator:
+            entries = list(iterator)
+        for entry in entries:
+            src = entry.path
+            trg = target + os.sep + entry.name
+            if entry.is_symlink():
+                if complete or not update or not os.path.exists(trg):
+                    ref = os.readlink(src)
+                    if verboseLevel >= base.Const.LEVEL_DETAIL:
+                        _log('symlink: {} [{}]'.format(trg, ref), verboseLevel)
+                    try:
+                        os.symlink(ref, trg)
+                    except OSError:
+                        _error('cannot create a symlink: {} -> {}'.format(ref, trg))
+            elif entry.is_dir():
+                created = complete or not os.path.exists(trg)
+                if created:
+                    if verboseLevel >= base.Const.LEVEL_DETAIL:
+                        _log('directory: {} -> {}'.format(src, trg), verboseLevel)
+                    try:
+                        os.mkdir(trg)
+                    except OSError as exc:
+                        _error('cannot create directory {}: {}'.format(trg, str(exc)))
+                        continue
+                    createdDirs.append((src, trg))
+                copyTree(src, trg, created)
             else:
-                copyDirectory(src, trg, option)
-        else:
-            if not os.path.exists(trg) or option == 'update' and os.path.getmtime(src) > os.path.getmtime(trg):
-                try:
+                info = entry.stat(follow_symlinks=False)
+                if not stat.S_ISREG(info.st_mode):
+                    continue
+                doCopy = complete
+                function = copyFileData
+                if not doCopy:
+                    try:
+                        infoTarget = os.stat(trg)
+                    except FileNotFoundError:
+                        doCopy = True
+                    else:
+                        doCopy = update and info.st_mtime > infoTarget.st_mtime
+                        # a younger target is never touched:
+                        if (option == 'delta' and info.st_mtime >= infoTarget.st_mtime
+                                and (doCopy or checksum or info.st_size != infoTarget.st_size)):
+                            doCopy = stat.S_ISREG(infoTarget.st_mode)
+                            function = updateFileBlocks
+                if doCopy:
                     if verboseLevel >= base.Const.LEVEL_DETAIL:
                         _log('{} -> {}'.format(src, trg), verboseLevel)
-                    shutil.copy2(src, trg)
-                except OSError as exc:
-                    _error('cannot copy {}: {}'.format(trg, str(exc)))
+                    copier.copy(src, trg, info.st_size, function)
+
+    try:
+        copyTree(source, target, False)
+    finally:
+        copier.finish()
+    # the files inside the directory change its modification time: set it at the end, inner directories first:
+    for src, trg in reversed(createdDirs):
+        try:
+            shutil.copystat(src, trg)
+        except OSError as exc:
+            _error('cannot set the attributes of {}: {}'.format(trg, str(exc)))
+
+
+def copyFileData(source, target, bufferSize=COPY_BUFFER_SIZE):
+    '''Copies a file with its meta data (like shutil.copy2()).
+    The data is copied inside the kernel if possible (os.copy_file_range(), os.sendfile()),
+    otherwise with a buffer in user space.
+    @param source: the file to copy
+    @param target: the copy
+    @param bufferSize: the buffer size of the buffered copy
+    @return: the used method: 'copy_file_range', 'sendfile' or 'buffered'
+    '''
+    rc = 'buffered'
+    # unbuffered: all methods use the file positions of the operating system
+    with open(source, 'rb', buffering=0) as fpSource, open(target, 'wb', buffering=0) as fpTarget:
+        fdSource = fpSource.fileno()
+        fdTarget = fpTarget.fileno()
+        for method in ('copy_file_range', 'sendfile'):
+            if not hasattr(os, method):
+                continue
+            try:
+                copied = 0
+                while True:
+                    if method == 'copy_file_range':
+                        count = os.copy_file_range(fdSource, fdTarget, COPY_CHUNK_SIZE)
+                    else:
+                        count = os.sendfile(fdTarget, fdSource, None, COPY_CHUNK_SIZE)
+                    if count <= 0:
+                        break
+                    copied += count
+                # some pseudo filesystems report 0 bytes for non empty files:
+                if copied > 0 or os.fstat(fdSource).st_size == 0:
+                    rc = method
+                    break
+            except OSError as exc:
+                # not supported by the filesystem(s): the next method continues at the current position
+                if exc.errno not in COPY_FALLBACK_ERRORS:
+                    raise
+        if rc == 'buffered':
+            shutil.copyfileobj(fpSource, fpTarget, bufferSize)
+    shutil.copystat(source, target)
+    return rc
 
 
-def copyByRules(rules, baseSource, baseTarget):
+def updateFileBlocks(source, target, blockSize=DELTA_BLOCK_SIZE):
+    '''Makes a target file equal to the source by rewriting only the changed blocks in place.
+    Then the meta data is copied (like shutil.copy2()).
+    @param source: the file to copy
+    @param target: the existing copy of an older version of source
+    @param blockSize: the size of the compared (and rewritten) blocks
+    @return: the number of rewritten bytes
+    '''
+    rc = 0
+    bufferSource = bytearray(blockSize)
+    bufferTarget = bytearray(blockSize)
+    with open(source, 'rb', buffering=0) as fpSource, open(target, 'r+b', buffering=0) as fpTarget:
+        fdTarget = fpTarget.fileno()
+        offset = 0
+        while True:
+            length = fpSource.readinto(bufferSource)
+            if not length:
+                break
+            lengthTarget = fpTarget.readinto(bufferTarget)
+            # comparing bytearrays is a memcmp(), memoryview slices are compared item by item:
+            if length == blockSize:
+                changed = length != lengthTarget or bufferSource != bufferTarget
+                block = bufferSource
+            else:
+                block = bufferSource[0:length]
+                changed = length != lengthTarget or block != bufferTarget[0:length]
+            if changed:
+                # the file position is not changed by pwrite():
+                os.pwrite(fdTarget, block, offset)
+                rc += length
+            offset += length
+        if os.fstat(fdTarget).st_size != offset:
+            os.ftruncate(fdTarget, offset)
+    shutil.copystat(source, target)
+    return rc
+
+
+def copyByRules(rules, baseSource, baseTarget, jobs=COPY_JOBS):
     '''Copies directories/files from a given directory tree controlled by a list of rules.
     The rules is a list of lines.
     Each line contains a copy rule: a source file/file pattern followed by a target name and options.
@@ -242,9 +707,11 @@ def copyByRules(rules, baseSource, baseTarget):
     tools/run.template:tools/run.sh
         copies the file tools/run.template and change the name to run.sh
     <options>: symlink filesonly dirsonly "except <rexpr-pattern>" "replace<sep>what<sep>with<sep>"
+    All rules are resolved into a CopyPlan first, then the plan is executed.
     @param rules: a list of rules for copying
     @param baseSource the directory tree to copy
     @param baseTarget the target directory. Will be created if it does not exist
+    @param jobs: the number of threads copying the files
     '''
     if os.path.dirname(baseSource) != os.path.dirname(baseTarget):
         _error('source and target does not have the same parent. Not supported')
@@ -253,6 +720,7 @@ def copyByRules(rules, baseSource, baseTarget):
     else:
         ensureDirectory(baseTarget)
         clearDirectory(baseTarget)
+        plan = CopyPlan()
         lineNo = 0
         for rule in rules:
             lineNo += 1
@@ -261,9 +729,7 @@ def copyByRules(rules, baseSource, baseTarget):
                 continue
             if rule.startswith(':'):
                 target = rule[1:]
-                full = baseTarget + os.sep + target
-                _log('create ' + full, base.Const.LEVEL_DETAIL)
-                os.makedirs(full)
+                plan.add('mkdir', baseTarget + os.sep + target)
                 continue
             parts = rule.split(':')
             source = parts[0].lstrip(os.sep)
@@ -285,16 +751,13 @@ def copyByRules(rules, baseSource, baseTarget):
                         optParts) < 2 else optParts[1]
                     if re.match(r'^dirsonly|except|filesonly|recursive|replace|symlink$', optParts[0]) is None:
                         _error('unknown option: ' + opt)
-                    if optParts[0] == 'replace':
-                        value = optParts[1]
-                        if value == '' or value.count(value[0]) != 3:
-                            _error('wrong syntax in replace option: ' + value)
-                            del opts['replace']
+                    if optParts[0] == 'replace' and plan.replacement(optParts[1]) is None:
+                        del opts['replace']
             else:
                 _error('line {}: too many ":" in: {}'.format(lineNo, rule))
                 continue
-            copyByRule(full, baseTarget + os.sep +
-                       target, opts, source.count(os.sep))
+            plan.addRule(full, baseTarget + os.sep + target, opts, source.count(os.sep))
+        plan.execute(jobs)
 
 
 def copyByRule(fnSource, fnTarget, options, depthRelPath):
@@ -304,77 +767,31 @@ def copyByRule(fnSource, fnTarget, options, depthRelPath):
     @param options: a dictionary with (option_name, option_value) pairs
     @param depthRelPath: the depth of the tree from the base directory
     '''
-    parentSource = os.path.dirname(fnSource)
-    pathSource = parentSource + os.sep if parentSource != '' else ''
-    parentTarget = os.path.dirname(fnTarget)
-    pathTarget = parentTarget + os.sep if parentTarget != '' else ''
-    if parentTarget != '':
-        ensureDirectory(parentTarget)
-    nodeSource = os.path.basename(fnSource)
-    if hasWildcards(nodeSource):
-        reExcept = None if 'except' not in options else re.compile(
-            options['except'])
-        for node in os.listdir('.' if parentSource == '' else parentSource):
-            full = pathSource + node
-            if not fnmatch.fnmatch(node, nodeSource):
-                _log('ignoring {}'.format(full), base.Const.LEVEL_DETAIL)
-                continue
-            if reExcept is not None and reExcept.match(node) is not None:
-                _log('ignoring {}'.format(full), base.Const.LEVEL_DETAIL)
-                continue
-            isDir = os.path.isdir(full)
-            if 'dirsonly' in options and not isDir:
-                _log('ignoring non directory {}'.format(
-                    full), base.Const.LEVEL_DETAIL)
-                continue
-            if 'filesonly' in options and isDir:
-                _log('ignoring directory {}'.format(
-                    full), base.Const.LEVEL_DETAIL)
-                continue
-            copyByRule(pathSource + node, pathTarget +
-                       node, options, depthRelPath)
+    plan = CopyPlan()
+    plan.addRule(fnSource, fnTarget, options, depthRelPath)
+    plan.execute()
+
+
+def replaceInFile(source, target, what, replacement):
+    '''Copies a text file and replaces all occurrences of a string (not a regular expression).
+    @param source: the file to copy
+    @param target: the copy
+    @param what: the string to replace
+    @param replacement: the replacement of what
+    @return: the number of replacements
+    '''
+    text = base.StringUtils.fromFile(source)
+    if what == '':
+        # the empty string is found in each line:
+        lines = text.split('\n')
+        rc = sum(len(line) + 1 for line in lines)
+        text = '\n'.join(line.replace(what, replacement) for line in lines)
     else:
-        if 'symlink' in options:
-            depth = fnSource.count(os.sep) + 1
-            partsSource = fnSource.split(os.sep)
-            relPath = os.sep.join(partsSource[depth - depthRelPath - 1:])
-            linkSource = '../' * \
-                (1 + depthRelPath) + \
-                partsSource[depth - depthRelPath - 2] + os.sep + relPath
-            os.symlink(linkSource, fnTarget)
-        else:
-            if 'dirsonly' in options and not os.path.isdir(fnSource):
-                _log('ignoring non directory {}'.format(
-                    fnSource), base.Const.LEVEL_DETAIL)
-            elif 'filesonly' in options and os.path.isdir(fnSource):
-                _log('ignoring directory {}'.format(
-                    fnSource), base.Const.LEVEL_DETAIL)
-            else:
-                if os.path.isdir(fnSource):
-                    if 'recursive' in options:
-                        shutil.copytree(fnSource, fnTarget)
-                    else:
-                        _log('creating ' + fnTarget, base.Const.LEVEL_DETAIL)
-                        os.makedirs(fnTarget)
-                        shutil.copystat(fnSource, fnTarget)
-                elif 'replace' in options:
-                    global GLOBAL_LOGGER
-                    processor = base.TextProcessor.TextProcessor(GLOBAL_LOGGER)
-                    processor.readFile(fnSource, mustExists=True)
-                    value = options['replace']
-                    if value == '' or value.count(value[0]) != 3:
-                        _error('wrong syntax in replace option: ' + value)
-                    else:
-                        parts = value[1:].split(value[0], 2)
-                        hits = processor.replace(
-                            parts[0], parts[1], noRegExpr=True, countHits=True)
-                        _log('{} replacement(s) [{}] in {} => {}'.format(hits, value, fnSource,
-                                                                         fnTarget), base.Const.LEVEL_DETAIL)
-                        processor.writeFile(fnTarget)
-                else:
-                    _log('copying {} => {}'.format(
-                        fnSource, fnTarget), base.Const.LEVEL_DETAIL)
-                    shutil.copy2(fnSource, fnTarget, follow_symlinks=False)
+        rc = text.count(what)
+        if rc > 0:
+            text = text.replace(what, replacement)
+    base.StringUtils.toFile(target, text)
+    return rc
 
 
 def copyIfExists(source, target):
@@ -440,16 +857,24 @@ def directoryInfo(path, filePattern=None, dirPattern=None, maxDepth=-1, fileInfo
     @param filePattern: None or a regular expression (as text) describing the file names to inspect
     @param dirPattern: None or a regular expression (as text) describing the directory names to inspect
     @param maxDepth: maximal depth of recursion. < 0: unlimited 0: only the start directory
-    @param dirInfo: None or a DirectoryInfo instance which will be completed
-    @param maxYoungest: the maximal number of entries in DirInfo._youngest[]
-    @param maxLargest: the maximal number of entries in DirInfo._largest[]
-    @param maxSmallest: the maximal number of entries in DirInfo._smallest[]
-    @param minSize: the minimum size of the entries in DirInfo._smallest[]
+    @param fileInfo: None or a DirInfo instance which will be completed
+    @param maxYoungest: the maximal number of entries in DirInfo._youngest
+    @param maxLargest: the maximal number of entries in DirInfo._largest
+    @param maxOldest: the maximal number of entries in DirInfo._oldest
+    @param maxSmallest: the maximal number of entries in DirInfo._smallest
+    @param minSize: the minimum size of the entries in DirInfo._smallest
     @param dirsOnly: only directories will be part of the result
     @param filessOnly: only files (not directories) will be part of the result
     @param trace: if > 0: a statistic is printed if this amount of nodes (files or nodes) is processed
     @return: a DirInfo instance
     '''
+    def collect(topList, key, full, stats, fileInfo):
+        if topList.accepts(key):
+            if not base.LinuxUtils.isReadable(stats, euid, egid):
+                fileInfo._ignoredFiles += 1
+            else:
+                topList.add(key, full)
+
     def infoOneDir(path, depth, fileInfo):
         def showStatistic(info):
             print('{}: dirs: {} files: {} ignored dirs: {} ignored files: {}'.format(
@@ -479,34 +904,8 @@ def directoryInfo(path, filePattern=None, dirPattern=None, maxDepth=-1, fileInfo
             isDir = stat.S_ISDIR(stats.st_mode)
             if isDir:
                 if not fileInfo._filesOnly:
-                    length = len(fileInfo._youngest)
-                    if (fileInfo._maxYoungest > 0
-                        and (length < fileInfo._maxYoungest
-                             or stats.st_mtime > fileInfo._timeYoungest)):
-                        if not base.LinuxUtils.isReadable(stats, euid, egid):
-                            fileInfo._ignoredFiles += 1
-                        else:
-                            if length >= fileInfo._maxYoungest:
-                                del fileInfo._youngest[0]
-                            fileInfo._youngest.append(
-                                str(stats.st_mtime) + ':' + path + os.sep + node)
-                            fileInfo._youngest.sort(
-                                key=lambda x: float(x.split(':')[0]))
-                            fileInfo._timeYoungest = float(
-                                fileInfo._youngest[0].split(':')[0])
-                    length = len(fileInfo._oldest)
-                    if fileInfo._maxOldest > 0 and (length < fileInfo._maxOldest or stats.st_mtime < fileInfo._timeOldest):
-                        if not base.LinuxUtils.isReadable(stats, euid, egid):
-                            fileInfo._ignoredFiles += 1
-                        else:
-                            if length >= fileInfo._maxOldest:
-                                del fileInfo._oldest[-1]
-                            fileInfo._oldest.insert(
-                                0, str(stats.st_mtime) + ':' + path + os.sep + node)
-                            fileInfo._oldest.sort(
-                                key=lambda x: float(x.split(':')[0]))
-                            fileInfo._timeOldest = float(
-                                fileInfo._oldest[-1].split(':')[0])
+                    collect(fileInfo._youngest, stats.st_mtime, full, stats, fileInfo)
+                    collect(fileInfo._oldest, stats.st_mtime, full, stats, fileInfo)
                 if ((fileInfo._dirPattern is None or fileInfo._dirPattern.match(node) is None)
                         and (maxDepth is None or maxDepth < 0 or depth < maxDepth)):
                     infoOneDir(path + os.sep + node, depth + 1, fileInfo)
@@ -519,63 +918,11 @@ def directoryInfo(path, filePattern=None, dirPattern=None, maxDepth=-1, fileInfo
                 if (fileInfo._filePattern is None or fileInfo._filePattern.match(node) is not None):
                     fileInfo._fileSizes += stats.st_size
                     fileInfo._fileCount += 1
-                    length = len(fileInfo._largest)
-                    if (fileInfo._maxLargest > 0 and (length < fileInfo._maxLargest
-                                                      or stats.st_size > fileInfo._sizeLargest)):
-                        if not base.LinuxUtils.isReadable(stats, euid, egid):
-                            fileInfo._ignoredFiles += 1
-                        else:
-                            if length >= fileInfo._maxLargest:
-                                del fileInfo._largest[0]
-                            fileInfo._largest.append(
-                                str(stats.st_size) + ':' + path + os.sep + node)
-                            fileInfo._largest.sort(
-                                key=lambda x: float(x.split(':')[0]))
-                            fileInfo._sizeLargest = float(
-                                fileInfo._largest[-1].split(':')[0])
-                    length = len(fileInfo._smallest)
-                    if (fileInfo._maxSmallest > 0 and (stats.st_size >= fileInfo._minSize
-                                                       and (length < fileInfo._maxSmallest
-                                                            or stats.st_size > fileInfo._sizeSmallest))):
-                        if not base.LinuxUtils.isReadable(stats, euid, egid):
-                            fileInfo._ignoredFiles += 1
-                        else:
-                            if length >= fileInfo._maxSmallest:
-                                del fileInfo._smallest[-1]
-                            fileInfo._smallest.insert(0,
-                                                      str(stats.st_size) + ':' + path + os.sep + node)
-                            fileInfo._smallest.sort(
-                                key=lambda x: float(x.split(':')[0]))
-                            fileInfo._sizeSmallest = float(
-                                fileInfo._smallest[-1].split(':')[0])
-                    length = len(fileInfo._youngest)
-                    if (fileInfo._maxYoungest > 0 and (length < fileInfo._maxYoungest
-                                                       or stats.st_mtime > fileInfo._timeYoungest)):
-                        if not base.LinuxUtils.isReadable(stats, euid, egid):
-                            fileInfo._ignoredFiles += 1
-                        else:
-                            if length >= fileInfo._maxYoungest:
-                                del fileInfo._youngest[0]
-                            fileInfo._youngest.append(
-                                str(stats.st_mtime) + ':' + path + os.sep + node)
-                            fileInfo._youngest.sort(
-                                key=lambda x: float(x.split(':')[0]))
-                            fileInfo._timeYoungest = float(
-                                fileInfo._youngest[0].split(':')[0])
-                    length = len(fileInfo._oldest)
-                    if (fileInfo._maxOldest > 0 and (length < fileInfo._maxOldest
-                                                     or stats.st_mtime < fileInfo._timeOldest)):
-                        if not base.LinuxUtils.isReadable(stats, euid, egid):
-                            fileInfo._ignoredFiles += 1
-                        else:
-                            if length >= fileInfo._maxOldest:
-                                del fileInfo._oldest[-1]
-                            fileInfo._oldest.insert(
-                                0, str(stats.st_mtime) + ':' + path + os.sep + node)
-                            fileInfo._oldest.sort(
-                                key=lambda x: float(x.split(':')[0]))
-                            fileInfo._timeOldest = float(
-                                fileInfo._oldest[-1].split(':')[0])
+                    collect(fileInfo._largest, stats.st_size, full, stats, fileInfo)
+                    if stats.st_size >= fileInfo._minSize:
+                        collect(fileInfo._smallest, stats.st_size, full, stats, fileInfo)
+                    collect(fileInfo._youngest, stats.st_mtime, full, stats, fileInfo)
+                    collect(fileInfo._oldest, stats.st_mtime, full, stats, fileInfo)
                 else:
                     fileInfo._ignoredFiles += 1
                 continue
@@ -583,6 +930,12 @@ def directoryInfo(path, filePattern=None, dirPattern=None, maxDepth=-1, fileInfo
     if fileInfo is None:
         fileInfo = DirInfo(maxYoungest, maxLargest, maxOldest,
                            maxSmallest, minSize, dirsOnly, filesOnly, trace)
+    else:
+        # the sizes given as arguments override the sizes of the given instance:
+        fileInfo._youngest.resize(maxYoungest)
+        fileInfo._largest.resize(maxLargest)
+        fileInfo._oldest.resize(maxOldest)
+        fileInfo._smallest.resize(maxSmallest)
     if filePattern is not None:
         fileInfo._filePattern = base.StringUtils.regExprCompile(
             filePattern, 'file pattern')
@@ -592,9 +945,6 @@ def directoryInfo(path, filePattern=None, dirPattern=None, maxDepth=-1, fileInfo
 
     euid = os.geteuid()
     egid = os.getegid()
-    fileInfo._maxYoungest = maxYoungest
-    fileInfo._maxLargest = maxLargest
-    fileInfo._maxOldest = maxOldest
     fileInfo._maxDepth = maxDepth
     infoOneDir(path, 0, fileInfo)
     return fileInfo
@@ -772,83 +1122,94 @@ def fileClass(path):
             subclass of 'container': 'dir', 'tar', 'tgz', 'zip'
             subclass of 'text': 'xml', 'shell'
     '''
-    def isBinaryByte(bb):
-        rc = bb < 0x09 or (0x0d < bb < 0x20)
-        return rc
-
-    def isBinary(byteArray):
-        found = 0
-        rc = False
-        # for ix in range(len(byteArray)):
-        #    bb = byteArray[ix]
-        for bb in byteArray:
-            if bb == b'\x00':
-                rc = True
-                break
-            elif isBinaryByte(bb):
-                found += 1
-                if found > 100 or found > len(byteArray) / 10:
-                    rc = True
-                    break
-        return rc
-
-    def isNullString(byteArray):
-        '''Tests whether the byteArray is a text delimited with 0.
-        @param byteArray: array to test
-        @return True: only text and '\0' is part of byteArray
-        '''
-        ix = 0
-        rc = True
-        hasNull = False
-        while ix < len(byteArray):
-            if byteArray[ix] == 0:
-                hasNull = True
-            elif isBinaryByte(byteArray[ix]):
-                rc = False
-                break
-            ix += 1
-        return rc and hasNull
-
-    def isNullNumber(byteArray):
-        '''Tests whether the byteArray are digits delimited with 0.
-        @param byteArray: array to test
-        @return True: only decimal digits and '\0' is part of byteArray
-        '''
-        ix = 0
-        rc = True
-        hasNull = False
-        while ix < len(byteArray):
-            if byteArray[ix] == 0:
-                hasNull = True
-            elif not (byteArray[ix] >= 0x30 and byteArray[ix] <= 0x39):  # TAB
-                rc = False
-                break
-            ix += 1
-        return rc and hasNull
     if os.path.isdir(path):
         (theClass, subClass) = ('container', 'dir')
     else:
         with open(path, 'rb') as fp:
-            start = fp.read(4096)
-            if start.startswith(b'\x1f\x8b\x08'):
-                (theClass, subClass) = ('container', 'tar')
-            elif start.startswith(b'BZ') and isBinary(start[8:80]):
-                (theClass, subClass) = ('container', 'tar')
-            elif start.startswith(b'PK') and isBinary(start[2:32]):
-                (theClass, subClass) = ('container', 'zip')
-            elif isNullString(start[0:100]) and isNullNumber(start[100:0x98]):
-                (theClass, subClass) = ('container', 'tar')
-            elif (start[0:100].lower().find(b'<xml>') >= 0 or start[0:100].lower().find(b'<html') >= 0) and not isBinary(start):
-                (theClass, subClass) = ('text', 'xml')
-            elif len(start) > 5 and start.startswith(b'#!') and not isBinary(start):
-                (theClass, subClass) = ('text', 'shell')
-            elif isBinary(start):
-                (theClass, subClass) = ('binary', 'binary')
-            else:
-                (theClass, subClass) = ('text', 'text')
+            (theClass, subClass) = headerClass(fp.read(4096))
+    return (theClass, subClass)
+
+
+def fileClasses(filenames, jobs=COPY_JOBS, readAhead=16, chunkSize=32):
+    '''Returns the file classes of many files. The file headers are read ahead by a pool of worker threads.
+    @param filenames: an iterable of filenames, e.g. a DirTraverser.next() generator
+    @param jobs: the number of threads reading the file headers
+    @param readAhead: the maximal number of chunks classified in advance
+    @param chunkSize: the number of files classified by one task: less overhead than one task per file
+    @return: a generator of tuples (filename, (class, subclass)) in the order of filenames, see fileClass()
+        a file which cannot be read has the class ('unknown', 'unknown')
+    '''
+    def classify(chunk):
+        rc = []
+        for filename in chunk:
+            try:
+                rc.append(fileClass(filename))
+            except OSError:
+                rc.append(('unknown', 'unknown'))
+        return rc
+    pending = collections.deque()
+    chunk = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        for filename in filenames:
+            chunk.append(filename)
+            if len(chunk) >= chunkSize:
+                pending.append((chunk, pool.submit(classify, chunk)))
+                chunk = []
+                if len(pending) >= readAhead:
+                    chunk2, future = pending.popleft()
+                    yield from zip(chunk2, future.result())
+        if chunk:
+            pending.append((chunk, pool.submit(classify, chunk)))
+        while pending:
+            chunk2, future = pending.popleft()
+            yield from zip(chunk2, future.result())
+
+
+def headerClass(start):
+    '''Returns the file class of a file given by its first bytes.
+    @param start: the first bytes of the file (normally 4096)
+    @return: a tuple (class, subclass), see fileClass()
+    '''
+    if start.startswith(b'\x1f\x8b\x08'):
+        (theClass, subClass) = ('container', 'tar')
+    elif start.startswith(b'BZ') and isBinaryData(start[8:80]):
+        (theClass, subClass) = ('container', 'tar')
+    elif start.startswith(b'PK') and isBinaryData(start[2:32]):
+        (theClass, subClass) = ('container', 'zip')
+    elif isNullDelimited(start[0:100], TEXT_BYTES) and isNullDelimited(start[100:0x98], DIGIT_BYTES):
+        (theClass, subClass) = ('container', 'tar')
+    elif (start[0:100].lower().find(b'<xml>') >= 0 or start[0:100].lower().find(b'<html') >= 0) and not isBinaryData(start):
+        (theClass, subClass) = ('text', 'xml')
+    elif len(start) > 5 and start.startswith(b'#!') and not isBinaryData(start):
+        (theClass, subClass) = ('text', 'shell')
+    elif isBinaryData(start):
+        (theClass, subClass) = ('binary', 'binary')
+    else:
+        (theClass, subClass) = ('text', 'text')
     return (theClass, subClass)
 
 
+def isBinaryData(data):
+    '''Tests whether a byte sequence is part of a binary file: it contains '\\0' or too many control characters.
+    @param data: the bytes to inspect
+    @return: True: data is binary
+    '''
+    if data.find(b'\x00') >= 0:
+        return True
+    # translate() removes the text bytes: only the control characters remain:
+    found = len(data.translate(None, TEXT_BYTES))
+    return found > 100 or found > len(data) / 10
+
+
+def isNullDelimited(data, allowed):
+    '''Tests whether a byte sequence contains strings delimited with '\\0', e.g. in a tar header.
+    @param data: the bytes to inspect
+    @param allowed: the allowed bytes (besides '\\0'), e.g. TEXT_BYTES or DIGIT_BYTES
+    @return: True: data contains at least one '\\0' and only bytes from allowed otherwise
+    '''
+    return data.find(b'\x00') >= 0 and not data.translate(None, b'\x00' + allowed)
+
+
 def fileType(path):
     '''Returns the file type: 'file', 'dir', 'link', 'block'
     @param path: the full filename
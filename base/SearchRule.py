@@ -5,6 +5,10 @@ Created: 2020.07.19
 '''
 import base.StringUtils
 
+# searching: the number of lines joined for the first chunk and the maximum, see SearchRule.linesToSearch()
+SEARCH_CHUNK_MIN = 16
+SEARCH_CHUNK_MAX = 4096
+
 
 class CommandData:
     '''Properties given for a command (action except search and reposition).
@@ -181,6 +185,8 @@ class ProcessState:
 
     def deleteToMarker(self, name):
         '''Deletes the text from the cursor to the marker.
+        The deleted text is the same as returned by textToMarker(): a bound at column 0 means the end of the line above.
+        Each call changes the line list only once (slice assignment), independent of the number of deleted lines.
         @param name: a bound of the region to delete, _position is the other
         '''
 
@@ -189,75 +195,57 @@ class ProcessState:
             marker) and self.inRange()
         if self._success:
             comp = self._cursor.compare(marker)
-            start = marker if comp >= 0 else self._cursor
-            end = self._cursor if comp >= 0 else marker
+            # copies: marker and cursor are changed below
+            start = Position(0, 0)
+            start.clone(marker if comp >= 0 else self._cursor)
+            end = Position(0, 0)
+            end.clone(self._cursor if comp >= 0 else marker)
             ixStart = start._line
-            deletedLines = 0
+            prefix = self._lines[ixStart][0:start._col]
             self._hasChanged = True
-            if start._line == end._line:
-                self._lines[ixStart] = self._lines[ixStart][0:start._col] + \
-                    self._lines[ixStart][end._col:]
+            # joined: the rest of the end line is appended to the start line:
+            joined = end._col > 0 or start._line == end._line
+            if joined:
+                self._lines[ixStart:end._line + 1] = [prefix + self._lines[end._line][end._col:]]
+                deletedLines = end._line - ixStart
             else:
-                prefix = '' if start._col == 0 else self._lines[start._line][0:start._col]
-                ixEnd = end._line if end._col > 0 else end._line + 1
-                if end._col > 0:
-                    self._lines[end._line] = prefix + \
-                        self._lines[end._line][end._col:]
-                for ix in range(ixStart, ixEnd):
-                    del self._lines[ix]
-                    deletedLines += 1
-            # Adapt the existing markers:
-            for name2 in self._markers:
-                current = self.getMarker(name2)
-                if current.compare(start) >= 0:
-                    if current._line > end._line or current._line == end._line and end._col == 0:
-                        current._line -= deletedLines
-                    elif current._line == end._line:
-                        if current._col > end._col:
-                            current._col -= end.col
-                        current.clone(start)
-                    else:
-                        current.clone(start)
+                self._lines[ixStart:end._line] = [prefix]
+                deletedLines = end._line - ixStart - 1
+            # Adapt the existing markers and the cursor:
+            for current in list(self._markers.values()) + [self._cursor]:
+                if current.compare(start) < 0:
+                    continue
+                if current.compare(end) <= 0:
+                    current.clone(start)
+                elif current._line == end._line and joined:
+                    current._col = start._col + current._col - end._col
+                    current._line = ixStart
+                else:
+                    current._line -= deletedLines
 
     def insertAtCursor(self, text):
         '''Inserts a text at the cursor.
+        The cursor is set behind the inserted text. Markers behind the cursor are moved with the text.
+        Each call changes the line list only once (slice assignment), independent of the number of inserted lines.
         @param text: the text to insert, may contain '\n'
         '''
         self._success = self.inRange()
         if self._success:
             newLines = text.split('\n')
             curLine = self._cursor._line
+            curCol = self._cursor._col
             self._hasChanged = True
-            if len(newLines) == 1:
-                insertedLines = 0
-                colNew = self._cursor._col + len(text)
-                self._lines[curLine] = (self._lines[curLine][0:self._cursor._col] + newLines[0]
-                                        + self._lines[curLine][self._cursor._col:])
-            else:
-                insertedLines = len(newLines)
-                tail = ''
-                ixNew = 0
-                if self._cursor._col > 0:
-                    ixNew = 1
-                    tail = self._lines[self._cursor._line][self._cursor._col:]
-                    self._lines[curLine] = self._lines[curLine][0:self._cursor._col] + newLines[0]
-                    curLine += 1
-                    insertedLines -= 1
-                ixLast = len(newLines)
-                while ixNew < ixLast:
-                    self._lines.insert(curLine, newLines[ixNew])
-                    ixNew += 1
-                    curLine += 1
-                self._lines[curLine - 1] = self._lines[curLine - 1] + tail
-                colNew = len(newLines[-1])
-            for name in self._markers:
-                marker = self._markers[name]
-                if marker.compare(self._cursor) >= 0:
-                    if marker._line == self._cursor._line and marker._col > self._cursor._col:
-                        marker._line += insertedLines
-                        marker._col += len(newLines[-1])
-                    elif marker._line == self._cursor._line > 0:
-                        marker._line += insertedLines
+            line = self._lines[curLine] if curLine < len(self._lines) else ''
+            insertedLines = len(newLines) - 1
+            colNew = len(newLines[-1]) + (curCol if insertedLines == 0 else 0)
+            newLines[0] = line[0:curCol] + newLines[0]
+            newLines[-1] += line[curCol:]
+            self._lines[curLine:curLine + 1] = newLines
+            for marker in self._markers.values():
+                if marker.compare(self._cursor) > 0:
+                    if marker._line == curLine:
+                        marker._col += colNew - curCol
+                    marker._line += insertedLines
             self._cursor._line += insertedLines
             self._cursor._col = colNew
 
@@ -397,6 +385,52 @@ class SearchRule:
         self._param = param
         self._flowControl = FlowControl()
 
+    def linesToSearch(self, state, startIx, endIx, backward):
+        '''Returns the indexes of the lines to inspect in the search order.
+        Lines without a hit are skipped in chunks: the regular expression is applied to the joined lines
+        of the chunk (one call instead of one call per line). This is possible only if the search data contains
+        a "buffer expression" (see SearchData) and the range starts at column 0.
+        The lines of the range bounds are always returned: they are searched with column limits.
+        @param state: the ProcessState instance
+        @param startIx: the index of the first line to inspect
+        @param endIx: the index behind the last line to inspect (exclusive), in the search direction
+        @param backward: True: the lines are returned in descending order
+        @return: an iterator over the line indexes
+        '''
+        bufferRegExpr = self._param._bufferRegExpr
+        step = -1 if backward else 1
+        if bufferRegExpr is None or state._startRange._col != 0:
+            yield from range(startIx, endIx, step)
+            return
+        lines = state._lines
+        bounds = (state._startRange._line, state._endRange._line)
+        size = SEARCH_CHUNK_MIN
+        ix = startIx
+        while (ix > endIx) if backward else (ix < endIx):
+            if ix == startIx or ix in bounds:
+                yield ix
+                ix += step
+            elif backward:
+                # the chunk lies between limit (exclusive) and ix (inclusive):
+                limit = max([endIx] + [bound for bound in bounds if bound < ix])
+                low = max(limit + 1, ix - size + 1)
+                if bufferRegExpr.search('\n'.join(lines[low:ix + 1])) is not None:
+                    yield from range(ix, low - 1, -1)
+                ix = low - 1
+                size = min(2 * size, SEARCH_CHUNK_MAX)
+            else:
+                limit = min([endIx] + [bound for bound in bounds if bound > ix])
+                high = min(limit, ix + size)
+                text = '\n'.join(lines[ix:high])
+                match = bufferRegExpr.search(text)
+                if match is None:
+                    ix = high
+                else:
+                    ix += text.count('\n', 0, match.start())
+                    yield ix
+                    ix += 1
+                size = min(2 * size, SEARCH_CHUNK_MAX)
+
     def name(self, extended=False):
         '''Returns the command name.
         @return the command name
@@ -434,7 +468,7 @@ class SearchRule:
                 endIx = min(startIx + self._param._rangeLines, endIx)
             match = None
             regExpr = self._param._regExpr
-            for ix in range(startIx, endIx):
+            for ix in self.linesToSearch(state, startIx, endIx, False):
                 if ix == state._startRange._line:
                     match = regExpr.search(
                         state._lines[ix], state._startRange._col)
@@ -468,7 +502,7 @@ class SearchRule:
             if self._param._rangeLines is not None:
                 endIx = max(state._startRange._line - 1,
                             max(-1, startIx - self._param._rangeLines))
-            for ix in range(startIx, endIx, -1):
+            for ix in self.linesToSearch(state, startIx, endIx, True):
                 if ix == state._startRange._line:
                     iterator = regExpr.finditer(
                         state._lines[ix], state._startRange._col)
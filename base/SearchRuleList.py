@@ -4,6 +4,7 @@ Created: 2020.07.19
 @author: hm
 '''
 import re
+import collections
 
 import base.Const
 import base.StringUtils
@@ -46,6 +47,9 @@ class SearchRuleList:
     __reRuleReplace = re.compile(
         r'replace(?:-[a-zA-Z])?:([^\s])(.+?)\1(.*?)\1(e=.|,|c=\d+)*')
     # x=re.compile(r'replace:([^\s])(.+)\1(.*)\1(e=.)?')
+    # flow control in the compiled program (see compile()): None means "continue"
+    FLOW_STOP = -1
+    FLOW_ERROR = -2
 
     def __init__(self, logger, rules=None):
         '''Constructor.
@@ -62,6 +66,13 @@ class SearchRuleList:
         self._markers = {}
         self._fpTrace = None
         self._maxLoops = None
+        # the compiled rules: None or a list of tuples (handler, rule, onSuccess, onError), see compile()
+        self._program = None
+        # <rule type>: handler
+        self._commands = {'add': self._commandAdd, 'cut': self._commandCut, 'expr': self._commandExpr,
+                          'group': self._commandGroup, 'insert': self._commandInsert, 'jump': self._commandJump,
+                          'mark': self._commandMark, 'print': self._commandPrint, 'replace': self._commandReplace,
+                          'set': self._commandSet, 'state': self._commandState, 'swap': self._commandSwap}
         if rules is not None:
             self.parseRules(rules)
 
@@ -81,208 +92,62 @@ class SearchRuleList:
 
     def apply(self, state):
         '''Executes the internal stored rules in a given list of lines inside a range.
+        The rules are compiled (see compile()) at the first call.
         @param state: IN/OUT IN: the context to search OUT: the state at the end of applying the rule list
         '''
+        program = self._program if self._program is not None else self.compile()
         ix = 0
         count = 0
         maxCount = len(state._lines) * state._maxLoops
-        while ix < len(self._rules):
-            if count >= maxCount:
-                state._logger.error(
-                    'base.SearchRule.SearchRule.apply(): to many loops: {}'.format(self._maxLoops))
-                break
-            item = self._rules[ix]
+        length = len(program)
+        while ix < length:
+            (handler, rule, onSuccess, onError) = program[ix]
             if self._fpTrace is not None:
-                ixTrace = ix
-                self.trace(ixTrace, False, state)
-            flowControl = self._rules[ix]._flowControl
-            ix += 1
-            if item._ruleType == '>':
-                item.searchForward(state)
-            elif item._ruleType == '<':
-                item.searchBackward(state)
-            elif item._ruleType == '%':
-                # label
-                pass
-            elif item._ruleType == 'anchor' or item._ruleType == '+':
-                item.reposition(state)
-            elif item._ruleType >= 'p':
-                self.applyCommand2(item, state)
-            else:
-                ix2 = self.applyCommand1(item, state)
-                if ix2 is not None:
-                    ix = ix2
+                self.trace(ix, False, state)
+            ixNext = handler(rule, state)
             if self._fpTrace is not None:
-                self.trace(ixTrace, True, state)
-            if flowControl is not None:
-                reaction = flowControl._onSuccess if state._success else flowControl._onError
-                if reaction == 'c':
-                    pass
-                elif reaction == 's':
+                self.trace(ix, True, state)
+            reaction = onSuccess if state._success else onError
+            if reaction is not None:
+                if reaction == SearchRuleList.FLOW_STOP:
                     break
-                elif reaction == 'e':
+                if reaction == SearchRuleList.FLOW_ERROR:
                     self._logger.error('{} stopped with error')
                     break
-                elif reaction in self._labels:
-                    ix = self._labels[reaction] + 1
+                ixNext = reaction
+            if ixNext is None:
+                ix += 1
+            else:
+                if ixNext <= ix:
+                    # a loop:
+                    count += 1
+                    if count > maxCount:
+                        state._logger.error(
+                            'base.SearchRule.SearchRule.apply(): to many loops: {}'.format(state._maxLoops))
+                        break
+                ix = ixNext
 
     def applyCommand1(self, rule, state):
         '''Executes the action named 'a*' to 'p*' (exclusive)
         @param processState: IN/OUT IN: the context to search OUT: the state at the end of applying the rule list
         @return: None: normal processing otherwise: the index of the next rule to process
         '''
-        rc = None
-        name = rule._ruleType
-        checkPosition = False
-        if name == 'add':
-            # add-R-m
-            # add-R-S
-            # add-R D<text>D
-            if rule._param._marker is not None:
-                text = state.textToMarker(rule._param._marker)
-            elif rule._param._register2 is not None:
-                text = state.getRegister(rule._param._register2)
-            elif rule._param._text is not None:
-                text = rule._param.getText(state)
-            else:
-                state._logger.error('add: nothing to do')
-                text = ''
-            state.putToRegister(rule._param._register, text, append=True)
-        elif name == 'cut':
-            # cut-m
-            # cut-R-m
-            if rule._param._register is not None:
-                text = state.textToMarker(rule._param._marker)
-                state.putToRegister(rule._param._register, text)
-            state.deleteToMarker(rule._param._marker)
-        elif name == 'expr':
-            # expr-R:"+4"
-            value = base.StringUtils.asInt(
-                state.getRegister(rule._param._register), 0)
-            param = rule._param.getText(state)
-            value2 = base.StringUtils.asInt(param[1:], 0)
-            op = param[0]
-            if op == '+':
-                value += value2
-            elif op == '-':
-                value -= value2
-            elif op == '*':
-                value *= value2
-            elif op == '/':
-                if value2 == 0:
-                    state._success = self._logger.error(
-                        'division by 0 is not defined')
-                else:
-                    value //= value2
-            elif op == '%':
-                if value2 == 0:
-                    state._success = self._logger.error(
-                        'modulo 0 is not defined')
-                else:
-                    value %= value2
-            state._registers[rule._param._register] = str(value)
-        elif name == 'insert':
-            # insert-R
-            # insert D<content>D
-            text = ''
-            if rule._param._register is not None:
-                text = state.getRegister(rule._param._register)
-            elif rule._param._text is not None:
-                text = rule._param.getText(state)
-            state.insertAtCursor(text)
-        elif name == 'group':
-            # group-G-R
-            state._success = state._lastMatch is not None and state._lastMatch.lastindex <= rule._param._group
-            if state._success:
-                text = '' if state._lastMatch.lastindex < rule._param._group else state._lastMatch.group(
-                    rule._param._group)
-                state.putToRegister(rule._param._register, text)
-        elif name == 'jump':
-            if rule._param._marker is not None:
-                state._cursor.clone(state.getMarker(rule._param._marker))
-                checkPosition = True
-            else:
-                rc = self._labels[rule._param._text]
-        elif name == 'mark':
-            state.setMarker(rule._param._marker)
-        else:
+        handler = self._commands.get(rule._ruleType)
+        if handler is None:
             state._logger.error('applyCommand1: unknown command')
-        if checkPosition:
-            state._success = state.inRange()
-        return rc
+            return None
+        return handler(rule, state)
 
     def applyCommand2(self, rule, state):
         '''Executes the actions named 'p*' to 'z*' (inclusive)
         @param processState: IN/OUT IN: the context to search OUT: the state at the end of applying the rule list
         '''
-        name = rule._ruleType
-        if name == 'print':
-            state._success = True
-            if rule._param._register is not None:
-                print(state.getRegister(rule._param._register))
-            elif rule._param._marker is not None:
-                print(state.textToMarker(rule._param._marker))
-            elif rule._param._text is not None:
-                print(rule._param.getText(state))
-        elif name == 'replace':
-            param = rule._param
-            if param._register is not None:
-                replaced, state._lastHits = re.subn(
-                    param._text, param._text2, state.getRegister(param._register))
-                state._registers[param._register] = replaced
-            elif param._marker is not None:
-                SearchRuleList.applyReplaceRegion(state._cursor, state.getMarker(param._marker),
-                                            re.compile(param._text), param._text2, state)
-            else:
-                # replace in the current line:
-                line = state._lines[state._cursor._line]
-                replaced, state._lastHits = re.subn(
-                    param._text, param._text2, line)
-                if line != replaced:
-                    state._hasChanged = True
-                    state._lines[state._cursor._line] = replaced
-        elif name == 'set':
-            if rule._param._marker is not None:
-                text = state.textToMarker(rule._param._marker)
-            elif rule._param._register2 is not None:
-                text = state.textToMarker(rule._param._marker)
-            elif rule._param._text is not None:
-                text = rule._param.getText(state)
-            else:
-                state._logger.error('set: nothing to do')
-                text = ''
-            state.putToRegister(rule._param._register, text)
-        elif name == 'state':
-            name = rule._param._text
-            if name == 'row':
-                value = state._cursor._line + 1
-            elif name == 'col':
-                value = state._cursor._col + 1
-            elif name == 'rows':
-                value = len(state._lines)
-            elif name.startswith('size-'):
-                value = len(state.getRegister(name[5]))
-            elif name.startswith('rows-'):
-                value = state.getRegister(name[5]).count('\n')
-            elif name == 'hits':
-                value = state._lastHits
-            else:
-                value = '?'
-            state._registers[rule._param._register] = str(value)
-        elif name == 'swap':
-            marker = state.getMarker(rule._param._marker)
-            if marker is None:
-                state._success = False
-                state._logger.error(
-                    'swap: marker {} is not defined'.format(rule._param._marker))
-            else:
-                state._tempRange.clone(state._cursor)
-                state._cursor.clone(marker)
-                marker.clone(state._tempRange)
-                state._success = state.inRange()
-        else:
+        handler = self._commands.get(rule._ruleType)
+        if handler is None:
             self._logger.error(
-                'unknown command {} in {}'.format(name, rule._ruleType))
+                'unknown command {} in {}'.format(rule._ruleType, rule._ruleType))
+        else:
+            handler(rule, state)
 
     @staticmethod
     def applyReplaceRegion(start, end, what, replacement, state):
@@ -334,12 +199,7 @@ class SearchRuleList:
         '''Tests the compiled rules, e.g. existence of labels.
         @return: None OK otherwise: the error message
         '''
-        self._labels = {}
-        ix = -1
-        for rule in self._rules:
-            ix += 1
-            if rule._ruleType == '%':
-                self._labels[rule._param] = ix
+        self._findLabels()
         for rule in self._rules:
             if rule._flowControl is not None:
                 label = rule._flowControl._onSuccess
@@ -359,6 +219,38 @@ class SearchRuleList:
         rc = self._errorCount == 0
         return rc
 
+    def compile(self):
+        '''Translates the rules into a program: a list of handlers with resolved flow control.
+        Executing the program needs no string comparison to find the handler of a rule or the target of a jump.
+        @return: the program: a list of tuples (handler, rule, onSuccess, onError)
+            handler: a callable with the signature handler(rule, state) returning None or the index of the next rule
+            onSuccess, onError: None (continue), FLOW_STOP, FLOW_ERROR or the index of the next rule
+        '''
+        def flow(reaction):
+            if reaction == 'c':
+                rc = None
+            elif reaction == 's':
+                rc = SearchRuleList.FLOW_STOP
+            elif reaction == 'e':
+                rc = SearchRuleList.FLOW_ERROR
+            else:
+                # unknown labels are reported by check():
+                rc = self._labels[reaction] + 1 if reaction in self._labels else None
+            return rc
+        self._findLabels()
+        searchRule = base.SearchRule.SearchRule
+        handlers = {'>': searchRule.searchForward, '<': searchRule.searchBackward, '%': SearchRuleList._label,
+                    'anchor': searchRule.reposition, '+': searchRule.reposition}
+        handlers.update(self._commands)
+        self._program = []
+        for rule in self._rules:
+            handler = handlers.get(rule._ruleType)
+            if handler is None:
+                handler = self.applyCommand2
+            self._program.append((handler, rule, flow(rule._flowControl._onSuccess),
+                                  flow(rule._flowControl._onError)))
+        return self._program
+
     @staticmethod
     def describe():
         '''Describes the rule syntax.
@@ -702,6 +594,7 @@ print:"Full name: " print-F print:" " print-N
             search forwards "logfile:" go backward 2 line 0 column, go to begin of line
         '''
         self._col = 0
+        self._program = None
         rules = rules.lstrip('\t\n\r ;')
         while rules != '':
             currentRule = None
@@ -822,11 +715,228 @@ print:"Full name: " print-F print:" " print-N
             self._fpTrace.write('{:03d}: {} {}\n    {}\n'.format(
                 index, success, rule.toString(), rc))
 
+    def _commandAdd(self, rule, state):
+        '''Executes the command "add".
+        @param rule: the rule to execute
+        @param state: IN/OUT: the ProcessState instance
+        '''
+        # add-R-m
+        # add-R-S
+        # add-R D<text>D
+        if rule._param._marker is not None:
+            text = state.textToMarker(rule._param._marker)
+        elif rule._param._register2 is not None:
+            text = state.getRegister(rule._param._register2)
+        elif rule._param._text is not None:
+            text = rule._param.getText(state)
+        else:
+            state._logger.error('add: nothing to do')
+            text = ''
+        state.putToRegister(rule._param._register, text, append=True)
+
+    def _commandCut(self, rule, state):
+        '''Executes the command "cut".
+        @param rule: the rule to execute
+        @param state: IN/OUT: the ProcessState instance
+        '''
+        # cut-m
+        # cut-R-m
+        if rule._param._register is not None:
+            text = state.textToMarker(rule._param._marker)
+            state.putToRegister(rule._param._register, text)
+        state.deleteToMarker(rule._param._marker)
+
+    def _commandExpr(self, rule, state):
+        '''Executes the command "expr".
+        @param rule: the rule to execute
+        @param state: IN/OUT: the ProcessState instance
+        '''
+        # expr-R:"+4"
+        value = base.StringUtils.asInt(
+            state.getRegister(rule._param._register), 0)
+        param = rule._param.getText(state)
+        value2 = base.StringUtils.asInt(param[1:], 0)
+        op = param[0]
+        if op == '+':
+            value += value2
+        elif op == '-':
+            value -= value2
+        elif op == '*':
+            value *= value2
+        elif op == '/':
+            if value2 == 0:
+                state._success = self._logger.error(
+                    'division by 0 is not defined')
+            else:
+                value //= value2
+        elif op == '%':
+            if value2 == 0:
+                state._success = self._logger.error(
+                    'modulo 0 is not defined')
+            else:
+                value %= value2
+        state._registers[rule._param._register] = str(value)
+
+    def _commandGroup(self, rule, state):
+        '''Executes the command "group".
+        @param rule: the rule to execute
+        @param state: IN/OUT: the ProcessState instance
+        '''
+        # group-G-R
+        state._success = state._lastMatch is not None and state._lastMatch.lastindex <= rule._param._group
+        if state._success:
+            text = '' if state._lastMatch.lastindex < rule._param._group else state._lastMatch.group(
+                rule._param._group)
+            state.putToRegister(rule._param._register, text)
+
+    def _commandInsert(self, rule, state):
+        '''Executes the command "insert".
+        @param rule: the rule to execute
+        @param state: IN/OUT: the ProcessState instance
+        '''
+        # insert-R
+        # insert D<content>D
+        text = ''
+        if rule._param._register is not None:
+            text = state.getRegister(rule._param._register)
+        elif rule._param._text is not None:
+            text = rule._param.getText(state)
+        state.insertAtCursor(text)
+
+    def _commandJump(self, rule, state):
+        '''Executes the command "jump".
+        @param rule: the rule to execute
+        @param state: IN/OUT: the ProcessState instance
+        @return: None: normal processing otherwise: the index of the next rule to process
+        '''
+        rc = None
+        if rule._param._marker is not None:
+            state._cursor.clone(state.getMarker(rule._param._marker))
+            state._success = state.inRange()
+        else:
+            rc = self._labels[rule._param._text]
+        return rc
+
+    def _commandMark(self, rule, state):
+        '''Executes the command "mark".
+        @param rule: the rule to execute
+        @param state: IN/OUT: the ProcessState instance
+        '''
+        state.setMarker(rule._param._marker)
+
+    def _commandPrint(self, rule, state):
+        '''Executes the command "print".
+        @param rule: the rule to execute
+        @param state: IN/OUT: the ProcessState instance
+        '''
+        state._success = True
+        if rule._param._register is not None:
+            print(state.getRegister(rule._param._register))
+        elif rule._param._marker is not None:
+            print(state.textToMarker(rule._param._marker))
+        elif rule._param._text is not None:
+            print(rule._param.getText(state))
+
+    def _commandReplace(self, rule, state):
+        '''Executes the command "replace".
+        @param rule: the rule to execute
+        @param state: IN/OUT: the ProcessState instance
+        '''
+        param = rule._param
+        if param._register is not None:
+            replaced, state._lastHits = re.subn(
+                param._text, param._text2, state.getRegister(param._register))
+            state._registers[param._register] = replaced
+        elif param._marker is not None:
+            SearchRuleList.applyReplaceRegion(state._cursor, state.getMarker(param._marker),
+                                              re.compile(param._text), param._text2, state)
+        else:
+            # replace in the current line:
+            line = state._lines[state._cursor._line]
+            replaced, state._lastHits = re.subn(
+                param._text, param._text2, line)
+            if line != replaced:
+                state._hasChanged = True
+                state._lines[state._cursor._line] = replaced
+
+    def _commandSet(self, rule, state):
+        '''Executes the command "set".
+        @param rule: the rule to execute
+        @param state: IN/OUT: the ProcessState instance
+        '''
+        if rule._param._marker is not None:
+            text = state.textToMarker(rule._param._marker)
+        elif rule._param._register2 is not None:
+            text = state.textToMarker(rule._param._marker)
+        elif rule._param._text is not None:
+            text = rule._param.getText(state)
+        else:
+            state._logger.error('set: nothing to do')
+            text = ''
+        state.putToRegister(rule._param._register, text)
+
+    def _commandState(self, rule, state):
+        '''Executes the command "state".
+        @param rule: the rule to execute
+        @param state: IN/OUT: the ProcessState instance
+        '''
+        name = rule._param._text
+        if name == 'row':
+            value = state._cursor._line + 1
+        elif name == 'col':
+            value = state._cursor._col + 1
+        elif name == 'rows':
+            value = len(state._lines)
+        elif name.startswith('size-'):
+            value = len(state.getRegister(name[5]))
+        elif name.startswith('rows-'):
+            value = state.getRegister(name[5]).count('\n')
+        elif name == 'hits':
+            value = state._lastHits
+        else:
+            value = '?'
+        state._registers[rule._param._register] = str(value)
+
+    def _commandSwap(self, rule, state):
+        '''Executes the command "swap".
+        @param rule: the rule to execute
+        @param state: IN/OUT: the ProcessState instance
+        '''
+        marker = state.getMarker(rule._param._marker)
+        if marker is None:
+            state._success = False
+            state._logger.error(
+                'swap: marker {} is not defined'.format(rule._param._marker))
+        else:
+            state._tempRange.clone(state._cursor)
+            state._cursor.clone(marker)
+            marker.clone(state._tempRange)
+            state._success = state.inRange()
+
+    def _findLabels(self):
+        '''Stores the rule index of all labels into _labels.
+        '''
+        self._labels = {}
+        for ix, rule in enumerate(self._rules):
+            if rule._ruleType == '%':
+                self._labels[rule._param] = ix
+
+    @staticmethod
+    def _label(rule, state):
+        '''Executes a label: nothing to do.
+        @param rule: the rule to execute
+        @param state: IN/OUT: the ProcessState instance
+        '''
+        base.StringUtils.avoidWarning(rule)
+        base.StringUtils.avoidWarning(state)
 
 class SearchData:
     '''Data for seaching (forward and backward)
     '''
     __reRange = re.compile(r':?(\d+)')
+    # constructs which may behave different in a multiline buffer than in a single line:
+    # \A \Z, lookaround, atomic groups, possessive quantifiers...
+    __reLineBound = re.compile(r'\\[AZ]|\(\?(?![:P])|[*+?}]\+')
 
     def __init__(self):
         '''Constructor:
@@ -839,6 +949,8 @@ class SearchData:
         self._rangeColumns = None
         self._rangeLines = None
         self._regExpr = None
+        # None or the expression for searching in a chunk of joined lines (see SearchRule.linesToSearch())
+        self._bufferRegExpr = None
 
     def setData(self, string, options):
         '''Sets the variables by inspecting the string and the options.
@@ -864,6 +976,37 @@ class SearchData:
                 rc = 'unknown search option: ' + options[0]
                 break
             options = options[1:].rstrip()
-        self._regExpr = re.compile(
-            string, base.Const.IGNORE_CASE if self._ignoreCase else 0)
+        flags = base.Const.IGNORE_CASE if self._ignoreCase else 0
+        self._regExpr = re.compile(string, flags)
+        if SearchData.__reLineBound.search(string) is None:
+            self._bufferRegExpr = re.compile(string, flags | re.MULTILINE)
         return rc
+
+
+# the LRU cache of compiled rule lists: <rules as string>: (ruleList, success)
+_compiledRuleLists = collections.OrderedDict()
+MAX_CACHED_RULE_LISTS = 32
+
+
+def compiledRuleList(rulesAsString, logger):
+    '''Returns the compiled rule list of a rule string. The rules are parsed, checked and compiled only once:
+    the result is stored in a cache with LRU eviction.
+    @param rulesAsString: the rules as string
+    @param logger: the logger for errors
+    @return: a tuple (ruleList, success): ruleList: the SearchRuleList instance success: False: the rules are wrong
+    '''
+    rc = _compiledRuleLists.get(rulesAsString)
+    if rc is not None:
+        _compiledRuleLists.move_to_end(rulesAsString)
+        rc[0]._logger = logger
+    else:
+        ruleList = SearchRuleList(logger)
+        success = ruleList.parseRules(rulesAsString)
+        if success:
+            success = ruleList.check()
+        if success:
+            ruleList.compile()
+        rc = _compiledRuleLists[rulesAsString] = (ruleList, success)
+        if len(_compiledRuleLists) > MAX_CACHED_RULE_LISTS:
+            _compiledRuleLists.popitem(last=False)
+    return rc
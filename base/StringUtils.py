@@ -31,6 +31,11 @@ REG_EXPR_ESC = re.compile(r'''(\\U[0-9a-fA-F]{8}|\\u[0-9a-fA-F]{4}|\\x[0-9a-fA-F
 #    | \\N\{[^}]+\}     # Unicode characters by name
 #    | \\[\\'"abfnrtv]  # Single-character escapes
 
+REG_EXPR_QUANTIFIER = re.compile(r'([?*+]|\{(?:\d+(?:,\d*)?|,\d+)\})[?+]?')
+REG_EXPR_INLINE_FLAGS = re.compile(r'\(\?[aiLmsux-]*[ix]')
+# the rest of an escape sequence behind the backslash (if it starts with an alphanumeric character):
+# hex and unicode escapes, named characters, octal escapes, backreferences, classes like \d
+REG_EXPR_ESCAPE = re.compile(r'x[0-9a-fA-F]{0,2}|u[0-9a-fA-F]{0,4}|U[0-9a-fA-F]{0,8}|N\{[^}]*\}?|0[0-7]{0,2}|[0-7]{3}|\d{1,2}|\w')
 LOGGER = None
 
 
@@ -482,6 +487,125 @@ def regExprCompile(pattern, location, logger=None, isCaseSensitive=False):
     return rc
 
 
+def regExprOfStrings(strings):
+    '''Returns a regular expression finding any of the given strings.
+    The strings are arranged in a tree (common prefixes are shared), so the search is done in one pass.
+    If more than one string matches at a position the longest one wins (leftmost longest).
+    @param strings: a list of strings to find. Empty strings are ignored
+    @return: None: no (non empty) string given otherwise: the compiled regular expression
+    '''
+    tree = {}
+    for item in strings:
+        if item != '':
+            node = tree
+            for cc in item:
+                node = node.setdefault(cc, {})
+            # the end marker:
+            node[''] = None
+    rc = None if not tree else re.compile(_treeToPattern(tree))
+    return rc
+
+
+def _treeToPattern(node):
+    '''Converts a node of a string tree into a regular expression.
+    @param node: a dictionary: character -> subnode. The key '' marks the end of a string
+    @return: the regular expression matching the longest possible string of the subtree
+    '''
+    alternatives = []
+    for cc in sorted(key for key in node if key != ''):
+        child = node[cc]
+        text = re.escape(cc)
+        # a chain of nodes with only one child is collected into one literal:
+        while len(child) == 1 and '' not in child:
+            cc2, child = next(iter(child.items()))
+            text += re.escape(cc2)
+        alternatives.append(text + _treeToPattern(child))
+    if not alternatives:
+        rc = ''
+    elif len(alternatives) == 1 and '' not in node:
+        rc = alternatives[0]
+    else:
+        rc = '(?:' + '|'.join(alternatives) + ')'
+        if '' in node:
+            # the greedy '?' tries the longer strings first:
+            rc += '?'
+    return rc
+
+
+def requiredLiteral(pattern, flags=0):
+    r'''Returns the longest literal string which must be part of each match of a regular expression.
+    Example: pattern: r'^\s*memory_limit\s*=' result: 'memory_limit'
+    That string can be used as cheap prefilter: a text without it cannot match.
+    Only the top level of the pattern is inspected: groups and character classes end a literal.
+    @param pattern: the regular expression as string
+    @param flags: the flags of the regular expression, e.g. base.Const.IGNORE_CASE
+    @return: None: no literal found (or not determinable, e.g. alternatives or ignore case) otherwise: the literal
+    '''
+    if flags & (base.Const.RE_IGNORECASE | base.Const.RE_VERBOSE) or REG_EXPR_INLINE_FLAGS.search(pattern):
+        return None
+    rc = ''
+    current = []
+    depth = 0
+    ix = 0
+    length = len(pattern)
+    while ix < length:
+        cc = pattern[ix]
+        ix += 1
+        literal = None
+        if cc == '\\':
+            if ix < length and not pattern[ix].isalnum():
+                literal = pattern[ix]
+                ix += 1
+            else:
+                # the whole escape sequence ends the current literal:
+                matcher = REG_EXPR_ESCAPE.match(pattern, ix)
+                ix = ix + 1 if matcher is None else matcher.end()
+        elif cc == '[':
+            # skip the character class:
+            if pattern.startswith('^', ix):
+                ix += 1
+            if pattern.startswith(']', ix):
+                ix += 1
+            while ix < length and pattern[ix] != ']':
+                ix += 2 if pattern[ix] == '\\' else 1
+            ix += 1
+        elif cc == '(':
+            depth += 1
+        elif cc == ')':
+            depth -= 1
+        elif cc == '|':
+            if depth == 0:
+                return None
+        elif cc in '*+?{':
+            # a quantifier of a non literal (e.g. a group):
+            matcher = REG_EXPR_QUANTIFIER.match(pattern, ix - 1)
+            if matcher is not None:
+                ix = matcher.end()
+            elif cc == '{':
+                literal = cc
+        elif cc not in '.^$':
+            literal = cc
+        if depth > 0 or literal is None:
+            if len(current) > len(rc):
+                rc = ''.join(current)
+            current = []
+            continue
+        # a following quantifier:
+        matcher = REG_EXPR_QUANTIFIER.match(pattern, ix)
+        if matcher is None:
+            current.append(literal)
+        else:
+            ix = matcher.end()
+            if matcher.group(1) not in ('?', '*') and not matcher.group(1).startswith(('{0', '{,')):
+                current.append(literal)
+            if len(current) > len(rc):
+                rc = ''.join(current)
+            current = []
+    if len(current) > len(rc):
+        rc = ''.join(current)
+    return rc if rc != '' else None
+
+
 def secondsToString(seconds):
     '''Converts a number of seconds into a human readable string, e.g. '00:34:22'
     @param seconds: the seconds to convert
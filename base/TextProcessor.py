@@ -5,7 +5,9 @@ Created: 2020.06.24
 '''
 import re
 import os.path
+import stat
 import datetime
+import tempfile
 
 import base.Const
 import base.StringUtils
@@ -28,6 +30,10 @@ class TextProcessor:
         self._lastState = None
         self._hasChanged = False
         self._traceFile = None
+        # the compiled data of the last replaceMany() call: (key, regExpr, table)
+        self._replaceManyData = None
+        # the trace file of executeRules() is opened only once, see stopTrace()
+        self._fpTrace = None
 
     def cursor(self, mode='both'):
         '''Returns the cursor as pair (line, col), or the line or the column, depending on mode.
@@ -38,27 +44,33 @@ class TextProcessor:
               (self._cursor._col if mode == 'col' else self._cursor._line))
         return rc
 
-    def executeRules(self, rulesAsString, maxLoops=1):
+    def executeRules(self, rules, maxLoops=1):
         '''Compiles the rules and executes them.
-        @param rules: a sequence of rules given as string
+        @param rules: a sequence of rules given as string or a compiled SearchRuleList instance
+            Rules given as string are compiled only once, see base.SearchRuleList.compiledRuleList()
+        @param maxLoops: the number of loops is limited to maxLoops*len(lines)
         @return True: success False: error
         '''
-        ruleList = base.SearchRuleList.SearchRuleList(self._logger)
-        rc = ruleList.parseRules(rulesAsString)
-        if rc:
-            rc = ruleList.check()
+        if isinstance(rules, base.SearchRuleList.SearchRuleList):
+            ruleList, rc = rules, True
+        else:
+            ruleList, rc = base.SearchRuleList.compiledRuleList(rules, self._logger)
         if rc:
             status = base.SearchRule.ProcessState(self._lines, self._region._startPosition, self._region._endPosition,
                                                   self._cursor, self._logger, maxLoops)
             if self._traceFile is not None:
-                ruleList.startTrace(self._traceFile, True)
-            ruleList.apply(status)
+                if self._fpTrace is None:
+                    self._fpTrace = open(self._traceFile, 'a')
+                self._fpTrace.write('= start\n')
+                ruleList._fpTrace = self._fpTrace
+            try:
+                ruleList.apply(status)
+            finally:
+                ruleList._fpTrace = None
             self._cursor.clone(status._cursor)
             self._lastState = status
             self._hasChanged = status._hasChanged
             rc = status._success
-            if self._traceFile is not None:
-                ruleList.stopTrace()
         return rc
 
     def findLine(self, pattern, firstIndex=0, lastIndex=None):
@@ -70,11 +82,13 @@ class TextProcessor:
         '''
         rc = -1
         regExpr = re.compile(pattern) if isinstance(pattern, str) else pattern
+        literal = base.StringUtils.requiredLiteral(regExpr.pattern, regExpr.flags)
         ixLine = firstIndex
         last = min(lastIndex, len(self._lines)
                    ) if lastIndex is not None else len(self._lines)
         while ixLine < last:
-            if regExpr.search(self._lines[ixLine]):
+            line = self._lines[ixLine]
+            if (literal is None or literal in line) and regExpr.search(line):
                 rc = ixLine
                 break
             ixLine += 1
@@ -120,19 +134,25 @@ class TextProcessor:
                     line3 = base.StringUtils.limitLength2(line, 132)
                     self._logger.log(f'insert at {ix}:\n{line2}', base.Const.LEVEL_DETAIL)
 
-    def readFile(self, filename, mustExists=True):
+    def readFile(self, filename, mustExists=True, mustContain=None):
         '''Reads a file into the internal buffer.
         @param filename: the file to read
         @param mustExists: True: errros will be logged
-        @return True: success False: cannot read
+        @param mustContain: None or a string: if the file does not contain it the buffer remains empty
+            and False is returned. Used as prefilter, see base.StringUtils.requiredLiteral()
+        @return True: success False: cannot read or mustContain is not part of the file
         '''
         self._filename = filename
         rc = os.path.exists(filename)
         if not rc:
             if mustExists:
                 self._logger.error('{} does not exists'.format(filename))
-        else:
+        elif mustContain is None:
             self._lines = base.StringUtils.fromFile(filename, '\n')
+        else:
+            content = base.StringUtils.fromFile(filename)
+            rc = content.find(mustContain) >= 0
+            self._lines = content.split('\n') if rc else []
         self.setEndOfFile(self._endOfFile)
         self._region._startPosition.clone(self._beginOfFile)
         self._region._endPosition.clone(self._endOfFile)
@@ -140,7 +160,7 @@ class TextProcessor:
         return rc
 
     def replace(self, pattern, replacement, groupMarker=None, noRegExpr=False, countHits=False,
-                wordOnly=False, ignoreCase=False, escActive=False):
+                wordOnly=False, ignoreCase=False, escActive=False, wholeBuffer=False):
         r'''Replaces all occurrences of what with a replacement in the current region.
         @param pattern: a regular expression of the string to search unless noRegExpr==True:
         @param replacement: what will be replaced with this. May contain a placeholder for groups in what
@@ -151,74 +171,128 @@ class TextProcessor:
         @param wordOnly: True: only whole words will be found. Only relevant for regular expressions
         @param ignoreCase: True: the search is not case sensitive
         @param escActive: True: esc sequences '\n', '\r', \t', '\xXX' in replacement will be recognized
+        @param wholeBuffer: True: the regular expression is applied to the whole buffer (lines joined by '\n')
+            in multiline mode: faster for large buffers and the pattern may span lines
         @return: the number of replaced lines/replacements depending on countHits
         '''
+        if wholeBuffer and not noRegExpr:
+            return self._replaceWholeBuffer(pattern, replacement, groupMarker, countHits, wordOnly, ignoreCase,
+                                            escActive)
         rc = 0
         verbose = self._logger._verboseLevel > base.Const.LEVEL_LOOP
         prefix = (self._filename + '-') if self._filename != None else ''
-        if noRegExpr:
-            for ix in range(len(self._lines)):
-                line = self._lines[ix]
-                if line.find(pattern) >= 0:
-                    hits = self._lines[ix].count(pattern) if countHits else 1
-                    rc += hits
-                    self._lines[ix] = self._lines[ix].replace(
-                        pattern, replacement)
-                    if verbose:
-                        line2 = base.StringUtils.limitLength2(line, 130)
-                        line3 = base.StringUtils.limitLength2(
-                            self._lines[ix], 130)
-                        self._logger.log(
-                            f'{prefix}{ix+1}: {hits} hit(s)\n{line2}\n{line3}')
-        else:
-            if wordOnly and not noRegExpr:
-                pattern = r'\b' + pattern + r'\b'
-            reWhat = re.compile(pattern, base.Const.IGNORE_CASE if ignoreCase else 0) if isinstance(
-                pattern, str) else pattern
-            if escActive:
-                replacement = base.StringUtils.unescChars(replacement)
-            repl = replacement if groupMarker is None else replacement.replace(
-                groupMarker, '\\')
-            for ix, line in enumerate(self._lines):
-                if reWhat.search(line):
-                    self._lines[ix], count = reWhat.subn(repl, line)
-                    hits = count if countHits else 1
-                    rc += hits
-                    if verbose:
-                        line2 = base.StringUtils.limitLength2(line, 130)
-                        line3 = base.StringUtils.limitLength2(
-                            self._lines[ix], 130)
-                        self._logger.log(
-                            f'{prefix}{ix+1}: {hits} hit(s)\n{line2}\n{line3}')
+        replacer = self._lineReplacer(pattern, replacement, groupMarker, noRegExpr, countHits,
+                                      wordOnly, ignoreCase, escActive)
+        for ix, line in enumerate(self._lines):
+            line3, hits = replacer(line)
+            if hits > 0:
+                self._lines[ix] = line3
+                rc += hits
+                if verbose:
+                    line2 = base.StringUtils.limitLength2(line, 130)
+                    line3 = base.StringUtils.limitLength2(line3, 130)
+                    self._logger.log(
+                        f'{prefix}{ix+1}: {hits} hit(s)\n{line2}\n{line3}')
         if rc > 0:
             self._hasChanged = True
             prefix = self._filename + ': ' if self._filename is not None else ''
-            self._logger.log(f'{prefix}{hits} hit(s)', base.Const.LEVEL_DETAIL)
+            self._logger.log(f'{prefix}{rc} hit(s)', base.Const.LEVEL_DETAIL)
+        return rc
+
+    def replaceFile(self, filename, pattern, replacement, groupMarker=None, noRegExpr=False, countHits=False,
+                    wordOnly=False, ignoreCase=False, escActive=False, backupExtension=None):
+        r'''Replaces all occurrences of a pattern in a file without holding the whole file in memory.
+        The file is read line by line and written to a temporary file in the same directory.
+        The temporary file replaces the original file (atomically) only if there are hits.
+        The internal buffer is not changed.
+        @param filename: the file to change
+        @param pattern: a regular expression of the string to search unless noRegExpr==True:
+        @param replacement: what will be replaced with this. May contain a placeholder for groups in what
+        @param groupMarker: None: no group placeholder otherwise: the prefix of a group placeholder
+        @param noRegExpr: True: pattern is a plain string, not a regular expression
+        @param countHits: False: the result is the number of changed lines True: the result is the number of replacements
+        @param wordOnly: True: only whole words will be found. Only relevant for regular expressions
+        @param ignoreCase: True: the search is not case sensitive
+        @param escActive: True: esc sequences '\n', '\r', \t', '\xXX' in replacement will be recognized
+        @param backupExtension: None or the rule of the backup name, see writeFile()
+        @return: the number of replaced lines/replacements depending on countHits
+        '''
+        self._filename = filename
+        rc = 0
+        if not os.path.exists(filename):
+            self._logger.error('{} does not exists'.format(filename))
+            return rc
+        verbose = self._logger._verboseLevel > base.Const.LEVEL_LOOP
+        replacer = self._lineReplacer(pattern, replacement, groupMarker, noRegExpr, countHits,
+                                      wordOnly, ignoreCase, escActive)
+        # a symbolic link is not replaced by a file: the link target is changed
+        target = os.path.realpath(filename)
+        handle, tempName = tempfile.mkstemp(prefix='.', suffix='.tmp', dir=os.path.dirname(target))
+        try:
+            with open(filename, 'r') as fpIn, os.fdopen(handle, 'w') as fpOut:
+                for ix, line in enumerate(fpIn):
+                    hasNewline = line.endswith('\n')
+                    if hasNewline:
+                        line = line[:-1]
+                    line3, hits = replacer(line)
+                    if hits > 0:
+                        rc += hits
+                        if verbose:
+                            line2 = base.StringUtils.limitLength2(line, 130)
+                            line4 = base.StringUtils.limitLength2(line3, 130)
+                            self._logger.log(f'{filename}-{ix+1}: {hits} hit(s)\n{line2}\n{line4}')
+                        line = line3
+                    fpOut.write(line + '\n' if hasNewline else line)
+            if rc > 0:
+                info = os.stat(target)
+                os.chmod(tempName, stat.S_IMODE(info.st_mode))
+                try:
+                    os.chown(tempName, info.st_uid, info.st_gid)
+                except PermissionError:
+                    pass
+                self._backup(filename, backupExtension)
+                os.replace(tempName, target)
+                self._hasChanged = True
+                self._logger.log(f'{filename}: {rc} hit(s)', base.Const.LEVEL_DETAIL)
+        finally:
+            if os.path.exists(tempName):
+                os.unlink(tempName)
         return rc
 
     def replaceMany(self, what, replacements):
         '''Replaces a list of strings with replacement.
+        All strings are searched in one pass per line (see base.StringUtils.regExprOfStrings()):
+        if more than one string matches at a position the longest wins.
+        A replacement is not searched again, empty strings are ignored.
+        If a string is given more than once the first replacement is taken.
         @param what: a list of strings to search
         @param replacements: a list of replacements
+        @return: the number of replacements
         '''
+        key = (tuple(what), tuple(replacements))
+        if self._replaceManyData is None or self._replaceManyData[0] != key:
+            table = {}
+            for ix, item in enumerate(what):
+                if item != '' and item not in table:
+                    table[item] = replacements[ix]
+            self._replaceManyData = (key, base.StringUtils.regExprOfStrings(table.keys()), table)
+        regExpr, table = self._replaceManyData[1:]
         allHits = 0
-        verbose = self._logger._verboseLevel >= base.Const.LEVEL_LOOP
-        prefix = (self._filename + '-') if self._filename != None else ''
-        for ix, line in enumerate(self._lines):
-            hits = 0
-            for ix2, item in enumerate(what):
-                hits2 = line.count(item)
-                if hits2 > 0:
-                    hits += hits2
-                    line = line.replace(item, replacements[ix2])
-            if hits > 0:
-                allHits += hits
-                if verbose:
-                    line2 = base.StringUtils.limitLength2(self._lines[ix], 130)
-                    line3 = base.StringUtils.limitLength2(line, 130)
-                    self._logger.log(
-                        f'{prefix}{ix+1}: {hits} hit(s)\n{line2}\n{line3}')
-                self._lines[ix] = line
+        if regExpr is not None:
+            def replacement(matcher):
+                return table[matcher.group(0)]
+            verbose = self._logger._verboseLevel >= base.Const.LEVEL_LOOP
+            prefix = (self._filename + '-') if self._filename != None else ''
+            for ix, line in enumerate(self._lines):
+                line, hits = regExpr.subn(replacement, line)
+                if hits > 0:
+                    allHits += hits
+                    if verbose:
+                        line2 = base.StringUtils.limitLength2(self._lines[ix], 130)
+                        line3 = base.StringUtils.limitLength2(line, 130)
+                        self._logger.log(
+                            f'{prefix}{ix+1}: {hits} hit(s)\n{line2}\n{line3}')
+                    self._lines[ix] = line
         if allHits > 0:
             self._hasChanged = True
             prefix = self._filename + ': ' if self._filename is not None else ''
@@ -246,6 +320,13 @@ class TextProcessor:
         position._line = len(self._lines)
         position._col = 0
 
+    def stopTrace(self):
+        '''Closes the trace file of executeRules().
+        '''
+        if self._fpTrace is not None:
+            self._fpTrace.close()
+            self._fpTrace = None
+
     def writeFile(self, filename=None, backupExtension=None):
         '''Writes the internal buffer to a file.
         @param filename: the file to write: if None _filename is taken
@@ -258,8 +339,15 @@ class TextProcessor:
             '%seconds%' replace with the seconds from epoche
         '''
         filename = self._filename if filename is None else filename
+        self._backup(filename, backupExtension)
+        base.StringUtils.toFile(filename, self._lines, '\n')
+
+    def _backup(self, filename, backupExtension):
+        '''Renames a file before it is overwritten.
+        @param filename: the file to save
+        @param backupExtension: None or the rule of the backup name, see writeFile()
+        '''
         if os.path.exists(filename) and backupExtension is not None:
-                
             if backupExtension.find('%') >= 0:
                 now = datetime.datetime.now()
                 backupExtension = backupExtension.replace(
@@ -274,7 +362,82 @@ class TextProcessor:
             parts['ext'] = backupExtension
             newNode = parts['fn'] + backupExtension
             base.FileHelper.deepRename(filename, newNode, deleteExisting=True)
-        base.StringUtils.toFile(filename, self._lines, '\n')
+
+    def _lineReplacer(self, pattern, replacement, groupMarker, noRegExpr, countHits, wordOnly, ignoreCase, escActive):
+        '''Returns a function replacing the pattern in one line. For the parameters see replace().
+        @return: a function with the signature replacer(line) returning a tuple (changedLine, hits)
+        '''
+        if noRegExpr:
+            def replacer(line):
+                if line.find(pattern) < 0:
+                    return line, 0
+                return line.replace(pattern, replacement), line.count(pattern) if countHits else 1
+        else:
+            if wordOnly:
+                pattern = r'\b' + pattern + r'\b'
+            reWhat = re.compile(pattern, base.Const.IGNORE_CASE if ignoreCase else 0) if isinstance(
+                pattern, str) else pattern
+            if escActive:
+                replacement = base.StringUtils.unescChars(replacement)
+            repl = replacement if groupMarker is None else replacement.replace(
+                groupMarker, '\\')
+            literal = base.StringUtils.requiredLiteral(reWhat.pattern, reWhat.flags)
+
+            def replacer(line):
+                if (literal is not None and literal not in line) or not reWhat.search(line):
+                    return line, 0
+                line, count = reWhat.subn(repl, line)
+                return line, count if countHits else 1
+        return replacer
+
+    def _replaceWholeBuffer(self, pattern, replacement, groupMarker, countHits, wordOnly, ignoreCase, escActive):
+        '''Replaces a regular expression in the whole buffer with one call of subn().
+        For the parameters see replace().
+        @return: the number of replaced lines (lines containing the start of a hit)/replacements depending on countHits
+        '''
+        if wordOnly:
+            pattern = r'\b' + pattern + r'\b'
+        if isinstance(pattern, str):
+            reWhat = re.compile(pattern, re.MULTILINE | (base.Const.IGNORE_CASE if ignoreCase else 0))
+        else:
+            reWhat = re.compile(pattern.pattern, pattern.flags | re.MULTILINE)
+        if escActive:
+            replacement = base.StringUtils.unescChars(replacement)
+        repl = replacement if groupMarker is None else replacement.replace(
+            groupMarker, '\\')
+        text = '\n'.join(self._lines)
+        literal = base.StringUtils.requiredLiteral(reWhat.pattern, reWhat.flags)
+        if literal is not None and literal not in text:
+            return 0
+        verbose = self._logger._verboseLevel > base.Const.LEVEL_LOOP
+        hitLines = None
+        if not countHits or verbose:
+            # line index -> number of hits starting in this line:
+            hitLines = {}
+            ixLine = 0
+            position = 0
+            for matcher in reWhat.finditer(text):
+                ixLine += text.count('\n', position, matcher.start())
+                position = matcher.start()
+                hitLines[ixLine] = hitLines.get(ixLine, 0) + 1
+            if not hitLines:
+                return 0
+        text2, rc = reWhat.subn(repl, text)
+        if rc == 0:
+            return 0
+        if verbose:
+            prefix = (self._filename + '-') if self._filename != None else ''
+            for ix, hits in hitLines.items():
+                line2 = base.StringUtils.limitLength2(self._lines[ix], 130)
+                self._logger.log(f'{prefix}{ix+1}: {hits} hit(s)\n{line2}')
+        if not countHits:
+            rc = len(hitLines)
+        self._lines = text2.split('\n')
+        self.setEndOfFile(self._endOfFile)
+        self._hasChanged = True
+        prefix = self._filename + ': ' if self._filename is not None else ''
+        self._logger.log(f'{prefix}{rc} hit(s)', base.Const.LEVEL_DETAIL)
+        return rc
 
 
 if __name__ == '__main__':
@@ -7,6 +7,7 @@ from unittest.UnitTestCase import UnitTestCase
 
 import shutil
 import os
+import re
 
 import app.BaseApp
 import app.TextApp
@@ -126,6 +127,51 @@ def''')
         application = app.BaseApp.BaseApp.lastInstance()
         self.assertIsEqual(0, application._logger._errors)
 
+    def testCsvExecuteStreaming(self):
+        if DEBUG:
+            return
+        fn = self.tempFile('test2.csv', 'csv')
+        base.StringUtils.toFile(fn, '''id,name
+1,jonny
+2,eve
+''')
+        app.TextApp.main(['-v3',
+                          'csv-execute', 'add-column:no,0,10,20 set-order:name,no write:,semicolon', fn, '--streaming'
+                          ])
+        application = app.BaseApp.BaseApp.lastInstance()
+        self.assertIsEqual(0, application._logger._errors)
+        self.assertIsEqual('name;no\r\njonny;10\r\neve;20\r\n', base.StringUtils.fromFile(fn))
+
+    def testCsvExecuteSort(self):
+        if DEBUG:
+            return
+        fn = self.tempFile('test3.csv', 'csv')
+        base.StringUtils.toFile(fn, '''id,name
+''' + ''.join('{},n{}\n'.format(ix * 7 % 100, ix) for ix in range(100)))
+        app.TextApp.main(['-v3',
+                          'csv-execute', 'sort:id,desc write:', fn, '--streaming', '--sort-memory=2k'
+                          ])
+        application = app.BaseApp.BaseApp.lastInstance()
+        self.assertIsEqual(0, application._logger._errors)
+        lines = base.StringUtils.fromFile(fn).split('\n')
+        self.assertIsEqual('id,name', lines[0].rstrip())
+        self.assertIsEqual('99,n57', lines[1].rstrip())
+        self.assertIsEqual('0,n0', lines[100].rstrip())
+
+    def testCsvExecuteDialect(self):
+        if DEBUG:
+            return
+        fn = self.tempFile('test4.csv', 'csv')
+        base.StringUtils.toFile(fn, '''b;2
+a;1
+''')
+        app.TextApp.main(['-v3',
+                          'csv-execute', 'sort:0 write:,comma', fn, '--dialect=semicolon', '--no-header'
+                          ])
+        application = app.BaseApp.BaseApp.lastInstance()
+        self.assertIsEqual(0, application._logger._errors)
+        self.assertIsEqual('a,1\r\nb,2\r\n', base.StringUtils.fromFile(fn))
+
     def testExecRules2(self):
         if DEBUG:
             return
@@ -157,6 +203,20 @@ def''')
         self.assertIsEqual(1, len(application._resultLines))
         self.assertMatches('test1.txt:xy123', application._resultLines[0])
 
+    def testGrepTextOnly(self):
+        if DEBUG:
+            return
+        fn = self.tempFile('text1.txt', 'grep2')
+        base.StringUtils.toFile(fn, 'abc\nxy123\n')
+        base.StringUtils.toFile(self.tempFile('binary1.txt', 'grep2'), b'xy123\x00\x01')
+        app.TextApp.main(['-v3',
+                          'grep', r'\d+', os.path.dirname(fn) + '/*.txt', '--text-only'
+                          ])
+        application = app.BaseApp.BaseApp.lastInstance()
+        self.assertIsEqual(0, application._logger._errors)
+        self.assertIsEqual(1, len(application._resultLines))
+        self.assertMatches('text1.txt:xy123', application._resultLines[0])
+
     def testGrepFormat(self):
         if DEBUG:
             return
@@ -174,6 +234,22 @@ def''')
                            application._resultLines[0])
         self.assertIsEqual('%\t2 123', application._resultLines[1])
 
+    def testGrepCompileFormat(self):
+        if DEBUG: return
+        segments = app.TextApp.TextApp.grepCompileFormat('%%%T%f-%#:%t%x%1%')
+        self.assertIsEqual([(app.TextApp.FORMAT_TEXT, '%\t'), (app.TextApp.FORMAT_FILENAME, 0),
+                            (app.TextApp.FORMAT_TEXT, '-'), (app.TextApp.FORMAT_LINE_NO, None),
+                            (app.TextApp.FORMAT_TEXT, ':'), (app.TextApp.FORMAT_LINE, None),
+                            (app.TextApp.FORMAT_GROUP, 1), (app.TextApp.FORMAT_TEXT, '%')], segments)
+        nameList = ['/etc/passwd', '/etc', 'passwd']
+        matcher = re.search(r'(\d+)', 'ab12')
+        expected = '%\t/etc/passwd-3:ab1212%'
+        self.assertIsEqual(expected, app.TextApp.TextApp.grepFormat('%%%T%f-%#:%t%x%1%', nameList, 'ab12', 3, matcher))
+        self.assertIsEqual(expected, app.TextApp.TextApp.grepFormat(segments, nameList, 'ab12', 3, matcher))
+        segments = app.TextApp.TextApp.grepFileFormat(segments, nameList)
+        self.assertIsEqual((app.TextApp.FORMAT_TEXT, '%\t/etc/passwd-'), segments[0])
+        self.assertIsEqual(expected, app.TextApp.TextApp.grepFormat(segments, nameList, 'ab12', 3, matcher))
+
     def testGrepIgnoreInvertLineNumber(self):
         if DEBUG:
             return
@@ -271,6 +347,77 @@ B._C.D''')
             self.assertIsEqual('1+2*', application._resultLines[2])
             self.assertIsEqual('2*4.99', application._resultLines[3])
 
+    def testGrepManyFiles(self):
+        if DEBUG: return
+        baseDir = self.tempDir('many', 'unittest.txt')
+        for ix in range(5):
+            base.StringUtils.toFile(os.path.join(baseDir, f'file{ix}.txt'), f'abc\nno {ix}\nxyz')
+        app.TextApp.main(['-v3',
+                          'grep', r'no \d', baseDir + os.sep + '*.txt', '-f%n:%t'
+                          ])
+        application = app.BaseApp.BaseApp.lastInstance()
+        self.assertIsEqual(0, application._logger._errors)
+        self.assertIsEqual(5, len(application._resultLines))
+        self.assertIsEqual(['file0.txt:no 0', 'file1.txt:no 1', 'file2.txt:no 2', 'file3.txt:no 3', 'file4.txt:no 4'],
+                           sorted(application._resultLines))
+
+    def testGrepJobs(self):
+        if DEBUG: return
+        baseDir = self.tempDir('jobs', 'unittest.txt')
+        for ix in range(20):
+            base.StringUtils.toFile(os.path.join(baseDir, f'file{ix}.txt'), f'abc\nno {ix}\nxyz\nno {ix}.2')
+        app.TextApp.main(['-v3',
+                          'grep', r'no \d', baseDir, '-f%n:%t'
+                          ])
+        application = app.BaseApp.BaseApp.lastInstance()
+        expected = application._resultLines
+        self.assertIsEqual(40, len(expected))
+        app.TextApp.main(['-v3',
+                          'grep', r'no \d', baseDir, '-f%n:%t', '--jobs=3'
+                          ])
+        application = app.BaseApp.BaseApp.lastInstance()
+        self.assertIsEqual(0, application._logger._errors)
+        self.assertIsEqual(expected, application._resultLines)
+
+    def testGrepMapped(self):
+        if DEBUG: return
+        fn = self.tempFile('mapped.txt', 'grep')
+        lines = []
+        for ix in range(1000):
+            lines.append(f'line {ix} öäü' if ix % 100 != 7 else f'hit {ix}: abc')
+        base.StringUtils.toFile(fn, '\n'.join(lines) + '\n')
+        regExpr = re.compile(r'\babc$')
+        options = app.TextApp.OptionsGrep()
+        options.formatLine = '%#:%t'
+        options.aboveContext = options.belowContext = 1
+        options.mappedMinSize = None
+        expected = app.TextApp.TextApp.grepLines(fn, regExpr, options)
+        self.assertIsEqual(30, len(expected))
+        options.mappedMinSize = 1
+        self.assertIsEqual(expected, app.TextApp.TextApp.grepLines(fn, regExpr, options))
+        self.assertIsEqual('7:line 6 öäü', expected[0])
+        self.assertIsEqual('8:hit 7: abc', expected[1])
+        # \b in a bytes pattern knows only ASCII word characters:
+        base.StringUtils.toFile(fn, 'é =x\n')
+        regExpr = re.compile(r'\b =')
+        options.aboveContext = options.belowContext = None
+        self.assertIsEqual(['1:é =x'], app.TextApp.TextApp.grepLines(fn, regExpr, options))
+
+    def testGrepBytesExpression(self):
+        if DEBUG: return
+        self.assertNotNone(app.TextApp.TextApp.grepBytesExpression(re.compile(r'^memory_limit\b')))
+        self.assertNotNone(app.TextApp.TextApp.grepBytesExpression(re.compile(r'(?:a|b)\.[0-9]')))
+        self.assertNone(app.TextApp.TextApp.grepBytesExpression(re.compile(r'a.c')))
+        self.assertNone(app.TextApp.TextApp.grepBytesExpression(re.compile(r'\d+')))
+        self.assertNone(app.TextApp.TextApp.grepBytesExpression(re.compile(r'[^a]')))
+        self.assertNone(app.TextApp.TextApp.grepBytesExpression(re.compile(r'(?i)abc')))
+        self.assertNone(app.TextApp.TextApp.grepBytesExpression(re.compile(r'abc', re.I)))
+        self.assertNone(app.TextApp.TextApp.grepBytesExpression(re.compile(r'äbc')))
+        self.assertIsEqual(b'^memory_limit', app.TextApp.TextApp.grepBytesExpression(
+            re.compile(r'^memory_limit\b')).pattern)
+        self.assertIsEqual(b'a[\\].b]c', app.TextApp.TextApp.grepBytesExpression(re.compile(r'a[\].b]c')).pattern)
+        self.assertNone(app.TextApp.TextApp.grepBytesExpression(re.compile(r'a[\b]c')))
+
     def testReplace(self):
         if DEBUG: return
         fn = self.tempFile('test1.txt', 'replace')
@@ -289,6 +436,22 @@ bla bla
 ''', fn)
         self.assertFileExists(fn.replace('.txt', '.bak'))
 
+    def testReplaceStreaming(self):
+        if DEBUG: return
+        fn = self.tempFile('test4.txt', 'replace')
+        base.StringUtils.toFile(fn, '''line 1
+version: 12.33
+bla bla''')
+        app.TextApp.main(['-v4',
+                          'replace', r'Version: (\d+\.\d+)', 'V%1', fn, '-i', '-b%', '--backup=.bak', '--streaming'
+                          ])
+        application = app.BaseApp.BaseApp.lastInstance()
+        self.assertIsEqual(0, application._logger._errors)
+        self.assertFileContent('''line 1
+V12.33
+bla bla''', fn)
+        self.assertFileExists(fn.replace('.txt', '.bak'))
+
     def testReplaceNotRegexpr(self):
         if DEBUG:
             return
@@ -311,6 +474,15 @@ bla bla
         self.assertIsEqual(0, application._logger._errors)
         self.assertIsEqual('3 dirs 12 files', application._resultText)
 
+    def testReplaceStringWholeBuffer(self):
+        if DEBUG: return
+        app.TextApp.main(['-v4',
+                          'replace-string', r'(\d+)\n', r'\1;', 'dirs: 3\nfiles: 12\nend', '-e', '--whole-buffer'
+                          ])
+        application = app.BaseApp.BaseApp.lastInstance()
+        self.assertIsEqual(0, application._logger._errors)
+        self.assertIsEqual('dirs: 3;files: 12;end', application._resultText)
+
     def testReplaceMany(self):
         if DEBUG: return
         fn = self.tempFile('test3.txt', 'replace')
@@ -3,6 +3,8 @@ Created on 12.04.2018
 
 @author: hm
 '''
+import io
+import os
 from unittest.UnitTestCase import UnitTestCase
 import base.StringUtils
 import base.CsvProcessor
@@ -37,17 +39,219 @@ class CsvProcessorTest(UnitTestCase):
         processor = base.CsvProcessor.CsvProcessor(self._logger)
         processor.readFile(self._fn)
         self.assertIsEqual('id;name;age', ';'.join(processor._colNames))
-        self.assertIsEqual(3, len(processor._rows))
-        self.assertIsEqual(3, len(processor._rows[0]))
-        self.assertIsEqual(3, len(processor._rows[1]))
-        self.assertIsEqual('1', processor._rows[0][0])
-        self.assertIsEqual('Jonny', processor._rows[0][1])
-        self.assertIsEqual('22', processor._rows[0][2])
+        self.assertIsEqual(3, processor._rowCount)
+        self.assertIsEqual(3, len(processor.row(0)))
+        self.assertIsEqual(3, len(processor.row(1)))
+        self.assertIsEqual('1', processor.row(0)[0])
+        self.assertIsEqual('Jonny', processor.row(0)[1])
+        self.assertIsEqual('22', processor.row(0)[2])
         self.assertIsEqual(3, processor._maxCols)
         self.assertIsEqual(3, processor._minCols)
         self.assertIsEqual(2, processor._rowMinCols)
         self.assertIsEqual(2, processor._rowMaxCols)
 
+    def testColumns(self):
+        if DEBUG: return
+        fn = self.tempFile('columns.csv', 'csvprocessor')
+        base.StringUtils.toFile(fn, '''id,name,price,code,age
+9,Eve,1.5,007,
+10,Adam,2.25,8,30
+100,Eve,10.0,9,4
+''')
+        processor = base.CsvProcessor.CsvProcessor(self._logger)
+        processor.readFile(fn)
+        processor.readFile(fn)
+        self.assertIsEqual(3, processor._rowCount)
+        self.assertIsEqual([int, str, float, int, int], processor._dataTypes)
+        self.assertIsEqual([False, False, False, False, True], processor._hasEmpty)
+        self.assertIsEqual('q', processor._columns[0].typecode)
+        self.assertIsEqual('d', processor._columns[2].typecode)
+        # '007' would be written as '7': the strings are kept
+        self.assertTrue(isinstance(processor._columns[3], list))
+        self.assertTrue(processor._columns[1][0] is processor._columns[1][2])
+        self.assertIsEqual([9, 10, 100], list(processor.column(0)))
+        self.assertIsEqual([7, 8, 9], processor.column(3))
+        self.assertIsEqual([30, 4], processor.column(4))
+        self.assertIsEqual(['10', 'Adam', '2.25', '8', '30'], processor.row(1))
+        self._logger.clear()
+        processor.setFilterIndexes([0, 4])
+        processor.info('min,max')
+        self.assertTrue(self._logger.contains('maximum: 100'))
+        self.assertTrue(self._logger.contains('minimum: 4'))
+        processor.setFilterIndexes([1])
+        processor.info('multiple')
+        self.assertTrue(self._logger.contains('Eve: 2'))
+        processor.writeFile(fn)
+        self.assertFileContent('''id,name,price,code,age
+9,Eve,1.5,007,
+10,Adam,2.25,8,30
+100,Eve,10.0,9,4
+''', fn)
+
+    def testColumnStatistic(self):
+        if DEBUG: return
+        statistic = base.CsvProcessor.ColumnStatistic(['b', 'ccc', 'a', 'b', 'ddd', 'b', 'a'], None, True)
+        self.assertIsEqual(4, statistic.distinct())
+        self.assertIsEqual('a', statistic.minimum())
+        self.assertIsEqual('ddd', statistic.maximum())
+        self.assertIsEqual('ccc', statistic.longest())
+        self.assertIsEqual([('a', 2), ('b', 3)], statistic.duplicates())
+        self.assertIsEqual(['a', 'b', 'ccc', 'ddd'], statistic.sortedValues(True))
+        statistic = base.CsvProcessor.ColumnStatistic([7, 12, 7], ['007', '12', '', '7'])
+        self.assertIsEqual(7, statistic.minimum())
+        self.assertIsEqual(12, statistic.maximum())
+        self.assertIsEqual('007', statistic.longest())
+        self.assertIsEqual(2, statistic.distinct())
+        self.assertIsEqual([(7, 2)], statistic.duplicates())
+        self.assertIsEqual([7, 7, 12], statistic.sortedValues(False))
+
+    def testInfoDistinct(self):
+        if DEBUG: return
+        processor = base.CsvProcessor.CsvProcessor(self._logger)
+        processor.readFile(self._fn)
+        self._logger.clear()
+        processor.setFilterIndexes([1, 2])
+        processor.info('distinct,min,max-length')
+        self.assertTrue(self._logger.contains('distinct: 2'))
+        self.assertTrue(self._logger.contains('distinct: 1'))
+        self.assertTrue(self._logger.contains('max-length: 5 "Jonny"'))
+        self.assertTrue(self._logger.contains('minimum: 22'))
+
+    def testSort(self):
+        if DEBUG: return
+        fn = self.tempFile('sort.csv', 'csvprocessor')
+        base.StringUtils.toFile(fn, '''name,no,code
+b,10,x
+a,9,
+c,10,7
+a,-1,abc
+d,1.5,10
+''')
+        processor = base.CsvProcessor.CsvProcessor(self._logger)
+        processor.readFile(fn)
+        processor.execute('sort:no,name write:')
+        self.assertFileContent('''name,no,code
+a,-1,abc
+d,1.5,10
+a,9,
+b,10,x
+c,10,7
+''', fn)
+        processor.execute('sort:2,desc write:')
+        self.assertFileContent('''name,no,code
+b,10,x
+a,-1,abc
+d,1.5,10
+c,10,7
+a,9,
+''', fn)
+        fn2 = self.tempFile('sort2.csv', 'csvprocessor')
+        # tiny memory budget: external sort with many runs
+        processor = base.CsvProcessor.CsvProcessor(self._logger, 300)
+        processor.executeStreaming(fn, 'sort:code,name write:' + fn2)
+        self.assertFileContent('''name,no,code
+a,9,
+c,10,7
+d,1.5,10
+a,-1,abc
+b,10,x
+''', fn2)
+        processor = base.CsvProcessor.CsvProcessor(self._logger)
+        self._logger.clear()
+        processor.readFile(fn)
+        processor.execute('sort:unknown')
+        self.assertTrue(self._logger.contains('sort: unknown column unknown', True))
+
+    def testSortStreamingAddColumn(self):
+        if DEBUG: return
+        self.buildData()
+        # the interpolated column contains numbers (not strings):
+        commands = 'add-column:new,1,5,2 sort:new write:{}'
+        fn2 = self.tempFile('sortadd1.csv', 'csvprocessor')
+        fn3 = self.tempFile('sortadd2.csv', 'csvprocessor')
+        processor = base.CsvProcessor.CsvProcessor(self._logger, 300)
+        self.assertTrue(processor.canStream(commands))
+        self.assertTrue(processor.executeStreaming(self._fn, commands.format(fn2)))
+        processor = base.CsvProcessor.CsvProcessor(self._logger)
+        processor.readFile(self._fn)
+        processor.execute(commands.format(fn3))
+        self.assertFileContent('''id,new,name,age
+3,-1,Eve,
+2,2,Eve,22
+1,5,Jonny,22
+''', fn2)
+        self.assertIsEqual(base.StringUtils.fromFile(fn3), base.StringUtils.fromFile(fn2))
+
+    def testBatchWriter(self):
+        if DEBUG: return
+        processor = base.CsvProcessor.CsvProcessor(self._logger)
+        processor.readFile(self._fn)
+        batches = [[('a', 1, 1.5, None), ('b"c', -2, 0.25, '')], [('x\ry', 3, 2.0, 'z')], [('n\nl', 4, 3.0, 'w')]]
+        for delimiter in (',', '\t', '::'):
+            fp = io.StringIO()
+            writer = base.CsvProcessor.BatchWriter(processor, fp, delimiter)
+            expected = ''
+            for batch in batches:
+                writer.write(batch)
+                for row in batch:
+                    expected += processor._formatRow(row, range(4), delimiter) + '\r\n'
+            self.assertIsEqual(expected, fp.getvalue())
+            self.assertIsEqual(1, writer._fastBatches)
+            self.assertIsEqual(2, writer._slowBatches)
+
+    def testDialectCache(self):
+        if DEBUG: return
+        fn1 = self.tempFile('layout1.csv', 'csvprocessor')
+        fn2 = self.tempFile('layout2.csv', 'csvprocessor')
+        base.StringUtils.toFile(fn1, 'id;name\n1;adam\n2;eve\n')
+        base.StringUtils.toFile(fn2, 'id;name\n3;bob\n')
+        processor1 = base.CsvProcessor.CsvProcessor(self._logger)
+        processor1.readFile(fn1)
+        processor2 = base.CsvProcessor.CsvProcessor(self._logger)
+        processor2.readFile(fn2)
+        self.assertTrue(processor1._dialect is processor2._dialect)
+        self.assertIsEqual(['id', 'name'], processor2._colNames)
+        self.assertIsEqual(['3', 'bob'], processor2.row(0))
+        key = (os.path.dirname(os.path.abspath(fn1)), 'id;name\n')
+        self.assertNotNone(base.CsvProcessor._dialects.get(key))
+
+    def testDialectCacheHeader(self):
+        if DEBUG: return
+        fn1 = self.tempFile('header1.csv', 'csvprocessor')
+        fn2 = self.tempFile('header2.csv', 'csvprocessor')
+        base.StringUtils.toFile(fn1, 'id;name\n1;adam\n2;eve\n')
+        base.StringUtils.toFile(fn2, 'id;name\nid;name\nfoo;bar\n')
+        processor1 = base.CsvProcessor.CsvProcessor(self._logger)
+        processor1.readFile(fn1)
+        processor2 = base.CsvProcessor.CsvProcessor(self._logger)
+        processor2.readFile(fn2)
+        self.assertTrue(processor1._dialect is processor2._dialect)
+        self.assertIsEqual(['id', 'name'], processor1._colNames)
+        self.assertNone(processor2._colNames)
+        self.assertIsEqual(3, processor2._rowCount)
+        self.assertIsEqual(['foo', 'bar'], processor2.row(2))
+        # a first line without delimiter is not a key:
+        fn3 = self.tempFile('header3.csv', 'csvprocessor')
+        base.StringUtils.toFile(fn3, 'id\n"a";"b"\n"c";"d"\n')
+        processor3 = base.CsvProcessor.CsvProcessor(self._logger)
+        processor3.readFile(fn3)
+        self.assertIsEqual(';', processor3._dialect.delimiter)
+        key = (os.path.dirname(os.path.abspath(fn3)), 'id\n')
+        self.assertNone(base.CsvProcessor._dialects.get(key))
+
+    def testSetLayout(self):
+        if DEBUG: return
+        fn = self.tempFile('layout3.csv', 'csvprocessor')
+        base.StringUtils.toFile(fn, '1;adam\n2;eve\n')
+        self.assertNone(base.CsvProcessor.CsvProcessor.dialectByName('nonsense'))
+        self.assertIsEqual('\t', base.CsvProcessor.CsvProcessor.dialectByName('excel-tab').delimiter)
+        processor = base.CsvProcessor.CsvProcessor(self._logger)
+        processor.setLayout(base.CsvProcessor.CsvProcessor.dialectByName('semicolon'), False)
+        processor.readFile(fn)
+        self.assertNone(processor._colNames)
+        self.assertIsEqual(2, processor._rowCount)
+        self.assertIsEqual(['2', 'eve'], processor.row(1))
+
     def testSetFilterIndexes(self):
         if DEBUG: return
         processor = base.CsvProcessor.CsvProcessor(self._logger)
@@ -130,6 +334,62 @@ write:,semicolon,.bak
 ;3;Eve
 ''', self._fn)
 
+    def testExecuteStreamingTwoWrites(self):
+        if DEBUG: return
+        self.buildData()
+        for commands in ('set-order:id write:{0} set-order:name write:{1}',
+                         'write:{0} add-column:x,0,7 write:{1}'):
+            names = [self.tempFile(node, 'csvprocessor') for node in ('b1.csv', 'b2.csv', 's1.csv', 's2.csv')]
+            processor = base.CsvProcessor.CsvProcessor(self._logger)
+            self.assertTrue(processor.canStream(commands))
+            processor.readFile(self._fn)
+            processor.execute(commands.format(names[0], names[1]))
+            processor = base.CsvProcessor.CsvProcessor(self._logger)
+            self.assertTrue(processor.executeStreaming(self._fn, commands.format(names[2], names[3])))
+            self.assertIsEqual(base.StringUtils.fromFile(names[0]), base.StringUtils.fromFile(names[2]))
+            self.assertIsEqual(base.StringUtils.fromFile(names[1]), base.StringUtils.fromFile(names[3]))
+        self.assertFileContent('''id,name,age
+1,Jonny,22
+2,Eve,22
+3,Eve,
+''', names[2])
+        self.assertFileContent('''x,id,name,age
+7,1,Jonny,22
+7,2,Eve,22
+7,3,Eve,
+''', names[3])
+
+    def testExecuteStreaming(self):
+        if DEBUG: return
+        self.buildData()
+        commands = 'set-filter:age info:summary add-column:No,1,33,44 set-order:a*,No,n*e write:{},semicolon'
+        processor = base.CsvProcessor.CsvProcessor(self._logger)
+        self.assertTrue(processor.canStream(commands))
+        self.assertFalse(processor.canStream('info:summary,max write:x.csv'))
+        self.assertFalse(processor.canStream('set-filter:age info:unique'))
+        fn2 = self.tempFile('batch.csv', 'csvprocessor')
+        processor.readFile(self._fn)
+        processor.execute(commands.format(fn2))
+        fn3 = self.tempFile('streaming.csv', 'csvprocessor')
+        processor = base.CsvProcessor.CsvProcessor(self._logger)
+        self.assertTrue(processor.executeStreaming(self._fn, commands.format(fn3)))
+        self.assertIsEqual(base.StringUtils.fromFile(fn2), base.StringUtils.fromFile(fn3))
+        self.assertFileContent('''age;No;name
+22;33;Jonny
+22;44;Eve
+;55;Eve
+''', fn3)
+        # writing the source file:
+        processor = base.CsvProcessor.CsvProcessor(self._logger)
+        processor.executeStreaming(self._fn, 'write:,tab,.bak')
+        self.assertIsEqual('id\tname\tage', base.StringUtils.fromFile(self._fn).split('\n')[0].rstrip())
+        self.assertFileContent('''id,name,age
+1,Jonny,22
+2,Eve,22
+3,Eve,
+''', self._fn.replace('.csv', '.bak'))
+        self.buildData()
+
     def testAddColumn(self):
         if DEBUG: return
         processor = base.CsvProcessor.CsvProcessor(self._logger)
@@ -0,0 +1,89 @@
+'''
+Created on 02.08.2020
+
+@author: hm
+'''
+import os
+import shutil
+from unittest.UnitTestCase import UnitTestCase
+import base.DirIndex
+import base.DirTraverser
+import base.FileHelper
+import base.StringUtils
+
+DEBUG = False
+
+class DirIndexTest(UnitTestCase):
+    def __init__(self):
+        UnitTestCase.__init__(self)
+        self._base = self.tempDir('unittest.dindex')
+        shutil.rmtree(self._base)
+        base.FileHelper.ensureDirectory(self._base)
+        base.FileHelper.createFileTree('''data1.txt|123
+tree1/
+tree1/file1.conf|blaBla
+tree2/
+tree2/file2.txt|Jonny
+tree2/sub/
+tree2/sub/file3.txt|charly7890
+''', self._base)
+        self._dbName = self.tempFile('dirindex.db')
+        if os.path.exists(self._dbName):
+            os.unlink(self._dbName)
+
+    def debugFlag(self):
+        base.StringUtils.avoidWarning(self)
+        return DEBUG
+
+    def _traverse(self, index, **kwargs):
+        traverser = base.DirTraverser.DirTraverser(self._base, index=index, **kwargs)
+        rc = {}
+        for name in traverser.next(self._base, 0):
+            rc[name] = traverser._statInfo.st_size if not traverser._isDir else -1
+        return rc
+
+    def testIndex(self):
+        if DEBUG: return
+        expected = self._traverse(None)
+        index = base.DirIndex.DirIndex(self._dbName)
+        self.assertIsEqual(expected, self._traverse(index))
+        self.assertIsEqual(0, index._hits)
+        self.assertIsEqual(4, index._misses)
+        self.assertIsEqual(expected, self._traverse(index))
+        self.assertIsEqual(4, index._hits)
+        index.close()
+        index = base.DirIndex.DirIndex(self._dbName)
+        self.assertIsEqual(expected, self._traverse(index, jobs=2))
+        self.assertIsEqual(4, index._hits)
+        self.assertIsEqual(0, index._misses)
+        index.close()
+
+    def testChangedDir(self):
+        if DEBUG: return
+        index = base.DirIndex.DirIndex(self._dbName)
+        self._traverse(index)
+        base.StringUtils.toFile(self._base + '/tree1/new.txt', 'abcd')
+        shutil.rmtree(self._base + '/tree2/sub')
+        files = self._traverse(index)
+        self.assertIsEqual(4, files[self._base + '/tree1/new.txt'])
+        self.assertFalse(self._base + '/tree2/sub/file3.txt' in files)
+        count = index._db.execute('SELECT count(*) FROM dirs').fetchone()[0]
+        self.assertIsEqual(3, count)
+        index.close()
+
+    def testRefresh(self):
+        if DEBUG: return
+        index = base.DirIndex.DirIndex(self._dbName)
+        self._traverse(index)
+        index.close()
+        index = base.DirIndex.DirIndex(self._dbName, refresh=True)
+        traverser = base.DirTraverser.DirTraverser(self._base, filePattern='*.txt', index=index)
+        traverser.asList()
+        self.assertIsEqual(0, index._hits)
+        self.assertIsEqual(traverser._countDirs, index._misses)
+        index.close()
+
+if __name__ == '__main__':
+    #import sys;sys.argv = ['', 'Test.testName']
+    tester = DirIndexTest()
+    tester.run()
@@ -195,6 +195,55 @@ link.x.conf|->tree2/x.conf
         self.assertFalse(files.find('tree1/file4.conf') >= 0)
         self.assertTrue(files.find('tree.txt/x.conf/depth2.txt') >= 0)
 
+    def testCounters(self):
+        if DEBUG: return
+        traverser = base.DirTraverser.DirTraverser(self._base, filePattern='*.txt', fileType='f')
+        files = traverser.asList()
+        self.assertIsEqual(4, len(files))
+        self.assertIsEqual(5, traverser._countDirs)
+        self.assertIsEqual(4, traverser._countFiles)
+        self.assertIsEqual(18, traverser._bytesFiles)
+        self.assertIsEqual(5, traverser._ignoredFiles)
+        self.assertIsEqual(0, traverser._ignoredDirs)
+
+    def testParallelOrdered(self):
+        if DEBUG: return
+        expected = base.DirTraverser.DirTraverser(self._base).asList()
+        traverser = base.DirTraverser.DirTraverser(self._base, jobs=4)
+        self.assertIsEqual(expected, traverser.asList())
+        self.assertIsEqual(5, traverser._countDirs)
+
+    def testParallelUnordered(self):
+        if DEBUG: return
+        expected = base.DirTraverser.DirTraverser(self._base, filePattern='*.txt').asList()
+        traverser = base.DirTraverser.DirTraverser(self._base, filePattern='*.txt', jobs=3, unordered=True)
+        self.assertIsEqual(sorted(expected), sorted(traverser.asList()))
+
+    def testParallelReadAhead(self):
+        if DEBUG: return
+        wide = self._base + os.sep + 'wide'
+        for ix in range(40):
+            base.FileHelper.ensureDirectory(wide + os.sep + 'd{:02d}'.format(ix) + os.sep + 'sub')
+        expected = base.DirTraverser.DirTraverser(wide).asList()
+        traverser = base.DirTraverser.DirTraverser(wide, jobs=2)
+        scan = traverser._scanDirectory
+        maxima = [0]
+
+        def scanDirectory(directory, depth):
+            maxima[0] = max(maxima[0], traverser._readAhead)
+            return scan(directory, depth)
+        traverser._scanDirectory = scanDirectory
+        current = traverser.asList()
+        shutil.rmtree(wide)
+        self.assertIsEqual(expected, current)
+        self.assertIsEqual(80, len(current))
+        self.assertTrue(maxima[0] <= 4 * 2)
+
+    def testParallelMaxYields(self):
+        if DEBUG: return
+        traverser = base.DirTraverser.DirTraverser(self._base, jobs=2, maxYields=3, fileType='f')
+        self.assertIsEqual(3, len(traverser.asList()))
+
 
 if __name__ == '__main__':
     # import sys;sys.argv = ['', 'Test.testName']
@@ -78,6 +78,38 @@ class FileHelperTest(UnitTestCase):
         self.assertIsEqual(5, len(info._youngest))
         self.assertIsEqual(5, len(info._largest))
 
+    def testTopList(self):
+        if DEBUG: return
+        largest = base.FileHelper.TopList(3)
+        smallest = base.FileHelper.TopList(2, True)
+        for key, name in ((5, 'a'), (1, 'b'), (9, 'c'), (5, 'd'), (7, 'e'), (0.5, 'f')):
+            largest.add(key, name)
+            smallest.add(key, name)
+        self.assertIsEqual([(9, 'c'), (7, 'e'), (5, 'd')], largest.items())
+        self.assertIsEqual([(0.5, 'f'), (1, 'b')], smallest.items())
+        self.assertFalse(largest.accepts(5))
+        self.assertTrue(largest.accepts(6))
+        self.assertIsEqual(3, len(largest))
+        self.assertFalse(base.FileHelper.TopList(0).add(1, 'x'))
+        largest.resize(2)
+        self.assertIsEqual([(9, 'c'), (7, 'e')], largest.items())
+        self.assertFalse(largest.accepts(6))
+
+    def testDirectoryInfoGivenInfo(self):
+        if DEBUG: return
+        source = self.tempDir('dirinfo', self._baseNode)
+        base.FileHelper.clearDirectory(source)
+        base.FileHelper.createFileTree('''a.txt|1
+b.txt|22
+c.txt|333
+d.txt|4444
+''', source)
+        info = base.FileHelper.directoryInfo(source)
+        self.assertIsEqual(4, len(info._largest))
+        info = base.FileHelper.directoryInfo(source, fileInfo=base.FileHelper.DirInfo(), maxLargest=2, maxSmallest=1)
+        self.assertIsEqual([(4, source + '/d.txt'), (3, source + '/c.txt')], info._largest.items())
+        self.assertIsEqual([(1, source + '/a.txt')], info._smallest.items())
+
     def testPathToNode(self):
         if DEBUG: return
         self.assertIsEqual('x__abc_def_x.txt', base.FileHelper.pathToNode('x:/abc/def/x.txt'))
@@ -276,6 +308,31 @@ class FileHelperTest(UnitTestCase):
         self.assertIsEqual('text', aClass)
         self.assertIsEqual('text', subClass)
 
+    def testHeaderClass(self):
+        if DEBUG: return
+        self.assertIsEqual(('text', 'text'), base.FileHelper.headerClass(b'abc\n\tdef\r\n'))
+        self.assertIsEqual(('text', 'text'), base.FileHelper.headerClass(b''))
+        # a single '\0' makes a binary file:
+        self.assertIsEqual(('binary', 'binary'), base.FileHelper.headerClass(b'abc\x00def' * 100))
+        self.assertIsEqual(('binary', 'binary'), base.FileHelper.headerClass(b'abc\x01\x02' * 10))
+        self.assertIsEqual(('text', 'shell'), base.FileHelper.headerClass(b'#!/bin/sh\necho'))
+        self.assertIsEqual(('text', 'xml'), base.FileHelper.headerClass(b'<html><body>'))
+        self.assertIsEqual(('container', 'zip'), base.FileHelper.headerClass(b'PK\x03\x04\x14\x00\x00\x00'))
+        self.assertIsEqual(('container', 'tar'), base.FileHelper.headerClass(
+            b'x.txt' + b'\x00' * 95 + b'0000644\x00' + b'0001750\x00' * 2))
+
+    def testFileClasses(self):
+        if DEBUG: return
+        text = self.tempFile('class.txt', self._baseNode)
+        binary = self.tempFile('class.bin', self._baseNode)
+        base.StringUtils.toFile(text, 'Hello\n')
+        base.StringUtils.toFile(binary, b'\x7fELF\x02\x01\x01\x00')
+        missing = text + '.missing'
+        filenames = [text, binary, missing] * 30
+        expected = [(text, ('text', 'text')), (binary, ('binary', 'binary')), (missing, ('unknown', 'unknown'))] * 30
+        self.assertIsEqual(expected, list(base.FileHelper.fileClasses(filenames, 3, 2, 7)))
+        self.assertIsEqual(expected, list(base.FileHelper.fileClasses(iter(filenames))))
+
     def testEnsureFileExists(self):
         if DEBUG: return
         fn = self.tempFile('should.exist.txt', self._baseNode)
@@ -332,6 +389,78 @@ class FileHelperTest(UnitTestCase):
         self.assertFileContains('Wow', target + '/dir1/wow.txt')
         self.assertFileContains('wow!', target + '/dir1/wow2.txt')
 
+    def testCopyDirectoryParallel(self):
+        if DEBUG: return
+        source = self.tempDir('srcpar', self._baseNode)
+        target = self.tempDir('trgpar', self._baseNode)
+        base.FileHelper.clearDirectory(source)
+        base.FileHelper.createFileTree('''big.data|{}
+sub/
+sub/a.txt|aaa
+sub/deeper/
+sub/deeper/b.txt|bbb|600|2020-04-05 11:22:33
+sub/link.txt|->a.txt
+'''.format('x' * 100000), source)
+        base.FileHelper.copyDirectory(source, target, 'clear', jobs=3, maxInFlight=10)
+        self.assertFileContains('x' * 100000, target + '/big.data')
+        self.assertFileContains('aaa', target + '/sub/a.txt')
+        self.assertFileContains('bbb', target + '/sub/deeper/b.txt')
+        self.assertIsEqual('a.txt', os.readlink(target + '/sub/link.txt'))
+        self.assertIsEqual(os.stat(source + '/sub/deeper/b.txt').st_mtime, os.stat(target + '/sub/deeper/b.txt').st_mtime)
+        self.assertIsEqual(0o600, os.stat(target + '/sub/deeper/b.txt').st_mode & 0o777)
+        self.assertIsEqual(os.stat(source + '/sub').st_mtime, os.stat(target + '/sub').st_mtime)
+
+    def testCopyDirectoryDelta(self):
+        if DEBUG: return
+        source = self.tempDir('srcdelta', self._baseNode)
+        target = self.tempDir('trgdelta', self._baseNode)
+        base.FileHelper.clearDirectory(source)
+        base.FileHelper.createFileTree('''image.data|{}
+same.txt|same
+sub/
+sub/shrink.txt|abcdef
+'''.format('x' * 300000), source)
+        base.FileHelper.copyDirectory(source, target, 'clear')
+        base.StringUtils.toFile(source + '/image.data', 'x' * 200000 + 'y' + 'x' * 99999)
+        base.StringUtils.toFile(source + '/sub/shrink.txt', 'abc')
+        # same size and modification time: not detected without checksum
+        base.StringUtils.toFile(target + '/same.txt', 'SAME')
+        base.FileHelper.setModified(source + '/same.txt', 1600000000)
+        base.FileHelper.setModified(target + '/same.txt', 1600000000)
+        base.FileHelper.copyDirectory(source, target, 'delta')
+        self.assertFileContains('x' * 200000 + 'y' + 'x' * 99999, target + '/image.data')
+        self.assertFileContains('abc', target + '/sub/shrink.txt')
+        self.assertIsEqual(3, os.path.getsize(target + '/sub/shrink.txt'))
+        self.assertFileContains('SAME', target + '/same.txt')
+        base.FileHelper.copyDirectory(source, target, 'delta', checksum=True)
+        self.assertFileContains('same', target + '/same.txt')
+
+    def testUpdateFileBlocks(self):
+        if DEBUG: return
+        source = self.tempFile('blocks.src', self._baseNode)
+        target = self.tempFile('blocks.trg', self._baseNode)
+        base.StringUtils.toFile(source, 'a' * 10000)
+        base.StringUtils.toFile(target, 'a' * 5000 + 'b' + 'a' * 6000)
+        self.assertIsEqual(1000, base.FileHelper.updateFileBlocks(source, target, 1000))
+        self.assertFileContains('a' * 10000, target)
+        self.assertIsEqual(10000, os.path.getsize(target))
+        self.assertIsEqual(0, base.FileHelper.updateFileBlocks(source, target, 1000))
+        base.StringUtils.toFile(source, 'a' * 10500)
+        self.assertIsEqual(500, base.FileHelper.updateFileBlocks(source, target, 1000))
+        self.assertIsEqual(10500, os.path.getsize(target))
+
+    def testCopyFileData(self):
+        if DEBUG: return
+        source = self.tempFile('copy.src', self._baseNode)
+        target = self.tempFile('copy.trg', self._baseNode)
+        base.StringUtils.toFile(source, 'abc' * 1000)
+        method = base.FileHelper.copyFileData(source, target)
+        self.assertTrue(method in ('copy_file_range', 'sendfile', 'buffered'))
+        self.assertFileContains('abc' * 1000, target)
+        base.StringUtils.toFile(source, '')
+        base.FileHelper.copyFileData(source, target)
+        self.assertIsEqual(0, os.path.getsize(target))
+
     def testUnpackTgz(self):
         if DEBUG: return
         target = self.tempDir(self._baseNode)
@@ -450,6 +579,42 @@ public/js:*:recursive
         self.assertFileContent('.name { width:3 }', baseTarget + '/public/js/global.js')
         self.assertDirExists(baseTarget + '/tmp/down')
 
+    def testCopyPlan(self):
+        if DEBUG: return
+        source = self.tempDir('srcplan', self._baseNode)
+        target = self.tempDir('trgplan', self._baseNode)
+        base.FileHelper.clearDirectory(source)
+        base.FileHelper.clearDirectory(target)
+        base.FileHelper.createFileTree('''a.txt|a-a
+b.txt|b
+sub/
+sub/c.txt|c
+''', source)
+        plan = base.FileHelper.CopyPlan()
+        plan.addRule(source + '/*.txt', target + '/x/*.txt', {}, 0)
+        plan.addRule(source + '/a.txt', target + '/x/a.txt', {'replace': '/-/+/'}, 0)
+        plan.addRule(source + '/*', target + '/x/*', {'dirsonly': None, 'recursive': None}, 0)
+        plan.add('mkdir', target + '/x/sub')
+        # source and source/sub:
+        self.assertIsEqual(2, len(plan._listings))
+        # conflict: the first operation wins:
+        plan.add('symlink', target + '/x/sub', None, 'a.txt')
+        self.assertIsEqual(['copy', 'copy', 'mkdir', 'mkdir', 'replace'], sorted([op[0] for op in plan._operations]))
+        plan.execute(2)
+        self.assertFileContent('a+a', target + '/x/a.txt')
+        self.assertFileContent('b', target + '/x/b.txt')
+        self.assertFileContent('c', target + '/x/sub/c.txt')
+
+    def testReplaceInFile(self):
+        if DEBUG: return
+        source = self.tempFile('replace.src', self._baseNode)
+        target = self.tempFile('replace.trg', self._baseNode)
+        base.StringUtils.toFile(source, 'abab\nxab')
+        self.assertIsEqual(3, base.FileHelper.replaceInFile(source, target, 'ab', 'X'))
+        self.assertFileContent('XX\nxX', target)
+        self.assertIsEqual(0, base.FileHelper.replaceInFile(source, target, 'no', 'X'))
+        self.assertFileContent('abab\nxab', target)
+
     def testEndOfLinkChain(self):
         if DEBUG: return
         end = self._baseDir + os.sep + 'end.txt'
@@ -6,6 +6,7 @@ Created on 12.04.2018
 from unittest.UnitTestCase import UnitTestCase
 import os
 import re
+import base.Const
 import base.StringUtils
 
 DEBUG = False
@@ -359,6 +360,36 @@ c=333
         rexpr = base.StringUtils.regExprCompile('(*.txt', 'test of wrong pattern')
         self.assertNone(rexpr)
 
+    def testRegExprOfStrings(self):
+        if DEBUG: return
+        regExpr = base.StringUtils.regExprOfStrings(['ab', 'abc', 'x.y', '', 'b'])
+        self.assertIsEqual(['abc', 'ab', 'b', 'x.y'], regExpr.findall('abcabbxxyx.y'))
+        self.assertNone(base.StringUtils.regExprOfStrings(['']))
+
+    def testRequiredLiteral(self):
+        if DEBUG: return
+        self.assertIsEqual('memory_limit', base.StringUtils.requiredLiteral(r'^\s*memory_limit\s*='))
+        self.assertIsEqual('a.b', base.StringUtils.requiredLiteral(r'a\.b[xyz]+c'))
+        self.assertIsEqual('cde', base.StringUtils.requiredLiteral(r'ab?cde'))
+        self.assertIsEqual('abc', base.StringUtils.requiredLiteral(r'abc+d'))
+        self.assertIsEqual('yy', base.StringUtils.requiredLiteral(r'x{0,3}yy'))
+        self.assertIsEqual('xy', base.StringUtils.requiredLiteral(r'(abc|def)xy'))
+        self.assertIsEqual('xy', base.StringUtils.requiredLiteral(r'.{2}xy'))
+        self.assertIsEqual('word', base.StringUtils.requiredLiteral(r'\bword\b'))
+        # escape sequences are not part of the literal:
+        self.assertIsEqual('bc', base.StringUtils.requiredLiteral(r'\x41bc'))
+        self.assertIsEqual('xyz', base.StringUtils.requiredLiteral(r'a\u00e4xyz'))
+        self.assertIsEqual('xyz', base.StringUtils.requiredLiteral(r'a\U000000e4xyz'))
+        self.assertIsEqual('xyz', base.StringUtils.requiredLiteral(r'\N{DIGIT ONE}xyz'))
+        self.assertIsEqual('abc', base.StringUtils.requiredLiteral(r'\012abc\0'))
+        self.assertIsEqual('bcd', base.StringUtils.requiredLiteral(r'(a)\1bcd'))
+        self.assertIsEqual('bcd', base.StringUtils.requiredLiteral(r'(a)\12bcd'))
+        self.assertNone(base.StringUtils.requiredLiteral(r'abc|def'))
+        self.assertNone(base.StringUtils.requiredLiteral(r'(?i)abc'))
+        self.assertNone(base.StringUtils.requiredLiteral(r'abc', base.Const.IGNORE_CASE))
+        self.assertNone(base.StringUtils.requiredLiteral(r'\d+'))
+        self.assertNone(base.StringUtils.requiredLiteral(r''))
+
     def testMinimizeArrayUtfError(self):
         if DEBUG: return
         list1 = [b'\xffabcdefghijklmnopqrstuvwxyz01234567890', b'abcdefghijklmnopqrstuvwxyz01234567890\xff']
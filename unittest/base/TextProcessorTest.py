@@ -3,8 +3,11 @@ Created on 12.04.2018
 
 @author: hm
 '''
+import os
 from unittest.UnitTestCase import UnitTestCase
 import base.TextProcessor
+import base.SearchRuleList
+import base.MemoryLogger
 
 DEBUG = False
 
@@ -64,6 +67,78 @@ intVar = 993
 strVar = "abc $strVar"
 ''', '\n'.join(processor._lines))
 
+    def testReplaceWholeBuffer(self):
+        if DEBUG: return
+        content = '''# simple example? complete example?
+[Test]
+intVar = 993
+strVar = "abc $strVar"
+'''
+        processor = base.TextProcessor.TextProcessor(self._logger)
+        processor.setContent(content)
+        self.assertIsEqual(1, processor.replace('strVar', 'stringVar', wholeBuffer=True))
+        self.assertIsEqual(content.replace('strVar', 'stringVar'), '\n'.join(processor._lines))
+        processor.setContent(content)
+        self.assertIsEqual(3, processor.replace('([a-z]+)Var', 'var_%1', '%', countHits=True, wholeBuffer=True))
+        self.assertIsEqual('''# simple example? complete example?
+[Test]
+var_int = 993
+var_str = "abc $var_str"
+''', '\n'.join(processor._lines))
+        processor.setContent(content)
+        self.assertIsEqual(2, processor.replace(r'^(\w+) =', r'\1:', wholeBuffer=True))
+        self.assertIsEqual(['# simple example? complete example?', '[Test]', 'intVar: 993', 'strVar: "abc $strVar"', ''],
+                           processor._lines)
+        processor.setContent(content)
+        self.assertIsEqual(1, processor.replace(r'\]\nint', '] int', wholeBuffer=True))
+        self.assertIsEqual(['# simple example? complete example?', '[Test] intVar = 993', 'strVar = "abc $strVar"', ''],
+                           processor._lines)
+        self.assertIsEqual(0, processor.replace('nothing', 'x', wholeBuffer=True))
+
+    def testReadFileMustContain(self):
+        if DEBUG: return
+        fn = self.tempFile('mustcontain.txt', 'unittest.tp')
+        base.StringUtils.toFile(fn, 'abc\nmemory_limit = 3\n')
+        processor = base.TextProcessor.TextProcessor(self._logger)
+        self.assertFalse(processor.readFile(fn, True, 'max_memory'))
+        self.assertIsEqual(0, len(processor._lines))
+        self.assertTrue(processor.readFile(fn, True, 'memory_limit'))
+        self.assertIsEqual(['abc', 'memory_limit = 3', ''], processor._lines)
+        self.assertIsEqual(1, processor.findLine(r'^\s*memory_limit\s*='))
+        self.assertIsEqual(-1, processor.findLine(r'^\s*max_memory\s*='))
+
+    def testReplaceFile(self):
+        if DEBUG: return
+        fn = self.tempFile('replacefile.txt', 'unittest.tp')
+        for node in os.listdir(os.path.dirname(fn)):
+            os.unlink(os.path.join(os.path.dirname(fn), node))
+        base.StringUtils.toFile(fn, 'abc\nmemory_limit = 3\nno newline: memory')
+        os.chmod(fn, 0o640)
+        processor = base.TextProcessor.TextProcessor(self._logger)
+        self.assertIsEqual(0, processor.replaceFile(fn, 'max_memory', 'x', backupExtension='.bak'))
+        self.assertFalse(os.path.exists(fn.replace('.txt', '.bak')))
+        self.assertFalse(processor._hasChanged)
+        self.assertIsEqual(2, processor.replaceFile(fn, r'memory(_limit)?', 'mem%1', '%', countHits=True,
+                                                    backupExtension='.bak'))
+        self.assertIsEqual('abc\nmem_limit = 3\nno newline: mem', base.StringUtils.fromFile(fn))
+        self.assertIsEqual('abc\nmemory_limit = 3\nno newline: memory', base.StringUtils.fromFile(fn.replace('.txt', '.bak')))
+        self.assertIsEqual(0o640, os.stat(fn).st_mode & 0o777)
+        self.assertTrue(processor._hasChanged)
+        self.assertIsEqual(2, processor.replaceFile(fn, 'mem', 'M', noRegExpr=True))
+        self.assertIsEqual('abc\nM_limit = 3\nno newline: M', base.StringUtils.fromFile(fn))
+        self.assertIsEqual(['replacefile.bak', 'replacefile.txt'], sorted(os.listdir(os.path.dirname(fn))))
+
+    def testReplaceMany(self):
+        if DEBUG: return
+        processor = base.TextProcessor.TextProcessor(self._logger)
+        processor.setContent('a cat and a catalog\nnothing\ndog: cat')
+        self.assertIsEqual(4, processor.replaceMany(['cat', 'catalog', 'dog', 'cat', ''], ['dog', 'book', 'cat', 'x', 'y']))
+        self.assertIsEqual(['a dog and a book', 'nothing', 'cat: dog'], processor._lines)
+        self.assertTrue(processor._hasChanged)
+        self.assertIsEqual(3, processor.replaceMany(['cat', 'catalog', 'dog', 'cat', ''], ['dog', 'book', 'cat', 'x', 'y']))
+        self.assertIsEqual(['a cat and a book', 'nothing', 'dog: cat'], processor._lines)
+        self.assertIsEqual(0, processor.replaceMany([''], ['y']))
+
     def testReplaceEscActive(self):
         #if DEBUG: return
         content = '''123<newline>äöüß
@@ -97,6 +172,30 @@ strVar = "abc $strVar"
         self.assertIsEqual(1, processor.cursor('line'))
         self.assertIsEqual(8, processor.cursor('col'))
 
+    def testRuleSearchChunks(self):
+        if DEBUG: return
+        processor = base.TextProcessor.TextProcessor(self._logger)
+        lines = ['line {}'.format(ix) for ix in range(1000)]
+        lines[700] = 'a Needle'
+        lines[300] = 'needle: b needle!'
+        lines[998] = 'needle'
+        processor.setContent('\n'.join(lines))
+        processor.executeRules(r'bof;>/needle$/i')
+        self.assertIsEqual(700, processor.cursor('line'))
+        self.assertIsEqual(2, processor.cursor('col'))
+        processor.executeRules(r'999:0;</needle/e')
+        self.assertIsEqual(998, processor.cursor('line'))
+        processor.executeRules(r'997:0;</needle/')
+        self.assertIsEqual(300, processor.cursor('line'))
+        self.assertIsEqual(10, processor.cursor('col'))
+        processor.executeRules(r'bof;>/(?<=: )b/')
+        self.assertIsEqual(300, processor.cursor('line'))
+        data = base.SearchRuleList.SearchData()
+        data.setData(r'needle\Z', '')
+        self.assertNone(data._bufferRegExpr)
+        data.setData(r'(?:a|b)+\d{2}', '')
+        self.assertNotNone(data._bufferRegExpr)
+
     def testRuleAnchors(self):
         if DEBUG: return
         processor = base.TextProcessor.TextProcessor(self._logger)
@@ -192,6 +291,54 @@ strVar = "abc $strVar"
         self.assertIsEqual('a3\nZ', '\n'.join(processor._lines))
         self.assertIsEqual('b\n12', processor._lastState.getRegister('Q'))
 
+    def testRuleCutLines(self):
+        if DEBUG: return
+        processor = base.TextProcessor.TextProcessor(self._logger)
+        processor._traceFile = self._trace
+
+        processor.setContent('ab\n1\n2\n3\nZ')
+        processor.executeRules(r'bof >/b/;mark-b;>/3/;cut-b-Q')
+        self.assertIsEqual('a\n3\nZ', '\n'.join(processor._lines))
+        self.assertIsEqual('b\n1\n2', processor._lastState.getRegister('Q'))
+        self.assertIsEqual(0, processor.cursor('line'))
+        self.assertIsEqual(1, processor.cursor('col'))
+
+        processor.setContent('ab\n1\n2\n3\nZ')
+        processor.executeRules(r'bof >/b/;mark-b;>/3/e;cut-b')
+        self.assertIsEqual('a\nZ', '\n'.join(processor._lines))
+
+        processor.setContent('ab\n1\n2\nZ')
+        processor.executeRules(r'bof mark-b;>/Z/;cut-b')
+        self.assertIsEqual('\nZ', '\n'.join(processor._lines))
+
+    def testProcessStateMarkers(self):
+        if DEBUG: return
+        lines = ['abc', 'def', 'ghi']
+        state = base.SearchRule.ProcessState(lines, base.SearchRule.Position(0, 0), base.SearchRule.Position(9, 0),
+                                             base.SearchRule.Position(1, 2), self._logger)
+        state.setMarker('a')
+        state._cursor._line = 2
+        state.setMarker('b')
+        state._cursor._col = 0
+        state.setMarker('c')
+        state._cursor.clone(base.SearchRule.Position(0, 1))
+        state.insertAtCursor('12\n3')
+        self.assertIsEqual(['a12', '3bc', 'def', 'ghi'], lines)
+        self.assertIsEqual('1:1', state._cursor.toString())
+        self.assertIsEqual('2:2', state.getMarker('a').toString())
+        self.assertIsEqual('3:2', state.getMarker('b').toString())
+        state._cursor.clone(base.SearchRule.Position(1, 3))
+        state.insertAtCursor('x')
+        self.assertIsEqual('3bcx', lines[1])
+        self.assertIsEqual('2:2', state.getMarker('a').toString())
+        # delete from 2:2 to 3:2:
+        state._cursor.clone(state.getMarker('b'))
+        state.deleteToMarker('a')
+        self.assertIsEqual(['a12', '3bcx', 'dei'], lines)
+        self.assertIsEqual('2:2', state._cursor.toString())
+        self.assertIsEqual('2:2', state.getMarker('b').toString())
+        self.assertIsEqual('2:2', state.getMarker('c').toString())
+
     def testRuleInsert(self):
         if DEBUG: return
         processor = base.TextProcessor.TextProcessor(self._logger)
@@ -271,6 +418,59 @@ strVar = "abc $strVar"
         self.assertIsEqual(0, processor.cursor('line'))
         self.assertIsEqual(1, processor.cursor('col'))
 
+    def testRuleProgram(self):
+        if DEBUG: return
+        processor = base.TextProcessor.TextProcessor(self._logger)
+        rules = r'bof;%loop%:;>/\d/;error:stop;replace:/\d/#/;success:%loop%'
+        processor.setContent('a1\nb2\nc3')
+        processor.executeRules(rules)
+        self.assertIsEqual('a#\nb#\nc#', '\n'.join(processor._lines))
+        ruleList = base.SearchRuleList.compiledRuleList(rules, self._logger)[0]
+        self.assertIsEqual(4, len(ruleList._program))
+        self.assertIsEqual(2, ruleList._program[3][2])
+        self.assertIsEqual(base.SearchRuleList.SearchRuleList.FLOW_STOP, ruleList._program[2][3])
+        processor.setContent('x\n4')
+        processor.executeRules(rules)
+        self.assertIsEqual('x\n#', '\n'.join(processor._lines))
+        self.assertTrue(ruleList is base.SearchRuleList.compiledRuleList(rules, self._logger)[0])
+        processor.setContent('y\n5')
+        processor.executeRules(ruleList)
+        self.assertIsEqual('y\n#', '\n'.join(processor._lines))
+        logger = base.MemoryLogger.MemoryLogger(1)
+        processor = base.TextProcessor.TextProcessor(logger)
+        processor.setContent('x\n4')
+        processor.executeRules('%loop%: jump:%loop%', 3)
+        self.assertIsEqual(1, logger._errors)
+        self.assertTrue(logger.contains('to many loops', True))
+
+    def testCompiledRuleListCache(self):
+        if DEBUG: return
+        first = base.SearchRuleList.compiledRuleList('bof;>/x/', self._logger)[0]
+        for ix in range(base.SearchRuleList.MAX_CACHED_RULE_LISTS - 1):
+            base.SearchRuleList.compiledRuleList('bof;+{}:0'.format(ix), self._logger)
+        self.assertTrue(first is base.SearchRuleList.compiledRuleList('bof;>/x/', self._logger)[0])
+        base.SearchRuleList.compiledRuleList('eof', self._logger)
+        # the least recently used entry is removed:
+        self.assertFalse('bof;+0:0' in base.SearchRuleList._compiledRuleLists)
+        self.assertTrue('bof;>/x/' in base.SearchRuleList._compiledRuleLists)
+        self.assertIsEqual(False, base.SearchRuleList.compiledRuleList('bof;wrong', base.MemoryLogger.MemoryLogger(1))[1])
+
+    def testRuleTrace(self):
+        if DEBUG: return
+        trace = self.tempFile('trace2.log', 'trace')
+        if os.path.exists(trace):
+            os.unlink(trace)
+        processor = base.TextProcessor.TextProcessor(self._logger)
+        processor._traceFile = trace
+        processor.setContent('a\nb')
+        processor.executeRules('bof;>/b/')
+        fp = processor._fpTrace
+        processor.executeRules('bof;>/a/')
+        self.assertTrue(fp is processor._fpTrace)
+        processor.stopTrace()
+        self.assertNone(processor._fpTrace)
+        self.assertIsEqual(2, base.StringUtils.fromFile(trace).count('= start'))
+
     def testFlowControlOnSuccess(self):
         if DEBUG: return
         processor = base.TextProcessor.TextProcessor(self._logger)